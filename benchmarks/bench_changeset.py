@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the marshalling cost of applying the same Changeset to many DNs,
+with and without reusing its compiled form.
+
+Only the Python side is measured: the time and memory allocated to produce
+the LDAPMod* array passed to ldap_modify.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    from wldap.changeset import Changeset
+    from wldap.wldap32_structures import LDAPMod
+
+
+def legacy_to_api_param(changeset):
+    # The implementation to_api_param had prior to Changeset.compile: a list
+    # rebuilt on each call, which ctypes then has to convert to an array.
+    mods = [LDAPMod.pointer(item) for item in changeset.changes] + [None]
+    return (LDAPMod.pointer * len(mods))(*mods)
+
+
+def compiled_to_api_param(changeset):
+    return changeset.compile()
+
+
+def allocated_per_call(fn, changeset, calls):
+    tracemalloc.start()
+    try:
+        snapshot = tracemalloc.take_snapshot()
+        results = [fn(changeset) for _ in range(calls)]
+        stats = tracemalloc.take_snapshot().compare_to(snapshot, 'filename')
+        del results
+    finally:
+        tracemalloc.stop()
+    return sum(stat.size_diff for stat in stats) / float(calls)
+
+
+def main(dns=100000, attributes=10, values=3, repeat=3):
+    changeset = Changeset()
+    for i in range(attributes):
+        changeset.replace('attribute%d' % i,
+                          ['value%d' % j for j in range(values)])
+
+    print('%d DNs, %d attributes, %d values' % (dns, attributes, values))
+    for name, fn in [('legacy', legacy_to_api_param),
+                     ('compiled', compiled_to_api_param)]:
+        best = min(timeit.repeat(lambda: fn(changeset), number=dns,
+                                 repeat=repeat))
+        line = '%-16s %.3fs (%.2fus/call)' % (name, best, best * 1e6 / dns)
+        if tracemalloc is not None:
+            # Results are kept alive, so that each call allocation shows up.
+            line += ' %8.1f bytes/call' % allocated_per_call(fn, changeset,
+                                                             1000)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
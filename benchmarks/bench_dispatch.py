@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the per-call overhead of the wldap32_dll dispatch.
+
+C runtime functions stand for the Wldap32 ones, so that this runs on any
+platform: the numbers account for the Python and ctypes sides of a call only.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    from wldap import wldap32_dll
+
+
+def load_libc():
+    if sys.platform == 'win32':
+        return ctypes.cdll.msvcrt
+    return ctypes.CDLL(ctypes.util.find_library('c'))
+
+
+def forwarding_wrapper(backend, api_name):
+    # The wrapper wldap32_dll.initialize used to define for each function.
+    def _wrapped(*args, **kwargs):
+        return getattr(backend, api_name)(*args, **kwargs)
+    return _wrapped
+
+
+def main(number=1000000, repeat=3):
+    libc = load_libc()
+    libc.labs.restype = ctypes.c_long
+    libc.labs.argtypes = [ctypes.c_long]
+
+    # getenv returning NULL stands for an ldap_next_* call reaching the end of
+    # the iteration, and a zero-argument function returning 0 (no Python error
+    # is set) for LdapGetLastError.
+    checked = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_char_p)(
+        ('getenv', libc))
+    checked.errcheck = wldap32_dll.errcheck_pointer
+    unchecked = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_char_p)(
+        ('getenv', libc))
+    last_error = ctypes.pythonapi.PyErr_Occurred
+    last_error.restype = ctypes.c_size_t
+    name = b'WLDAP_BENCH_UNDEFINED'
+
+    cases = [
+        ('wrapped call', forwarding_wrapper(libc, 'labs'), (-1,)),
+        ('direct call', libc.labs, (-1,)),
+        ('end, errcheck', checked, (name,)),
+        ('end, no errcheck', unchecked, (name,)),
+    ]
+    with mock.patch.object(wldap32_dll, 'LdapGetLastError', last_error):
+        for label, fn, args in cases:
+            best = min(timeit.repeat(lambda: fn(*args), number=number,
+                                     repeat=repeat))
+            print('%-18s %.3fs (%.3fus/call)' % (label, best,
+                                                 best * 1e6 / number))
+
+
+if __name__ == '__main__':
+    main()
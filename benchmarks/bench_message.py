@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare parse_message against the MessageIterator based implementation.
+
+The Wldap32 library is replaced by a fake one serving a synthetic result set,
+so the numbers only account for the Python side of the extraction.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    from wldap import wldap32_dll
+    from wldap.message import Message, parse_message
+
+
+class FakeWldap32(object):
+    """Serves `entries` entries of `attributes` attributes, each of them
+    holding `values` string values.
+    """
+
+    def __init__(self, entries, attributes, values):
+        self._entries = entries
+        self._names = ['attribute%d' % i for i in range(attributes)]
+        self._values = ['value%d' % i for i in range(values)] + [None]
+        self._position = 0
+
+    def ber_free(self, ber, fbuf):
+        pass
+
+    def ldap_count_entries(self, ldap, message):
+        return self._entries
+
+    def ldap_first_entry(self, ldap, message):
+        return 1
+
+    def ldap_next_entry(self, ldap, entry):
+        return entry + 1 if entry < self._entries else None
+
+    def ldap_first_attributeW(self, ldap, entry, p_ber):
+        self._position = 0
+        return self._names[0]
+
+    def ldap_next_attributeW(self, ldap, entry, ber):
+        self._position = self._position + 1
+        if self._position < len(self._names):
+            return self._names[self._position]
+        return None
+
+    def ldap_get_valuesW(self, ldap, entry, name):
+        return self._values
+
+    def ldap_value_freeW(self, values):
+        return 0
+
+    def ldap_msgfree(self, message):
+        return 0
+
+
+def legacy_parse_message(msg):
+    # The implementation parse_message had prior to _extract_entries.
+    return [{a.name: list(a.values) for a in entry} for entry in msg]
+
+
+def main(entries=20000, attributes=10, values=3, repeat=3):
+    fake = FakeWldap32(entries, attributes, values)
+    previous = wldap32_dll.use_backend(fake)
+    try:
+        message = Message(None, None)
+        assert legacy_parse_message(message) == parse_message(message)
+
+        print('%d entries, %d attributes, %d values' % (entries, attributes,
+                                                        values))
+        for name, fn in [('legacy', legacy_parse_message),
+                         ('parse_message', parse_message)]:
+            best = min(timeit.repeat(lambda: fn(message), number=1,
+                                     repeat=repeat))
+            print('%-16s %.3fs (%.2fus/entry)' % (name, best,
+                                                  best * 1e6 / entries))
+    finally:
+        wldap32_dll.use_backend(previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generate synthetic directories, shaped like an Active Directory domain.
+
+Users carry a few single-valued attributes, a large multivalued one
+(proxyAddresses) and a binary one (jpegPhoto). Group sizes follow a Zipf-like
+distribution: a handful of groups hold most users, as do "Domain Users" and
+the like, while the long tail only has a few members each.
+"""
+
+import random
+
+from wldap.memory import Directory
+
+
+BASE = 'dc=example,dc=com'
+PEOPLE = 'ou=people,' + BASE
+GROUPS = 'ou=groups,' + BASE
+
+
+def user_dn(index):
+    return 'cn=user%06d,%s' % (index, PEOPLE)
+
+
+def group_dn(index):
+    return 'cn=group%05d,%s' % (index, GROUPS)
+
+
+def group_sizes(users, groups, skew=1.0):
+    """Return the member count of each of `groups` groups, the i-th being
+    proportional to 1 / (i + 1) ** skew, the first one holding all `users`.
+    """
+    return [max(1, int(users / float(index + 1) ** skew))
+            for index in range(groups)]
+
+
+def generate(users=1000, groups=50, skew=1.0, addresses=20, photo_size=4096,
+             seed=0):
+    """Build a Directory of `users` users and `groups` groups.
+
+    Args:
+        users: the number of user entries
+        groups: the number of group entries
+        skew: the exponent of the group size distribution
+        addresses: the number of proxyAddresses values of each user
+        photo_size: the size in bytes of the jpegPhoto value of each user
+        seed: the seed of the random generator, so that identical arguments
+            produce identical directories
+
+    Returns a wldap.memory.Directory.
+    """
+    rng = random.Random(seed)
+    directory = Directory()
+    directory.add(BASE, [('objectClass', ['domain']), ('dc', ['example'])])
+    directory.add(PEOPLE, [('objectClass', ['organizationalUnit']),
+                           ('ou', ['people'])])
+    directory.add(GROUPS, [('objectClass', ['organizationalUnit']),
+                           ('ou', ['groups'])])
+
+    memberships = [[] for _ in range(users)]
+    for index, size in enumerate(group_sizes(users, groups, skew)):
+        members = sorted(rng.sample(range(users), size))
+        for member in members:
+            memberships[member].append(group_dn(index))
+        directory.add(group_dn(index), [
+            ('objectClass', ['group']), ('cn', ['group%05d' % index]),
+            ('member', [user_dn(member) for member in members])])
+
+    for index in range(users):
+        name = 'user%06d' % index
+        photo = bytearray(rng.getrandbits(8) for _ in range(photo_size))
+        attributes = [
+            ('objectClass', ['top', 'person', 'user']),
+            ('cn', [name]),
+            ('uid', [str(index)]),
+            ('mail', ['%s@example.com' % name]),
+            ('proxyAddresses', ['smtp:%s.%d@example.com' % (name, alias)
+                                for alias in range(addresses)]),
+            ('jpegPhoto', [bytes(photo)])]
+        if memberships[index]:
+            attributes.append(('memberOf', memberships[index]))
+        directory.add(user_dn(index), attributes)
+    return directory
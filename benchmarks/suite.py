@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the benchmark suite, and compare its results against a baseline.
+
+The benchmarks run against a wldap.memory.MemoryBackend serving a synthetic
+directory (see directory.py) without any modelled latency, so that they
+measure the Python side of wldap only: the search and parse paths, Changeset
+marshalling, Future polling and bulk writes.
+
+Memory benchmarks measure the memory held by the objects they build instead,
+relative to that of a reference object (such as the dictionaries of
+parse_message for a RecordSet).
+
+Results are written as JSON. Each timing is also stored relative to a pure
+Python calibration loop, whose runs are interleaved with those of the
+benchmark: the comparison against the baseline uses these relative timings,
+which cancels out most of the difference between machines and load.
+A benchmark regresses when its relative time exceeds the baseline one by more
+than the tolerance, in which case the exit status is 1:
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --save-baseline  # After a deliberate change
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import wldap
+from wldap import filter as filters
+from wldap import wldap32_dll
+from wldap.changeset import Changeset
+from wldap.memory import MemoryBackend
+from wldap.message import parse_binary_message, parse_message
+from wldap.message import parse_message_records
+from wldap.replica import Replica
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+
+import directory as generator
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BENCHMARKS = []
+
+
+def benchmark(fn):
+    """Register a benchmark: a function taking the Context and returning the
+    number of operations of a run, and the callable performing it.
+    """
+    BENCHMARKS.append(fn)
+    return fn
+
+
+def memory_benchmark(fn):
+    """Register a memory benchmark: a function taking the Context and
+    returning the number of entries built, the callable building the measured
+    object, and the callable building the reference object its size is
+    relative to.
+    """
+    fn.memory = True
+    return benchmark(fn)
+
+
+class Context(object):
+    """The session and directory shared by the benchmarks."""
+
+    def __init__(self, users, groups):
+        self.users = users
+        self.groups = groups
+        self.ldap = wldap.ldap('localhost')
+        self.messages = []
+
+    def search_s(self, base, attributes):
+        message = self.ldap.search_s(base, LDAP_SCOPE_ONELEVEL, None,
+                                     attributes, False)
+        self.messages.append(message)
+        return message
+
+    def release(self):
+        for message in self.messages:
+            message.release()
+        self.ldap.unbind()
+
+
+@benchmark
+def search(context):
+    def run():
+        context.ldap.search_s(generator.PEOPLE, LDAP_SCOPE_ONELEVEL,
+                              '(objectClass=person)', ['cn', 'mail'],
+                              False).release()
+    return context.users, run
+
+
+LOOKUP_ATTRIBUTES = ['cn', 'uid', 'mail', 'memberOf', 'objectClass',
+                     'proxyAddresses', 'telephoneNumber', 'title']
+
+
+@benchmark
+def lookup(context):
+    # Base lookups with a substituted filter, marshalled on every call.
+    dns = [generator.user_dn(i) for i in range(context.users)]
+
+    def run():
+        for idx, dn in enumerate(dns):
+            context.ldap.search_s(dn, LDAP_SCOPE_BASE,
+                                  '(uid=%s)' % filters.escape(str(idx)),
+                                  LOOKUP_ATTRIBUTES, False).release()
+    return context.users, run
+
+
+@benchmark
+def prepared_lookup(context):
+    dns = [generator.user_dn(i) for i in range(context.users)]
+    prepared = [context.ldap.prepare_search(dn, LDAP_SCOPE_BASE, '(uid={})',
+                                            LOOKUP_ATTRIBUTES, False)
+                for dn in dns]
+
+    def run():
+        for idx, search in enumerate(prepared):
+            search.search_s(idx).release()
+    return context.users, run
+
+
+@benchmark
+def parse_strings(context):
+    message = context.search_s(generator.PEOPLE,
+                               ['cn', 'uid', 'mail', 'proxyAddresses'])
+    return context.users, lambda: parse_message(message)
+
+
+@benchmark
+def parse_records(context):
+    message = context.search_s(generator.PEOPLE,
+                               ['cn', 'uid', 'mail', 'proxyAddresses'])
+    return context.users, lambda: parse_message_records(message)
+
+
+@memory_benchmark
+def records_memory(context):
+    # The memory held by a RecordSet, relative to the dictionaries of
+    # parse_message.
+    if tracemalloc is None:
+        return None
+    message = context.search_s(generator.PEOPLE, ['objectClass', 'cn', 'uid',
+                                                  'mail', 'memberOf'])
+    return (context.users, lambda: parse_message_records(message),
+            lambda: parse_message(message))
+
+
+@benchmark
+def parse_groups(context):
+    # Large multivalued attributes, skewed sizes.
+    message = context.search_s(generator.GROUPS, ['member'])
+    return context.groups, lambda: parse_message(message)
+
+
+@benchmark
+def parse_binary(context):
+    message = context.search_s(generator.PEOPLE, ['jpegPhoto'])
+    return context.users, lambda: parse_binary_message(message)
+
+
+@benchmark
+def parse_binary_views(context):
+    # Views need memoryview.toreadonly, as checked by wldap.message itself.
+    if not wldap.message._HAS_VIEWS:
+        return None
+    message = context.search_s(generator.PEOPLE, ['jpegPhoto'])
+    return context.users, lambda: parse_binary_message(message, views=True)
+
+
+@benchmark
+def filter_entries(context):
+    # Client-side evaluation of a compiled filter over parsed results.
+    entries = parse_message(context.search_s(
+        generator.PEOPLE, ['objectClass', 'cn', 'uid', 'mail']))
+    accept = filters.compile('(&(objectClass=person)(|(cn=user00*)'
+                             '(uid>=1500))(mail=*@example.com))')
+    return len(entries), lambda: [entry for entry in entries if accept(entry)]
+
+
+@benchmark
+def replica_query(context):
+    replica = Replica(indexes=['uid'])
+    replica.load(context.ldap, generator.PEOPLE, LDAP_SCOPE_ONELEVEL,
+                 attr=['objectClass', 'cn', 'uid', 'mail'])
+    queries = ['(uid=%d)' % idx for idx in range(0, context.users, 10)]
+
+    def run():
+        for query in queries:
+            replica.query(query)
+    return len(queries), run
+
+
+@benchmark
+def changeset_compile(context):
+    addresses = ['smtp:alias%d@example.com' % i for i in range(20)]
+    photo = b'\x00' * 4096
+
+    def run():
+        for _ in range(context.users):
+            changeset = Changeset()
+            changeset.replace('proxyAddresses', addresses)
+            changeset.replace('mail', ['user@example.com'])
+            changeset.replace_binary('jpegPhoto', [photo])
+            changeset.compile()
+    return context.users, run
+
+
+@benchmark
+def future_wait_all(context):
+    dns = [generator.user_dn(i) for i in range(context.users)]
+
+    def run():
+        futures = [context.ldap.search(dn, LDAP_SCOPE_BASE, None, ['cn'],
+                                       False) for dn in dns]
+        wldap.wait_all(futures)
+        for future in futures:
+            future.result().release()
+    return context.users, run
+
+
+@benchmark
+def bulk_modify(context):
+    changeset = Changeset()
+    changeset.replace('description', ['benchmarked'])
+    changes = [(generator.user_dn(i), changeset)
+               for i in range(context.users)]
+
+    def run():
+        report = context.ldap.bulk_modify(changes)
+        assert not report.failed
+    return context.users, run
+
+
+def calibrate():
+    # A fixed pure Python workload, standing for the speed of the machine.
+    table = {}
+    for i in range(50000):
+        table[str(i)] = i * 2
+    return sorted(table.items())
+
+
+def measure(fn, repeat):
+    """Return the best times of `fn` and of the calibration loop, over
+    `repeat` interleaved runs of each.
+    """
+    timings, calibrations = [], []
+    for _ in range(repeat):
+        calibrations.append(timeit.timeit(calibrate, number=1))
+        timings.append(timeit.timeit(fn, number=1))
+    return min(timings), min(calibrations)
+
+
+def retained(build):
+    """Return the number of bytes allocated by `build` and still held by its
+    result.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def run(users, groups, repeat, only=None):
+    """Run the benchmarks, or those named in `only`, and return the results
+    as a JSON serializable dictionary.
+    """
+    directory = generator.generate(users, groups)
+    previous = wldap32_dll.use_backend(MemoryBackend(directory))
+    try:
+        context = Context(users, groups)
+        results = {}
+        try:
+            for fn in BENCHMARKS:
+                if only and fn.__name__ not in only:
+                    continue
+                prepared = fn(context)
+                if prepared is None:  # Not supported on this platform
+                    continue
+                if getattr(fn, 'memory', False):
+                    operations, build, reference = prepared
+                    # A first run makes sure that nothing cached along the
+                    # way (such as by the backend) is accounted for.
+                    build(), reference()
+                    size, reference_size = retained(build), retained(reference)
+                    results[fn.__name__] = {
+                        'bytes': size,
+                        'reference_bytes': reference_size,
+                        'operations': operations,
+                        'bytes_per_operation': size / operations,
+                        'relative': float(size) / reference_size,
+                    }
+                    continue
+                operations, callable_ = prepared
+                best, calibration = measure(callable_, repeat)
+                results[fn.__name__] = {
+                    'seconds': best,
+                    'calibration': calibration,
+                    'operations': operations,
+                    'us_per_operation': best * 1e6 / operations,
+                    'relative': best / calibration,
+                }
+        finally:
+            context.release()
+    finally:
+        wldap32_dll.use_backend(previous)
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'parameters': {'users': users, 'groups': groups},
+        'benchmarks': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of (name, ratio, regressed) comparisons of the
+    benchmarks both in `results` and `baseline`.
+    """
+    comparisons = []
+    for name, current in sorted(results['benchmarks'].items()):
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            continue
+        ratio = current['relative'] / reference['relative']
+        comparisons.append((name, ratio, ratio > 1 + tolerance))
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=9)
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        help='run the named benchmarks only')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='the baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='the allowed slowdown over the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.users, args.groups, args.repeat, args.only)
+    for name, result in sorted(results['benchmarks'].items()):
+        if 'bytes' in result:
+            print('%-20s %.2fMB (%dB/op, %.2fx the reference)' % (
+                name, result['bytes'] / 1e6, result['bytes_per_operation'],
+                result['relative']))
+        else:
+            print('%-20s %.3fs (%.2fus/op)' % (name, result['seconds'],
+                                               result['us_per_operation']))
+    for path in filter(None, [args.output,
+                              args.save_baseline and args.baseline]):
+        with open(path, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+            output.write('\n')
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    if baseline['parameters'] != results['parameters']:
+        print('Baseline parameters %r differ, not comparing' %
+              baseline['parameters'])
+        return 0
+
+    regressions = 0
+    print('\nAgainst %s (tolerance %d%%):' % (args.baseline,
+                                              args.tolerance * 100))
+    for name, ratio, regressed in compare(results, baseline, args.tolerance):
+        regressions += regressed
+        print('%-20s %5.2fx%s' % (name, ratio,
+                                  '  REGRESSION' if regressed else ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
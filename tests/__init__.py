@@ -12,9 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from tests.test_aio import *
+from tests.test_ber import *
+from tests.test_bulk import *
+from tests.test_cache import *
 from tests.test_changeset import *
+from tests.test_decoders import *
+from tests.test_dispatcher import *
+from tests.test_dn import *
+from tests.test_filter import *
 from tests.test_future import *
 from tests.test_ldap import *
+from tests.test_memory import *
 from tests.test_message import *
+from tests.test_pool import *
+from tests.test_protocol import *
+from tests.test_records import *
+from tests.test_replica import *
+from tests.test_search import *
+from tests.test_sync import *
+from tests.test_wire import *
 from tests.test_wldap32_dll import *
 from tests.test_wldap32_structures import *
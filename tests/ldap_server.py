@@ -0,0 +1,82 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process LDAP server, standing in for a directory in the tests of the
+pure Python backends. It serves a wldap.memory.Directory, and records the
+requests it receives for inspection by the tests.
+"""
+
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from wldap import protocol
+from wldap.memory import Directory
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        buf = bytearray()
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            buf.extend(data)
+            offset = 0
+            while True:
+                message, offset = protocol.decode_message(buf, offset)
+                if message is None:
+                    break
+                if isinstance(message.op, protocol.UnbindRequest):
+                    return
+                self.server.requests.append(message.op)
+                responses = self.server.directory.process_message(message)
+                self.request.sendall(b''.join(
+                    protocol.encode_message(response.msgid, response.op,
+                                            response.controls)
+                    for response in responses))
+            del buf[:offset]
+
+
+class LdapServer(socketserver.ThreadingTCPServer):
+    """LDAP server listening on an ephemeral localhost port, and serving
+    each connection from its own thread.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, directory=None):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 _Handler)
+        self.directory = directory if directory is not None else Directory()
+        self.port = self.server_address[1]
+        self.requests = []
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
@@ -0,0 +1,73 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import gc
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    from wldap import wldap32_dll
+
+
+def patch_dll(target):
+    """Decorator swapping the Wldap32 library for a MagicMock through
+    wldap32_dll.use_backend, for the duration of a test function (or of every
+    test method of a class).
+
+    As with mock.patch, the mock is passed as an extra positional argument,
+    after those of the decorators applied before this one.
+    """
+    if isinstance(target, type):
+        for name in dir(target):
+            if name.startswith('test'):
+                setattr(target, name, patch_dll(getattr(target, name)))
+        return target
+
+    @functools.wraps(target)
+    def _patched(*args, **kwargs):
+        backend = mock.MagicMock()
+        previous = wldap32_dll.use_backend(backend)
+        try:
+            return target(*(args + (backend,)), **kwargs)
+        finally:
+            wldap32_dll.use_backend(previous)
+    return _patched
+
+
+def use_backend(test, backend):
+    """Swap the Wldap32 library for `backend` through wldap32_dll.use_backend,
+    until the cleanup of `test` (a unittest.TestCase).
+
+    Returns `backend`.
+    """
+    # Free what other tests left in reference cycles while their mocks are
+    # still in place, rather than into `backend`.
+    gc.collect()
+    previous = wldap32_dll.use_backend(backend)
+
+    def _restore():
+        # Likewise, free the messages left in reference cycles while
+        # `backend` is still in use, rather than later into the library of
+        # other tests.
+        gc.collect()
+        wldap32_dll.use_backend(previous)
+    test.addCleanup(_restore)
+    return backend
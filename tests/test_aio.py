@@ -0,0 +1,201 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ctypes import addressof
+import socket
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    try:
+        import asyncio
+        from wldap.aio import AsyncLdap
+    except ImportError:  # pragma: no cover
+        asyncio = None
+
+from wldap.dispatcher import ResultDispatcher
+from wldap.future import Future
+from wldap.wldap32_structures import LDAPMessage
+from tests.mock_dll import patch_dll
+
+
+class FakeSession(object):
+    """Stands for a wldap.ldap session which responses are signaled through a
+    socket pair: each byte written to the socket completes an operation.
+    """
+
+    def __init__(self):
+        self._dispatcher = None
+        self._l = None
+        self.reader, self.writer = socket.socketpair()
+        self.completed = []
+        self.abandon = mock.Mock()
+        self.msgid = 0
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+    def complete(self, msgid):
+        self.completed.append(msgid)
+        self.writer.send(b'x')
+
+    def enable_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = ResultDispatcher(self)
+        return self._dispatcher
+
+    def setup(self, dll):
+        # ldap_result returns a distinct LDAPMessage for each completed msgid
+        # in turn, and raises for negative ones.
+        messages = {}
+
+        def result(l, msgid, all_, timeout, p_res):
+            # Consume the notification the same way Wldap32 consumes
+            # responses.
+            try:
+                self.reader.recv(1)
+            except socket.error:
+                pass
+            if not self.completed:
+                return 0
+            msgid = self.completed.pop(0)
+            if msgid < 0:
+                raise ValueError('test')
+            message = LDAPMessage()
+            messages[addressof(message)] = (msgid, message)
+            p_res._obj.contents = message
+            return 1
+
+        fd = self.reader.fileno()
+        dll.ldap_get_option.side_effect = \
+            lambda l, opt, p_sock: setattr(p_sock._obj, 'value', fd)
+        dll.ldap_result.side_effect = result
+        dll.ldap_msgid.side_effect = \
+            lambda res: messages[addressof(res.contents)][0]
+
+    def _future(self):
+        self.msgid = self.msgid + 1
+        return Future(self, self.msgid, self._dispatcher)
+
+    def delete(self, dn):
+        return self._future()
+
+    def search(self, base, scope, filt, attr, attronly):
+        return self._future()
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+@patch_dll
+class TestAsyncLdap(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = FakeSession()
+        self.session.reader.setblocking(False)
+
+    def tearDown(self):
+        self.loop.close()
+        self.session.close()
+
+    def test_result(self, dll):
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        first = aldap.delete('dn')
+        second = aldap.search('base', 0, 'filt', [], 0)
+        self.loop.call_later(0.01, self.session.complete, 2)
+        self.loop.call_later(0.02, self.session.complete, 1)
+
+        done = self.loop.run_until_complete(asyncio.wait_for(second, 1))
+        self.assertEqual(dll.ldap_msgid(done._message), 2)
+        self.assertFalse(first.done())
+        done = self.loop.run_until_complete(first)
+        self.assertEqual(dll.ldap_msgid(done._message), 1)
+        self.assertEqual(dll.ldap_get_option.call_count, 1)
+        self.assertEqual(aldap._fd, None)
+
+    def test_single_poll(self, dll):
+        # A readable event is a single ldap_result call per received result,
+        # whatever the number of outstanding operations.
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        futures = [aldap.delete('dn') for _ in range(10)]
+        self.loop.run_until_complete(asyncio.sleep(0))
+        dll.ldap_result.reset_mock()
+        self.session.complete(3)
+        self.loop.run_until_complete(futures[2])
+        self.assertEqual(dll.ldap_result.call_count, 2)
+        self.assertEqual(sum(future.done() for future in futures), 1)
+        aldap.close()
+
+    def test_timeout(self, dll):
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        future = aldap.delete('dn')
+        self.assertRaises(asyncio.TimeoutError, self.loop.run_until_complete,
+                          asyncio.wait_for(future, 0.01))
+        self.session.abandon.assert_called_once_with(1)
+        self.assertEqual(aldap._dispatcher._futures, {})
+
+        # The asyncio future is cancelled before its result is received and
+        # before _on_cancelled is called.
+        future = aldap.delete('dn')
+        future.cancel()
+        self.session.complete(2)
+        aldap._on_readable()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertTrue(future.cancelled())
+        self.assertEqual(aldap._fd, None)
+
+    def test_exception(self, dll):
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        self.session.msgid = -2
+        future = aldap.delete('dn')
+        self.session.complete(-1)
+        self.assertRaises(ValueError, self.loop.run_until_complete, future)
+
+    def test_cancel(self, dll):
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        future = aldap.delete('dn')
+        future.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.session.abandon.assert_called_once_with(1)
+        self.assertEqual(aldap._fd, None)
+        self.assertEqual(aldap._dispatcher._futures, {})
+
+    def test_close(self, dll):
+        self.session.setup(dll)
+        aldap = AsyncLdap(self.session, self.loop)
+
+        future = aldap.delete('dn')
+        aldap.close()
+        self.assertTrue(future.cancelled())
+        self.session.abandon.assert_called_once_with(1)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(self.session.abandon.call_count, 1)
+        self.assertEqual(aldap._dispatcher._futures, {})
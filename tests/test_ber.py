@@ -0,0 +1,81 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from wldap import ber
+
+
+class TestBer(unittest.TestCase):
+
+    def decode_integer(self, data):
+        data = bytearray(data)
+        tag, start, end = ber.decode(data)
+        self.assertEqual(tag, ber.INTEGER)
+        return ber.decode_integer(data, start, end)
+
+    def test_encode_length(self):
+        self.assertEqual(ber.encode_length(0x7f), b'\x7f')
+        self.assertEqual(ber.encode_length(0x80), b'\x81\x80')
+        self.assertEqual(ber.encode_length(0x1234), b'\x82\x12\x34')
+
+    def test_integer(self):
+        cases = [(0, b'\x02\x01\x00'), (127, b'\x02\x01\x7f'),
+                 (128, b'\x02\x02\x00\x80'), (256, b'\x02\x02\x01\x00'),
+                 (-1, b'\x02\x01\xff'), (-128, b'\x02\x01\x80'),
+                 (-129, b'\x02\x02\xff\x7f')]
+        for value, encoded in cases:
+            self.assertEqual(ber.encode_integer(value), encoded)
+            self.assertEqual(self.decode_integer(encoded), value)
+
+    def test_boolean(self):
+        self.assertEqual(ber.encode_boolean(True), b'\x01\x01\xff')
+        self.assertEqual(ber.encode_boolean(False), b'\x01\x01\x00')
+        self.assertTrue(ber.decode_boolean(bytearray(b'\x01'), 0, 1))
+
+    def test_octet_string(self):
+        self.assertEqual(ber.encode_octet_string(b'\x00\xff'),
+                         b'\x04\x02\x00\xff')
+        encoded = ber.encode_octet_string(u'\xe9t\xe9')
+        self.assertEqual(encoded, b'\x04\x05\xc3\xa9t\xc3\xa9')
+        data = bytearray(encoded)
+        self.assertEqual(ber.decode_string(data, 2, 7), u'\xe9t\xe9')
+
+    def test_long_content(self):
+        data = bytearray(ber.encode_octet_string(b'x' * 300))
+        self.assertEqual(ber.decode(data), (ber.OCTET_STRING, 4, 304))
+
+    def test_sequence(self):
+        encoded = ber.encode_sequence([ber.encode_integer(1),
+                                       ber.encode_octet_string(b'a')])
+        self.assertEqual(encoded, b'\x30\x06\x02\x01\x01\x04\x01a')
+        data = bytearray(encoded)
+        tag, start, end = ber.decode(data)
+        self.assertEqual(tag, ber.SEQUENCE)
+        self.assertEqual(ber.decode_elements(data, start, end),
+                         [(ber.INTEGER, 4, 5), (ber.OCTET_STRING, 7, 8)])
+
+    def test_decode_header_incomplete(self):
+        encoded = ber.encode_octet_string(b'x' * 300)
+        for size in (0, 1, 3, 100):
+            self.assertEqual(ber.decode_header(bytearray(encoded[:size])),
+                             None)
+        self.assertRaises(ValueError, ber.decode, bytearray(encoded[:100]))
+
+    def test_decode_malformed(self):
+        self.assertRaises(ValueError, ber.decode, bytearray(b'\x1f\x01\x00'))
+        self.assertRaises(ValueError, ber.decode, bytearray(b'\x30\x80'))
+        # The inner element overflows its container.
+        data = bytearray(b'\x30\x03\x04\x02ab')
+        self.assertRaises(ValueError, ber.decode_elements, data, 2, 5)
@@ -0,0 +1,171 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap.bulk import run_bulk
+from wldap.exceptions import LdapError
+from wldap.wldap32_constants import LDAP_NO_SUCH_OBJECT, LDAP_SUCCESS
+from tests.mock_dll import patch_dll
+
+
+class FakeFuture(object):
+    """A Future which completes once waited on, with `code` as the result code
+    of its message.
+    """
+
+    _dispatcher = None
+    _exception = None
+
+    def __init__(self, server, dn, code):
+        self._completed = False
+        self._message = mock.Mock(_message=code)
+        self._server = server
+        self.dn = dn
+
+    def _get_result(self, timeout_seconds=None, raise_timeout=True):
+        self._completed = True
+        self._server.completed.append(self.dn)
+        self._server.in_flight = self._server.in_flight - 1
+
+    def _has_result_or_exc(self):
+        return self._completed
+
+    def cancelled(self):
+        return False
+
+    def done(self):
+        return self._completed
+
+    def result(self, timeout_seconds=None):
+        return self._message
+
+
+class FakeServer(object):
+
+    def __init__(self, failures=()):
+        self.completed = []
+        self.failures = failures
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submitted = []
+
+    def submit(self, dn, argument):
+        self.submitted.append((dn, argument))
+        self.in_flight = self.in_flight + 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        code = LDAP_NO_SUCH_OBJECT if dn in self.failures else LDAP_SUCCESS
+        return FakeFuture(self, dn, code)
+
+
+@patch_dll
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.ldap = mock.Mock()
+
+    def setup_dll(self, dll):
+        dll.ldap_result2error.side_effect = lambda l, code, free: code
+
+    def test_window(self, dll):
+        self.setup_dll(dll)
+        server = FakeServer()
+        ops = [('cn=%d' % i, i) for i in range(20)]
+        report = run_bulk(self.ldap, ops, server.submit, 4)
+        self.assertEqual(server.max_in_flight, 4)
+        self.assertEqual(len(report), 20)
+        self.assertEqual(report.succeeded, 20)
+        self.assertEqual([o.index for o in report], list(range(20)))
+
+    def test_same_dn_ordering(self, dll):
+        self.setup_dll(dll)
+        server = FakeServer()
+        ops = [('cn=a', 0), ('cn=b', 1), ('CN=A', 2), ('cn=a', 3),
+               ('cn=c', 4)]
+        report = run_bulk(self.ldap, ops, server.submit, 8)
+        self.assertEqual(report.succeeded, 5)
+
+        # Operations on the same DN are never in flight together, and are
+        # submitted in order.
+        self.assertEqual([a for dn, a in server.submitted
+                          if dn.lower() == 'cn=a'], [0, 2, 3])
+        self.assertEqual(server.max_in_flight, 3)
+
+    def test_failures(self, dll):
+        self.setup_dll(dll)
+        server = FakeServer(failures=('cn=b',))
+        ops = [('cn=a', 0), ('cn=b', 1), ('cn=c', 2)]
+        report = run_bulk(self.ldap, ops, server.submit, 2)
+        self.assertEqual(report.succeeded, 2)
+        self.assertEqual(len(report.failed), 1)
+        outcome = report.failed[0]
+        self.assertEqual((outcome.index, outcome.dn), (1, 'cn=b'))
+        self.assertIsInstance(outcome.error, LdapError)
+        self.assertEqual(outcome.error.args[1], LDAP_NO_SUCH_OBJECT)
+
+    def test_submit_failure(self, dll):
+        self.setup_dll(dll)
+        server = FakeServer()
+
+        def submit(dn, argument):
+            if argument == 1:
+                raise LdapError(LDAP_NO_SUCH_OBJECT)
+            return server.submit(dn, argument)
+
+        ops = [('cn=a', 0), ('cn=a', 1), ('cn=a', 2)]
+        report = run_bulk(self.ldap, ops, submit, 2)
+        self.assertEqual([o.error is None for o in report],
+                         [True, False, True])
+
+    def test_bad_window(self, dll):
+        self.assertRaises(ValueError, run_bulk, self.ldap, [], None, 0)
+
+
+@patch_dll
+@mock.patch('wldap.ldap.run_bulk')
+class TestLdapBulk(unittest.TestCase):
+
+    def test_bulk_add(self, dll, run_bulk):
+        l = wldap.ldap()
+        l.add = mock.Mock()
+        l.bulk_add([('cn=a', [('cn', ['a'])])], window=3)
+        ops, submit, window = run_bulk.call_args[0][1:]
+        self.assertEqual(window, 3)
+        submit('cn=a', [('cn', ['a'])])
+        l.add.assert_called_once_with('cn=a', ('cn', ['a']))
+
+    def test_bulk_delete(self, dll, run_bulk):
+        l = wldap.ldap()
+        l.delete = mock.Mock()
+        l.bulk_delete(['cn=a', 'cn=b'])
+        ops, submit, window = run_bulk.call_args[0][1:]
+        self.assertEqual(list(ops), [('cn=a', None), ('cn=b', None)])
+        submit('cn=a', None)
+        l.delete.assert_called_once_with('cn=a')
+
+    def test_bulk_modify(self, dll, run_bulk):
+        l = wldap.ldap()
+        changes = [('cn=a', wldap.Changeset())]
+        l.bulk_modify(changes)
+        run_bulk.assert_called_once_with(l, changes, l.modify, 64)
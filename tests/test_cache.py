@@ -0,0 +1,174 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap.cache import SearchCache
+from wldap.memory import Directory, MemoryBackend
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SCOPE_SUBTREE
+from tests.mock_dll import use_backend
+
+
+BASE = 'dc=example,dc=com'
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSearchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def key(self, base, scope=LDAP_SCOPE_SUBTREE, filt='(cn=*)'):
+        return SearchCache.key(base, scope, filt, ['cn'], False)
+
+    def test_key(self):
+        self.assertEqual(
+            SearchCache.key('OU=People, DC=Example', 2, ' (cn=*) ',
+                            ['mail', 'CN', 'cn'], 0),
+            SearchCache.key('ou=people,dc=example', 2, '(cn=*)',
+                            ['cn', 'mail'], False))
+        self.assertNotEqual(SearchCache.key(BASE, 2, None, [], False),
+                            SearchCache.key(BASE, 2, None, [], False, True))
+
+    def test_ttl(self):
+        cache = SearchCache(ttl=10, negative_ttl=1, clock=self.clock)
+        cache.put(self.key(BASE), [{'cn': ['a']}])
+        cache.put(self.key('ou=empty'), [])
+        self.clock.now = 5
+        self.assertEqual(cache.get(self.key(BASE)), [{'cn': ['a']}])
+        self.assertEqual(cache.get(self.key('ou=empty')), None)
+        self.clock.now = 10
+        self.assertEqual(cache.get(self.key(BASE)), None)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 2, 0))
+
+    def test_negative_disabled(self):
+        cache = SearchCache(negative_ttl=0)
+        cache.put(self.key(BASE), [])
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_entries(self):
+        cache = SearchCache(max_entries=2)
+        for name in ('a', 'b'):
+            cache.put(self.key('cn=' + name), [{'cn': [name]}])
+        cache.get(self.key('cn=a'))
+        cache.put(self.key('cn=c'), [{'cn': ['c']}])
+        self.assertEqual(cache.get(self.key('cn=b')), None)
+        self.assertEqual(cache.get(self.key('cn=a')), [{'cn': ['a']}])
+
+    def test_lru_bytes(self):
+        cache = SearchCache(max_entries=None, max_bytes=10000)
+        for idx in range(10):
+            cache.put(self.key('cn=%d' % idx), [{'cn': ['x' * 2000]}])
+        self.assertTrue(0 < len(cache) < 10)
+        self.assertTrue(cache.bytes <= 10000)
+        self.assertEqual(cache.get(self.key('cn=0')), None)
+        self.assertNotEqual(cache.get(self.key('cn=9')), None)
+
+    def test_invalidate(self):
+        cache = SearchCache()
+        people = 'ou=people,' + BASE
+        keys = [self.key(BASE), self.key(people, LDAP_SCOPE_ONELEVEL),
+                self.key(BASE, LDAP_SCOPE_ONELEVEL),
+                self.key('cn=a,' + people, LDAP_SCOPE_BASE),
+                self.key('cn=b,' + people, LDAP_SCOPE_BASE)]
+        for key in keys:
+            cache.put(key, [{'cn': ['x']}])
+        cache.invalidate('CN=A, ' + people)
+        self.assertEqual([cache.get(key) is not None for key in keys],
+                         [False, False, True, False, True])
+
+    def test_invalidate_escaped(self):
+        cache = SearchCache()
+        key = self.key(BASE, LDAP_SCOPE_ONELEVEL)
+        cache.put(key, [{'cn': ['x']}])
+        cache.invalidate('not a dn')
+        self.assertNotEqual(cache.get(key), None)
+        cache.invalidate('cn=a\\,ou=b,' + BASE)
+        self.assertEqual(cache.get(key), None)
+
+    def test_stale_generation(self):
+        cache = SearchCache()
+        generation = cache.generation
+        cache.invalidate(BASE)
+        cache.put(self.key(BASE), [{'cn': ['x']}], generation)
+        self.assertEqual(len(cache), 0)
+
+
+class TestSearchCached(unittest.TestCase):
+
+    def setUp(self):
+        directory = Directory()
+        directory.add(BASE, [('objectClass', ['domain'])])
+        directory.add('cn=a,' + BASE, [('cn', ['a']), ('uid', ['1'])])
+        use_backend(self, MemoryBackend(directory))
+        self.ldap = wldap.ldap('localhost')
+        self.cache = self.ldap.enable_cache(ttl=60)
+
+    def tearDown(self):
+        self.ldap.unbind()
+
+    def search(self, binary=False):
+        return self.ldap.search_cached(BASE, LDAP_SCOPE_SUBTREE, '(cn=*)',
+                                       ['cn'], False, binary)
+
+    def test_hit(self):
+        self.assertEqual(self.search(), [{'cn': ['a']}])
+        self.assertIs(self.search(), self.search())
+        self.assertEqual(self.search(binary=True), [{'cn': [b'a']}])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+        self.assertIs(self.ldap.enable_cache(), self.cache)
+
+    def test_write_through(self):
+        self.search()
+        self.ldap.add_s('cn=b,' + BASE, ('cn', ['b']))
+        self.assertEqual(self.search(), [{'cn': ['a']}, {'cn': ['b']}])
+
+        changeset = wldap.Changeset()
+        changeset.replace('cn', ['c'])
+        self.ldap.modify('cn=b,' + BASE, changeset).result().release()
+        self.assertEqual(self.search(), [{'cn': ['a']}, {'cn': ['c']}])
+
+        self.ldap.delete_s('cn=b,' + BASE)
+        self.assertEqual(self.search(), [{'cn': ['a']}])
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_failed_write(self):
+        self.search()
+        self.assertRaises(wldap.LdapError, self.ldap.delete_s, BASE)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_without_cache(self):
+        l = wldap.ldap('localhost')
+        self.assertEqual(l.search_cached(BASE, LDAP_SCOPE_SUBTREE, '(cn=*)',
+                                         ['cn'], False), [{'cn': ['a']}])
+        l.unbind()
@@ -56,7 +56,7 @@ class TestChangeset(unittest.TestCase):
         c_values = changeset.to_api_param()
         for idx, mod in enumerate(changeset.changes):
             self.assertEqual(addressof(c_values[idx].contents), addressof(mod))
-        self.assertEqual(c_values[len(changeset.changes)], None)
+        self.assertFalse(c_values[len(changeset.changes)])
 
     def _common_str(self, fn, mod_op, attr, values):
         changeset = wldap.Changeset()
@@ -71,7 +71,7 @@ class TestChangeset(unittest.TestCase):
         c_values = changeset.to_api_param()
         for idx, mod in enumerate(changeset.changes):
             self.assertEqual(addressof(c_values[idx].contents), addressof(mod))
-        self.assertEqual(c_values[len(changeset.changes)], None)
+        self.assertFalse(c_values[len(changeset.changes)])
 
     def test_add(self):
         self._common_str(wldap.Changeset.add,
@@ -109,6 +109,37 @@ class TestChangeset(unittest.TestCase):
                          'attr',
                          [b'val1', b'val2'])
 
+    def test_compile_reuse(self):
+        changeset = wldap.Changeset().add('attr', ['val'])
+        compiled = changeset.compile()
+        self.assertIs(changeset.compile(), compiled)
+        self.assertIs(changeset.to_api_param(), compiled)
+
+    def test_compile_invalidate(self):
+        changeset = wldap.Changeset().add('attr1', ['val'])
+        compiled = changeset.compile()
+        changeset.replace('attr2', ['val'])
+        recompiled = changeset.compile()
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(len(recompiled), 3)
+        self.assertEqual(recompiled[1].contents.mod_type, 'attr2')
+        self.assertFalse(recompiled[2])
+
+        # Changes appended to the list directly are also taken into account.
+        changeset.changes.append(LDAPMod(LDAPMod.LDAP_MOD_DELETE, 'attr3',
+                                         str_values=None))
+        self.assertEqual(len(changeset.compile()), 4)
+
+        # As are changes replaced or reordered in place.
+        compiled = changeset.compile()
+        changeset.changes[0] = LDAPMod(LDAPMod.LDAP_MOD_DELETE, 'attr4',
+                                       str_values=None)
+        self.assertEqual(changeset.compile()[0].contents.mod_type, 'attr4')
+        changeset.changes.reverse()
+        self.assertEqual(changeset.compile()[0].contents.mod_type, 'attr3')
+        changeset.changes = []
+        self.assertEqual(changeset.compile(), None)
+
     def test_to_api_param_empty(self):
         changeset = wldap.Changeset()
         values = changeset.to_api_param()
@@ -0,0 +1,188 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+import struct
+import unittest
+import uuid
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import decoders
+from wldap.decoders import DecoderRegistry
+from wldap.memory import Directory, MemoryBackend
+from wldap.message import parse_message, parse_message_records
+from wldap.wldap32_constants import LDAP_SCOPE_ONELEVEL
+from tests.mock_dll import use_backend
+
+
+SID = b'\x01\x05\x00\x00\x00\x00\x00\x05' + struct.pack('<5I', 21, 1, 2, 3,
+                                                          1104)
+GUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+
+SCHEMA = [
+    "( 2.5.4.0 NAME 'objectClass' SYNTAX 1.3.6.1.4.1.1466.115.121.1.38 )",
+    "( 2.5.4.41 NAME 'name' SYNTAX '1.3.6.1.4.1.1466.115.121.1.15{32768}' )",
+    "( 2.5.4.3 NAME ( 'cn' 'commonName' ) SUP name )",
+    "( 1.1.1 NAME 'uidNumber' SYNTAX 1.3.6.1.4.1.1466.115.121.1.27 "
+    "SINGLE-VALUE )",
+    "( 1.1.2 NAME 'isCritical' SYNTAX 1.3.6.1.4.1.1466.115.121.1.7 )",
+    "( 2.5.18.1 NAME 'createTimestamp' "
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.24 NO-USER-MODIFICATION )",
+    "( 1.1.3 NAME 'modifiedAt' SUP createTimestamp )",
+]
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_generalized_time(self):
+        cases = [
+            ('20130619120000Z', datetime(2013, 6, 19, 12)),
+            ('20130619120000.5Z', datetime(2013, 6, 19, 12, 0, 0, 500000)),
+            ('201306191230Z', datetime(2013, 6, 19, 12, 30)),
+            ('2013061912,25Z', datetime(2013, 6, 19, 12, 15)),
+            ('20130619120000+0200', datetime(2013, 6, 19, 10)),
+            ('20130619120000-05', datetime(2013, 6, 19, 17)),
+        ]
+        for value, expected in cases:
+            self.assertEqual(decoders.decode_generalized_time(value), expected)
+        self.assertRaises(ValueError, decoders.decode_generalized_time, '2013')
+
+    def test_filetime(self):
+        self.assertEqual(decoders.decode_filetime('130161168000000000'),
+                         datetime(2013, 6, 19, 12))
+        self.assertEqual(decoders.decode_filetime('0'), None)
+        self.assertEqual(decoders.decode_filetime('9223372036854775807'), None)
+
+    def test_encode(self):
+        when = datetime(2013, 6, 19, 12, 0, 0, 500000)
+        self.assertEqual(decoders.encode_generalized_time(when),
+                         '20130619120000.5Z')
+        self.assertEqual(decoders.decode_generalized_time(
+            decoders.encode_generalized_time(when)), when)
+        self.assertEqual(decoders.encode_filetime(datetime(2013, 6, 19, 12)),
+                         130161168000000000)
+
+    def test_sid(self):
+        self.assertEqual(decoders.decode_sid(SID), 'S-1-5-21-1-2-3-1104')
+        self.assertRaises(ValueError, decoders.decode_sid, SID[:-1])
+
+    def test_guid(self):
+        self.assertEqual(decoders.decode_guid(GUID.bytes_le), GUID)
+
+    def test_boolean(self):
+        self.assertIs(decoders.decode_boolean('TRUE'), True)
+        self.assertIs(decoders.decode_boolean('FALSE'), False)
+        self.assertRaises(ValueError, decoders.decode_boolean, 'yes')
+
+    def test_attribute_types(self):
+        syntaxes = decoders.parse_attribute_types(SCHEMA)
+        self.assertEqual(syntaxes['name'], '1.3.6.1.4.1.1466.115.121.1.15')
+        self.assertEqual(syntaxes['cn'], syntaxes['name'])
+        self.assertEqual(syntaxes['commonname'], syntaxes['name'])
+        self.assertEqual(syntaxes['modifiedat'],
+                         '1.3.6.1.4.1.1466.115.121.1.24')
+
+
+class TestDecoderRegistry(unittest.TestCase):
+
+    def test_lookup(self):
+        registry = DecoderRegistry()
+        self.assertEqual(registry.lookup('pwdLastSet').function,
+                         decoders.decode_filetime)
+        self.assertTrue(registry.lookup('OBJECTSID').binary)
+        self.assertIs(registry.lookup('uidNumber'), None)
+        self.assertIs(DecoderRegistry(defaults=False).lookup('objectSid'),
+                      None)
+
+    def test_register(self):
+        registry = DecoderRegistry()
+        self.assertIs(registry.lookup('cn'), None)
+        registry.register_attribute('CN', lambda value: value.upper())
+        self.assertEqual(registry.decode('cn', ['a']), ['A'])
+
+    def test_decode_failure(self):
+        registry = DecoderRegistry()
+        self.assertEqual(registry.decode('pwdLastSet', ['x', '0']),
+                         ['x', None])
+
+
+class TestSchemaDecoding(unittest.TestCase):
+
+    def setUp(self):
+        directory = Directory()
+        directory.add('', [('objectClass', ['top']),
+                           ('subschemaSubentry', ['cn=Subschema'])])
+        directory.add('cn=Subschema', [('objectClass', ['subschema']),
+                                       ('attributeTypes', SCHEMA)])
+        directory.add('dc=com', [('dc', ['com'])])
+        directory.add('cn=a,dc=com', [
+            ('objectClass', ['top', 'person']), ('cn', ['a']),
+            ('uidNumber', ['1000']), ('isCritical', ['TRUE']),
+            ('modifiedAt', ['20130619120000Z']),
+            ('pwdLastSet', ['130161168000000000']),
+            ('objectSid', [SID]), ('objectGUID', [GUID.bytes_le])])
+        self.backend = use_backend(self, MemoryBackend(directory))
+        self.ldap = wldap.ldap('localhost')
+
+    def tearDown(self):
+        self.ldap.unbind()
+
+    def search(self, parse, **kwargs):
+        msg = self.ldap.search_s('dc=com', LDAP_SCOPE_ONELEVEL, None, ['*'],
+                                 False)
+        try:
+            return parse(msg, **kwargs)
+        finally:
+            msg.release()
+
+    def test_load_schema(self):
+        registry = DecoderRegistry()
+        schema = registry.load_schema(self.ldap)
+        self.assertEqual(schema['uidnumber'], '1.3.6.1.4.1.1466.115.121.1.27')
+        self.assertIs(registry.load_schema(self.ldap), schema)
+        self.assertIsNot(registry.load_schema(self.ldap, reload=True), schema)
+
+    def test_parse_message(self):
+        registry = DecoderRegistry()
+        registry.load_schema(self.ldap)
+        entry, = self.search(parse_message, decoders=registry)
+        self.assertEqual(entry['cn'], ['a'])
+        self.assertEqual(entry['objectClass'], ['top', 'person'])
+        self.assertEqual(entry['uidNumber'], [1000])
+        self.assertEqual(entry['isCritical'], [True])
+        self.assertEqual(entry['modifiedAt'], [datetime(2013, 6, 19, 12)])
+        self.assertEqual(entry['pwdLastSet'], [datetime(2013, 6, 19, 12)])
+        self.assertEqual(entry['objectSid'], ['S-1-5-21-1-2-3-1104'])
+        self.assertEqual(entry['objectGUID'], [GUID])
+
+    def test_without_schema(self):
+        entry, = self.search(parse_message, decoders=DecoderRegistry())
+        self.assertEqual(entry['uidNumber'], ['1000'])
+        self.assertEqual(entry['objectSid'], ['S-1-5-21-1-2-3-1104'])
+
+    def test_records(self):
+        registry = DecoderRegistry()
+        registry.load_schema(self.ldap)
+        record, = self.search(parse_message_records, decoders=registry)
+        self.assertEqual(record['uidNumber'], (1000,))
+        self.assertEqual(record['objectGUID'], (GUID,))
@@ -0,0 +1,159 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ctypes import addressof
+import threading
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from wldap.dispatcher import ResultDispatcher
+from wldap.exceptions import TimeoutError
+from wldap.future import Future, as_completed
+from wldap.wldap32_constants import LDAP_MSG_ALL, LDAP_RES_ANY
+from wldap.wldap32_structures import LDAPMessage
+from tests.mock_dll import patch_dll
+
+
+@patch_dll
+class TestResultDispatcher(unittest.TestCase):
+
+    def _setup(self, dll, msgids):
+        # ldap_result returns a distinct LDAPMessage for each msgid in turn,
+        # and None (a timeout) once exhausted.
+        messages = {}
+        pending = list(msgids)
+
+        def result(l, msgid, all_, timeout, p_res):
+            if not pending:
+                return 0
+            message = LDAPMessage()
+            messages[addressof(message)] = (pending.pop(0), message)
+            p_res._obj.contents = message
+            return 1
+
+        def msgid(res):
+            return messages[addressof(res.contents)][0]
+
+        dll.ldap_result.side_effect = result
+        dll.ldap_msgid.side_effect = msgid
+        return mock.Mock()
+
+    def test_poll(self, dll):
+        ldap = self._setup(dll, [1])
+        dispatcher = ResultDispatcher(ldap)
+        self.assertEqual(dispatcher.poll(0.5), 1)
+        self.assertEqual(dispatcher.poll(0.5), None)
+        dll.ldap_result.assert_called_with(ldap._l, LDAP_RES_ANY,
+                                           LDAP_MSG_ALL, mock.ANY, mock.ANY)
+        self.assertFalse(dispatcher.claim(1) is None)
+        self.assertTrue(dispatcher.claim(1) is None)
+
+    def test_route(self, dll):
+        ldap = self._setup(dll, [2, 3, 1])
+        dispatcher = ResultDispatcher(ldap)
+        futures = [Future(ldap, msgid, dispatcher) for msgid in (1, 2, 3)]
+
+        self.assertTrue(futures[0].result() is not None)
+        self.assertTrue(futures[1].done())
+        self.assertTrue(futures[2].done())
+        self.assertEqual(dll.ldap_result.call_count, 3)
+        self.assertFalse(ldap.result.called)
+
+    def test_route_completed_before_register(self, dll):
+        ldap = self._setup(dll, [1])
+        dispatcher = ResultDispatcher(ldap)
+        dispatcher.poll()
+
+        future = Future(ldap, 1, dispatcher)
+        self.assertTrue(future.done())
+        self.assertEqual(dll.ldap_result.call_count, 1)
+
+    def test_preallocated(self, dll):
+        ldap = self._setup(dll, [1, 2])
+        dispatcher = ResultDispatcher(ldap)
+        dispatcher.poll(1)
+        dispatcher.poll(2)
+        first, second = dll.ldap_result.call_args_list
+        self.assertTrue(first[0][3] is second[0][3])
+        self.assertTrue(first[0][4] is second[0][4])
+
+    def test_timeout(self, dll):
+        ldap = self._setup(dll, [2])
+        dispatcher = ResultDispatcher(ldap)
+        future = Future(ldap, 1, dispatcher)
+        self.assertRaises(TimeoutError, future.result, 0)
+        self.assertFalse(dispatcher.claim(2) is None)
+
+    def test_cancel(self, dll):
+        ldap = self._setup(dll, [1])
+        ldap.abandon.return_value = True
+        dispatcher = ResultDispatcher(ldap)
+        future = Future(ldap, 1, dispatcher)
+        future.cancel()
+        dispatcher.poll()
+        self.assertFalse(future.done())
+
+    def test_as_completed(self, dll):
+        ldap = self._setup(dll, [3, 1, 2])
+        dispatcher = ResultDispatcher(ldap)
+        futures = [Future(ldap, msgid, dispatcher) for msgid in (1, 2, 3)]
+
+        completed = list(as_completed(futures))
+        self.assertEqual(completed, [futures[2], futures[0], futures[1]])
+        self.assertEqual(dll.ldap_result.call_count, 3)
+
+    def test_concurrent_wait(self, dll):
+        # While a thread blocks in ldap_result, the others can still register,
+        # cancel and check their Futures, and wait for the reader to route
+        # their result.
+        ldap = self._setup(dll, [])
+        ldap.abandon.return_value = True
+        dispatcher = ResultDispatcher(ldap)
+        entered, release = threading.Event(), threading.Event()
+        pending = [2, 1]
+        messages = {}
+
+        def result(l, msgid, all_, timeout, p_res):
+            entered.set()
+            release.wait(5)
+            message = LDAPMessage()
+            messages[addressof(message)] = (pending.pop(0), message)
+            p_res._obj.contents = message
+            return 1
+
+        dll.ldap_result.side_effect = result
+        dll.ldap_msgid.side_effect = \
+            lambda res: messages[addressof(res.contents)][0]
+
+        first = Future(ldap, 1, dispatcher)
+        reader = threading.Thread(target=first.result, args=(5,))
+        reader.start()
+        self.assertTrue(entered.wait(5))
+
+        second = Future(ldap, 2, dispatcher)
+        cancelled = Future(ldap, 3, dispatcher)
+        self.assertFalse(second.done())
+        self.assertTrue(cancelled.cancel())
+
+        release.set()
+        self.assertTrue(second.result(5) is not None)
+        reader.join(5)
+        self.assertTrue(first.done())
+        self.assertEqual(dll.ldap_result.call_count, 2)
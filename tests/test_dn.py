@@ -0,0 +1,184 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import dn
+from wldap.memory import Directory, MemoryBackend
+from wldap.message import parse_message_columns
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SCOPE_SUBTREE
+from tests.mock_dll import use_backend
+
+
+class TestParse(unittest.TestCase):
+
+    def test_rdns(self):
+        self.assertEqual(dn.parse('CN=Smith\\, John, OU=People,DC=com').rdns,
+                         ((('CN', 'Smith, John'),), (('OU', 'People'),),
+                          (('DC', 'com'),)))
+        self.assertEqual(dn.parse('cn=a+uid=1;dc=com').rdns,
+                         ((('cn', 'a'), ('uid', '1')), (('dc', 'com'),)))
+        self.assertEqual(dn.parse('').rdns, ())
+
+    def test_escapes(self):
+        cases = [
+            (r'cn=\41\42', u'AB'),
+            (r'cn=\c3\a9t\c3\a9', u'\xe9t\xe9'),
+            (r'cn=\#1', u'#1'),
+            (r'cn=a\ ', u'a '),
+            (r'cn=\20a', u' a'),
+            ('cn= a  ', u'a'),
+            ('cn=#04024869', u'#04024869'),
+            ('cn="a, b"', u'a, b'),
+        ]
+        for text, value in cases:
+            self.assertEqual(dn.parse(text).rdn, (('cn', value),))
+
+    def test_invalid(self):
+        for text in ('cn', '=a', 'cn=a,', r'cn=a\zz', r'cn=\ff', 'c n=a',
+                     'cn=#zz', 'cn="a'):
+            self.assertRaises(ValueError, dn.parse, text)
+
+    def test_escape_value(self):
+        self.assertEqual(dn.escape_value(' #a,b+c;"<>\\ '),
+                         r'\ #a\,b\+c\;\"\<\>\\\ ')
+        self.assertEqual(dn.escape_value('#'), r'\#')
+        for value in (u' a,b ', u'#x', u'\xe9=1', u' '):
+            text = 'cn=' + dn.escape_value(value)
+            self.assertEqual(dn.parse(text).rdn, (('cn', value),))
+
+    def test_cache(self):
+        self.assertIs(dn.parse('cn=a,dc=com'), dn.parse('cn=a,dc=com'))
+        dn.set_cache_size(1)
+        try:
+            first = dn.parse('cn=a,dc=com')
+            dn.parse('cn=b,dc=com')
+            self.assertIsNot(dn.parse('cn=a,dc=com'), first)
+            self.assertEqual(dn.parse('cn=a,dc=com'), first)
+        finally:
+            dn.set_cache_size(10000)
+
+    def test_interning_bounded(self):
+        dn.clear_cache()
+        dn.set_cache_size(10)
+        try:
+            for idx in range(100):
+                dn.parse('cn=user%d,ou=people,dc=com' % idx)
+            # The RDNs (lower case, so their own normalized form) and keys
+            # of the 10 DNs in cache, sharing 2 RDNs.
+            self.assertEqual(len(dn._interned), 10 * 2 + 2)
+            dn.set_cache_size(0)
+            self.assertEqual(dn._interned, {})
+        finally:
+            dn.set_cache_size(10000)
+
+
+class TestDN(unittest.TestCase):
+
+    def test_equality(self):
+        a = dn.parse('CN=John Smith+UID=1,OU=People,DC=Example,DC=Com')
+        b = dn.parse(r'uid=1+cn=john\20smith, ou=people, dc=example, dc=com')
+        self.assertEqual(a, b)
+        self.assertIs(a._key, b._key)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a, 'uid=1+cn=John Smith,ou=People,dc=example,'
+                               'dc=com')
+        self.assertNotEqual(a, 'not a dn')
+        self.assertNotEqual(a, 42)
+        self.assertEqual(len(set([a, b])), 1)
+
+    def test_equality_after_clear(self):
+        a = dn.parse('cn=a,dc=com')
+        dn.clear_cache()
+        self.assertEqual(a, dn.parse('CN=A,DC=COM'))
+
+    def test_str(self):
+        text = 'CN=Smith\\, John,DC=com'
+        self.assertEqual(str(dn.parse(text)), text)
+        self.assertEqual(str(dn.parse(text).parent), 'DC=com')
+        self.assertEqual(dn.parse(text).normalized, 'cn=smith\\, john,dc=com')
+        self.assertEqual(repr(dn.parse('dc=com')), "DN('dc=com')")
+
+    def test_hierarchy(self):
+        base = dn.parse('dc=example,dc=com')
+        people = dn.parse('ou=people,dc=example,dc=com')
+        user = dn.parse('cn=a,OU=People,DC=example,DC=com')
+        self.assertEqual(user.parent, people)
+        self.assertIs(user.parent, user.parent)
+        self.assertEqual(dn.parse('dc=com').parent, dn.parse(''))
+        self.assertIs(dn.parse('').parent, None)
+        self.assertTrue(user.is_child_of(people))
+        self.assertFalse(user.is_child_of(base))
+        self.assertTrue(user.is_descendant_of(base))
+        self.assertFalse(base.is_descendant_of(base))
+        self.assertTrue(user.is_descendant_of(dn.parse('')))
+        self.assertFalse(dn.parse('dc=example,dc=org').is_descendant_of(
+            dn.parse('dc=com')))
+
+    def test_in_scope(self):
+        user = dn.parse('cn=a,ou=people,dc=com')
+        self.assertTrue(user.in_scope('CN=A,OU=People,DC=com',
+                                      LDAP_SCOPE_BASE))
+        self.assertTrue(user.in_scope('ou=people,dc=com', LDAP_SCOPE_ONELEVEL))
+        self.assertFalse(user.in_scope('dc=com', LDAP_SCOPE_ONELEVEL))
+        self.assertTrue(user.in_scope('dc=com', LDAP_SCOPE_SUBTREE))
+        self.assertTrue(user.in_scope(user, LDAP_SCOPE_SUBTREE))
+
+    def test_interned(self):
+        a = dn.parse('cn=a,ou=people,dc=com')
+        b = dn.parse('cn=b,ou=people,dc=com')
+        self.assertIs(a.rdns[1], b.rdns[1])
+
+
+class TestParsedResults(unittest.TestCase):
+
+    def setUp(self):
+        directory = Directory()
+        directory.add('dc=com', [('dc', ['com'])])
+        for name in ('a', 'b'):
+            directory.add('cn=%s,dc=com' % name, [('objectClass', ['person']),
+                                                  ('cn', [name])])
+        use_backend(self, MemoryBackend(directory))
+        self.ldap = wldap.ldap('localhost')
+
+    def tearDown(self):
+        self.ldap.unbind()
+
+    def test_search_iter(self):
+        entries = list(self.ldap.search_iter('dc=com', LDAP_SCOPE_ONELEVEL,
+                                             None, ['cn'], False,
+                                             with_dn=dn.parse))
+        self.assertEqual([type(name) for name, _ in entries], [dn.DN] * 2)
+        self.assertEqual([name for name, _ in entries],
+                         [dn.parse('CN=A,DC=COM'), dn.parse('cn=b,dc=com')])
+        self.assertEqual(entries[0][0].parent, entries[1][0].parent)
+
+    def test_columns(self):
+        msg = self.ldap.search_s('dc=com', LDAP_SCOPE_ONELEVEL, None, ['cn'],
+                                 False)
+        columns = parse_message_columns(msg, ['cn'], dn_parser=dn.parse)
+        msg.release()
+        self.assertEqual(columns['dn'], [dn.parse('cn=a,dc=com'),
+                                         dn.parse('cn=b,dc=com')])
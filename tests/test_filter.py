@@ -0,0 +1,152 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+import unittest
+import uuid
+
+from wldap import filter as filters
+from wldap.filter import And, Approx, Equality, Extensible, GreaterOrEqual
+from wldap.filter import LessOrEqual, Not, Or, Present, Substrings
+from wldap.records import RecordSet
+
+
+class TestParse(unittest.TestCase):
+
+    def test_items(self):
+        cases = [
+            ('(cn=foo)', Equality('cn', b'foo')),
+            ('(cn=*)', Present('cn')),
+            ('(cn~=foo)', Approx('cn', b'foo')),
+            ('(uid>=10)', GreaterOrEqual('uid', b'10')),
+            ('(uid<=10)', LessOrEqual('uid', b'10')),
+            ('(cn=a*b*c)', Substrings('cn', b'a', [b'b'], b'c')),
+            ('(cn=*b*)', Substrings('cn', None, [b'b'], None)),
+            ('(cn:dn:2.5.13.2:=foo)',
+             Extensible('2.5.13.2', 'cn', b'foo', True)),
+            ('(:1.2.3:=foo)', Extensible('1.2.3', None, b'foo', False)),
+        ]
+        for text, expected in cases:
+            self.assertEqual(filters.parse(text), expected)
+
+    def test_composite(self):
+        self.assertEqual(filters.parse('(&(a=1)(|(b=2)(!(c=3))))'),
+                         And([Equality('a', b'1'),
+                              Or([Equality('b', b'2'),
+                                  Not(Equality('c', b'3'))])]))
+
+    def test_missing_parenthesis(self):
+        self.assertEqual(filters.parse('cn=foo'), Equality('cn', b'foo'))
+
+    def test_escapes(self):
+        self.assertEqual(filters.parse(r'(cn=a\2a\28b\29)'),
+                         Equality('cn', b'a*(b)'))
+        self.assertEqual(filters.parse(u'(cn=\xe9)'),
+                         Equality('cn', b'\xc3\xa9'))
+        self.assertEqual(filters.escape('a*(b)\\'), r'a\2a\28b\29\5c')
+
+    def test_invalid(self):
+        for text in ('', '(cn=foo', '(cn=foo))', '(&(cn=foo)', '(cn)',
+                     '(c n=foo)', r'(cn=\zz)', '(!)', '(:=foo)'):
+            self.assertRaises(ValueError, filters.parse, text)
+
+
+class TestMatches(unittest.TestCase):
+
+    entry = {
+        'cn': [b'John Smith'],
+        'uid': [b'42'],
+        'mail': [b'john@example.com', b'js@example.com'],
+    }
+
+    def matches(self, text):
+        return filters.matches(filters.parse(text), self.entry)
+
+    def test_equality(self):
+        self.assertTrue(self.matches('(cn=john smith)'))
+        self.assertTrue(self.matches('(MAIL=js@example.com)'))
+        self.assertFalse(self.matches('(cn=john)'))
+        self.assertFalse(self.matches('(sn=smith)'))
+
+    def test_presence(self):
+        self.assertTrue(self.matches('(uid=*)'))
+        self.assertFalse(self.matches('(sn=*)'))
+
+    def test_substrings(self):
+        self.assertTrue(self.matches('(cn=j*smith)'))
+        self.assertTrue(self.matches('(cn=*n S*)'))
+        self.assertTrue(self.matches('(mail=*@example.*)'))
+        self.assertFalse(self.matches('(cn=smith*)'))
+        self.assertFalse(self.matches('(cn=john*n*smith)'))
+
+    def test_ordering(self):
+        # Integer values compare as integers: '42' >= '100' as strings.
+        self.assertTrue(self.matches('(uid>=5)'))
+        self.assertFalse(self.matches('(uid>=100)'))
+        self.assertTrue(self.matches('(uid<=42)'))
+        self.assertTrue(self.matches('(cn<=k)'))
+
+    def test_composite(self):
+        self.assertTrue(self.matches('(&(cn=john*)(!(uid=1)))'))
+        self.assertTrue(self.matches('(|(uid=1)(uid=42))'))
+        self.assertFalse(self.matches('(&(uid=42)(sn=*))'))
+        self.assertTrue(self.matches('(:caseIgnoreMatch:=42)'))
+
+
+class TestCompile(TestMatches):
+
+    def matches(self, text):
+        return filters.compile(text)(self.entry)
+
+    def test_entries(self):
+        accept = filters.compile('(&(CN=john*)(uid>=40)(mail=*@example.com))')
+        self.assertTrue(accept({'cn': [u'John Smith'], 'UID': [u'42'],
+                                'Mail': [u'js@example.com']}))
+        self.assertTrue(accept(self.record()))
+        self.assertTrue(accept({'cn': [b'John'], 'uid': [42],
+                                'mail': [b'j@EXAMPLE.COM']}))
+        self.assertFalse(accept({'cn': [u'John'], 'uid': [u'7'],
+                                 'mail': [u'j@example.com']}))
+
+    def record(self):
+        records = RecordSet()
+        records.append({'cn': [u'John Smith'], 'uid': [u'42'],
+                        'mail': [u'js@example.com']})
+        return records[0]
+
+    def test_unicode(self):
+        accept = filters.compile(u'(cn=\\c3\\a9ric*)')
+        self.assertTrue(accept({'cn': [u'\xc9ric Smith']}))
+        self.assertTrue(accept({'cn': [u'\xe9ric'.encode('utf-8')]}))
+
+    def test_parsed(self):
+        accept = filters.compile(filters.parse('(uid=42)'))
+        self.assertTrue(accept(self.entry))
+
+    def test_decoded(self):
+        guid = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+        entry = {'whenChanged': [datetime(2013, 6, 19, 12)],
+                 'pwdLastSet': [datetime(2013, 6, 19, 12)],
+                 'objectGUID': [guid], 'isCritical': [True]}
+        for text, expected in [
+                ('(whenChanged>=20130101000000.0Z)', True),
+                ('(whenChanged<=20130101000000.0Z)', False),
+                ('(whenChanged=20130619120000Z)', True),
+                ('(pwdLastSet>=130161168000000000)', True),
+                ('(pwdLastSet=130161168000000001)', False),
+                ('(objectGUID=%s)' % filters.escape(guid.bytes_le), True),
+                ('(objectGUID=%s)' % filters.escape(guid.bytes), False),
+                ('(isCritical=TRUE)', True),
+                ('(isCritical=FALSE)', False)]:
+            self.assertEqual(filters.compile(text)(entry), expected, text)
@@ -23,11 +23,70 @@ except ImportError:
     import mock
 
 from wldap.exceptions import TimeoutError
-from wldap.future import Future
+from wldap.future import FIRST_COMPLETED, FIRST_EXCEPTION, Future
+from wldap.future import as_completed, wait, wait_all
+
+
+def make_ldap(completions):
+    """Return a mock ldap which completes msgid `n` completions[n] seconds
+    after its creation, and raises ValueError for negative msgids.
+    """
+    start = time.time()
+
+    def result(msgid, all_, timeout_seconds=None):
+        remaining = start + completions[msgid] - time.time()
+        if remaining > 0:
+            if timeout_seconds is not None and timeout_seconds < remaining:
+                time.sleep(timeout_seconds)
+                return None
+            time.sleep(remaining)
+        if msgid < 0:
+            raise ValueError(msgid)
+        return 'result %d' % msgid
+
+    ldap = mock.Mock()
+    ldap.result.side_effect = result
+    return ldap
 
 
 class TestFuture(unittest.TestCase):
 
+    def test_add_done_callback(self):
+        ldap = mock.Mock()
+        ldap.result.side_effect = [None, 'result']
+        callback = mock.Mock()
+
+        future = Future(ldap, 0)
+        future.add_done_callback(callback)
+        self.assertEqual(False, future.done())
+        self.assertFalse(callback.called)
+        self.assertEqual(True, future.done())
+        callback.assert_called_once_with(future)
+
+        future.add_done_callback(callback)
+        self.assertEqual(callback.call_count, 2)
+
+    def test_add_done_callback_exception(self):
+        ldap = mock.Mock()
+        ldap.result.side_effect = ValueError('test')
+        callbacks = [mock.Mock(side_effect=KeyError), mock.Mock()]
+
+        future = Future(ldap, 0)
+        [future.add_done_callback(callback) for callback in callbacks]
+        self.assertRaises(ValueError, future.result)
+        callbacks[0].assert_called_once_with(future)
+        callbacks[1].assert_called_once_with(future)
+
+    def test_add_done_callback_cancel(self):
+        ldap = mock.Mock()
+        ldap.abandon.return_value = True
+        callback = mock.Mock()
+
+        future = Future(ldap, 0)
+        future.add_done_callback(callback)
+        future.cancel()
+        callback.assert_called_once_with(future)
+
     def test_cancel(self):
         ldap = mock.Mock()
         ldap.abandon.return_value = True
@@ -114,3 +173,50 @@ class TestFuture(unittest.TestCase):
 
     def test_running(self):
         self.assertEqual(False, Future(mock.Mock(), 0).running())
+
+
+class TestWait(unittest.TestCase):
+
+    def test_as_completed(self):
+        ldap = make_ldap({1: 0.06, 2: 0, 3: 0.03})
+        futures = [Future(ldap, msgid) for msgid in (1, 2, 3)]
+        completed = list(as_completed(futures))
+        self.assertEqual(completed, [futures[1], futures[2], futures[0]])
+
+    def test_as_completed_timeout(self):
+        ldap = make_ldap({1: 0, 2: 10})
+        futures = [Future(ldap, msgid) for msgid in (1, 2)]
+        iterator = as_completed(futures, 0.05)
+        self.assertTrue(next(iterator) is futures[0])
+        self.assertRaises(TimeoutError, next, iterator)
+
+    def test_wait(self):
+        ldap = make_ldap({1: 0, 2: 10})
+        futures = [Future(ldap, msgid) for msgid in (1, 2)]
+        done, not_done = wait(futures, 0.05)
+        self.assertEqual(done, set([futures[0]]))
+        self.assertEqual(not_done, set([futures[1]]))
+
+    def test_wait_first_completed(self):
+        ldap = make_ldap({1: 0.06, 2: 0.03})
+        futures = [Future(ldap, msgid) for msgid in (1, 2)]
+        done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+        self.assertEqual(done, set([futures[1]]))
+        self.assertEqual(not_done, set([futures[0]]))
+
+    def test_wait_first_exception(self):
+        ldap = make_ldap({-1: 0.03, 1: 0, 2: 10})
+        futures = [Future(ldap, msgid) for msgid in (-1, 1, 2)]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        self.assertEqual(done, set(futures[:2]))
+        self.assertEqual(not_done, set([futures[2]]))
+
+    def test_wait_all(self):
+        ldap = make_ldap({1: 0.03, 2: 0})
+        futures = [Future(ldap, msgid) for msgid in (1, 2)]
+        self.assertEqual(wait_all(futures), ['result 1', 'result 2'])
+
+    def test_wait_all_exception(self):
+        ldap = make_ldap({-1: 0, 1: 0})
+        futures = [Future(ldap, msgid) for msgid in (1, -1)]
+        self.assertRaises(ValueError, wait_all, futures)
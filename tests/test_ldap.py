@@ -28,9 +28,10 @@ with mock.patch('ctypes.cdll'):
     import wldap
 from wldap.exceptions import LdapError
 from wldap.wldap32_structures import LDAP_TIMEVAL, LDAPMod
+from tests.mock_dll import patch_dll
 
 
-@mock.patch('wldap.wldap32_dll.dll')
+@patch_dll
 class TestWldap(unittest.TestCase):
 
     def assert_forward(self, dll, func, args, api_func=None):
@@ -73,7 +74,7 @@ class TestWldap(unittest.TestCase):
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[1], 'val2.2')
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[2], None)
 
-        self.assertEqual(mods[2], None)
+        self.assertFalse(mods[2])
 
     def test_ldap_add_s(self, dll):
         l = wldap.ldap()
@@ -92,7 +93,7 @@ class TestWldap(unittest.TestCase):
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[1], 'val2.2')
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[2], None)
 
-        self.assertEqual(mods[2], None)
+        self.assertFalse(mods[2])
 
     def test_ldap_bind(self, dll):
         self.assert_forward(dll, 'bind', ('dn', 'cred', 'method'), 'bindW')
@@ -129,6 +130,16 @@ class TestWldap(unittest.TestCase):
         l.delete_s('dn')
         dll.ldap_delete_sW.assert_called_once_with(l._l, 'dn')
 
+    def test_ldap_enable_dispatcher(self, dll):
+        l = wldap.ldap()
+        dispatcher = l.enable_dispatcher()
+        self.assertTrue(l.enable_dispatcher() is dispatcher)
+
+        dll.ldap_deleteW.return_value = 42
+        future = l.delete('dn')
+        self.assertTrue(future._dispatcher is dispatcher)
+        self.assertTrue(dispatcher._futures[42] is future)
+
     def test_ldap_modify(self, dll):
         changeset = wldap.Changeset()
         changeset.replace('attr1', ['val1'])
@@ -150,7 +161,7 @@ class TestWldap(unittest.TestCase):
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[1], 'val2.2')
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[2], None)
 
-        self.assertEqual(mods[2], None)
+        self.assertFalse(mods[2])
 
     def test_ldap_modify_s(self, dll):
         changeset = wldap.Changeset()
@@ -173,7 +184,7 @@ class TestWldap(unittest.TestCase):
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[1], 'val2.2')
         self.assertEqual(mods[1].contents.mod_vals.modv_strvals[2], None)
 
-        self.assertEqual(mods[2], None)
+        self.assertFalse(mods[2])
 
     def test_ldap_result_timeout(self, dll):
         l = wldap.ldap()
@@ -201,6 +212,19 @@ class TestWldap(unittest.TestCase):
         fn.assert_called_once_with(l._l, 'base', 'sc', 'fi', mock.ANY, True)
         self.assertValidAttributes(attr, fn.call_args[0][4])
 
+    def test_ldap_prepare_search(self, dll):
+        attr = ['a1', 'a2']
+        dll.ldap_check_filterW.return_value = 0
+
+        l = wldap.ldap()
+        prepared = l.prepare_search('base', 'sc', '(cn={})', attr, True)
+        dll.ldap_check_filterW.assert_called_once_with(l._l, '(cn=x)')
+        prepared.search_s('*')
+        fn = dll.ldap_search_sW
+        fn.assert_called_once_with(l._l, 'base', 'sc', '(cn=\\2a)', mock.ANY,
+                                   True, mock.ANY)
+        self.assertValidAttributes(attr, fn.call_args[0][4])
+
     def test_ldap_search_s(self, dll):
         attr = ['a1', 'a2']
         fn = dll.ldap_search_sW
@@ -226,6 +250,17 @@ class TestWldap(unittest.TestCase):
         fn.assert_called_once_with(l._l, 'base', 'sc', 'fi', mock.ANY, True, mock.ANY)
         self.assertValidAttributes([], fn.call_args[0][4])
 
+    def test_ldap_search_iter(self, dll):
+        attr = ['a1', 'a2']
+        fn = dll.ldap_searchW
+        fn.return_value = 42
+
+        l = wldap.ldap()
+        it = l.search_iter('base', 'sc', 'fi', attr, True)
+        fn.assert_called_once_with(l._l, 'base', 'sc', 'fi', mock.ANY, True)
+        self.assertValidAttributes(attr, fn.call_args[0][4])
+        self.assertEqual(it._msgid, 42)
+
     def test_ldap_simple_bind(self, dll):
         args = ('dn', 'password')
         self.assert_forward(dll, 'simple_bind', args, 'simple_bindW')
@@ -0,0 +1,249 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import filter as filters
+from wldap import protocol
+from wldap.memory import Directory, MemoryBackend, VirtualClock
+from wldap.wldap32_constants import LDAP_BUSY, LDAP_COMPARE_TRUE
+from wldap.wldap32_constants import LDAP_MSG_ALL, LDAP_NO_SUCH_OBJECT
+from wldap.wldap32_constants import LDAP_NOT_ALLOWED_ON_NONLEAF
+from wldap.wldap32_constants import LDAP_PROTOCOL_ERROR, LDAP_SCOPE_BASE
+from wldap.wldap32_constants import LDAP_SCOPE_ONELEVEL, LDAP_SCOPE_SUBTREE
+from wldap.wldap32_constants import LDAP_SUCCESS
+from wldap.wldap32_constants import LDAP_UNAVAILABLE_CRIT_EXTENSION
+from wldap.wldap32_structures import LDAPMod
+from tests.mock_dll import use_backend
+
+
+BASE = 'dc=example,dc=com'
+
+
+def _directory(people=2):
+    directory = Directory()
+    directory.add(BASE, [('objectClass', ['domain'])])
+    directory.add('ou=people,' + BASE, [('objectClass', ['ou'])])
+    for idx in range(people):
+        directory.add('cn=user%d,ou=people,%s' % (idx, BASE), [
+            ('objectClass', ['person']), ('cn', ['user%d' % idx]),
+            ('uid', [str(idx)])])
+    return directory
+
+
+def _search(base, scope, text, attributes=()):
+    return protocol.SearchRequest(base, scope, 0, 0, 0, False,
+                                  filters.parse(text), list(attributes))
+
+
+class TestDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = _directory()
+
+    def entries(self, base, scope, text='(objectClass=*)'):
+        responses = self.directory.process(_search(base, scope, text))
+        self.assertEqual(responses[-1].code, LDAP_SUCCESS)
+        return [response.dn for response in responses[:-1]]
+
+    def test_scopes(self):
+        self.assertEqual(self.entries(BASE, LDAP_SCOPE_BASE), [BASE])
+        self.assertEqual(self.entries(BASE, LDAP_SCOPE_ONELEVEL),
+                         ['ou=people,' + BASE])
+        self.assertEqual(len(self.entries(BASE, LDAP_SCOPE_SUBTREE)), 4)
+        self.assertEqual(self.entries('OU=People, ' + BASE,
+                                      LDAP_SCOPE_SUBTREE, '(uid>=1)'),
+                         ['cn=user1,ou=people,' + BASE])
+
+    def test_missing_base(self):
+        responses = self.directory.process(
+            _search('dc=missing', LDAP_SCOPE_BASE, '(cn=*)'))
+        self.assertEqual(responses[0].code, LDAP_NO_SUCH_OBJECT)
+
+    def test_updates(self):
+        dn = 'cn=user0,ou=people,' + BASE
+        self.directory.process(protocol.ModifyRequest(dn, [
+            (LDAPMod.LDAP_MOD_REPLACE, 'UID', [b'10'])]))
+        self.assertEqual(self.entries(BASE, LDAP_SCOPE_SUBTREE, '(uid=10)'),
+                         [dn])
+        response, = self.directory.process(
+            protocol.CompareRequest(dn, 'uid', b'10'))
+        self.assertEqual(response.code, LDAP_COMPARE_TRUE)
+
+        response, = self.directory.process(protocol.DelRequest(BASE))
+        self.assertEqual(response.code, LDAP_NOT_ALLOWED_ON_NONLEAF)
+        self.directory.process(protocol.DelRequest(dn))
+        self.assertEqual(len(self.directory), 3)
+
+    def page(self, size, cookie=b'', critical=True):
+        control = protocol.Control(protocol.PAGED_RESULTS_OID, critical,
+                                   protocol.encode_paged_results(size, cookie))
+        responses = self.directory.process_message(protocol.LDAPMessage(
+            3, _search(BASE, LDAP_SCOPE_SUBTREE, '(objectClass=*)'),
+            [control]))
+        self.assertTrue(all(response.msgid == 3 for response in responses))
+        self.assertTrue(all(not response.controls
+                            for response in responses[:-1]))
+        done = responses[-1]
+        if not done.controls:
+            return None, done.op.code, None
+        total, cookie = protocol.decode_paged_results(
+            done.controls[0].value)
+        self.assertEqual(total, 4)
+        return ([response.op.dn for response in responses[:-1]],
+                done.op.code, cookie)
+
+    def test_paged_results(self):
+        first, code, cookie = self.page(3)
+        self.assertEqual((len(first), code, cookie), (3, LDAP_SUCCESS, b'3'))
+        second, code, cookie = self.page(3, cookie)
+        self.assertEqual((len(second), code, cookie), (1, LDAP_SUCCESS, b''))
+        self.assertEqual(first + second, self.entries(BASE,
+                                                      LDAP_SCOPE_SUBTREE))
+        self.assertEqual(self.page(0, b'3'), ([], LDAP_SUCCESS, b''))
+        self.assertEqual(self.page(2, b'x'), (None, LDAP_PROTOCOL_ERROR,
+                                              None))
+
+    def test_critical_controls(self):
+        message = protocol.LDAPMessage(1, protocol.DelRequest(BASE), [
+            protocol.Control('1.2.3', True, None)])
+        response, = self.directory.process_message(message)
+        self.assertEqual(response.op.code, LDAP_UNAVAILABLE_CRIT_EXTENSION)
+        message = message._replace(controls=[
+            protocol.Control('1.2.3', False, None)])
+        response, = self.directory.process_message(message)
+        self.assertEqual(response.op.code, LDAP_NOT_ALLOWED_ON_NONLEAF)
+
+    def test_usn(self):
+        directory = Directory(usn=True)
+        directory.add('', [('objectClass', ['top'])])
+        directory.add(BASE, [('objectClass', ['domain'])])
+        directory.process(protocol.ModifyRequest(BASE, [
+            (LDAPMod.LDAP_MOD_REPLACE, 'description', [b'x'])]))
+        entry = directory.entries[BASE][2]
+        self.assertEqual(entry['usncreated'], [b'1'])
+        self.assertEqual(entry['usnchanged'], [b'2'])
+        directory.add('cn=a,' + BASE, [('cn', ['a'])])
+        directory.process(protocol.DelRequest('cn=a,' + BASE))
+        self.assertEqual(directory.entries[''][2]['highestcommittedusn'],
+                         [b'4'])
+
+
+class TestVirtualClock(unittest.TestCase):
+
+    def test_clock(self):
+        clock = VirtualClock(10.0)
+        clock.sleep(1.5)
+        self.assertEqual(clock.time(), 11.5)
+        clock.advance(5.0)
+        self.assertEqual(clock.time(), 11.5)
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+
+    def use(self, **kwargs):
+        use_backend(self, MemoryBackend(_directory(kwargs.pop('people', 2)),
+                                        clock=self.clock, **kwargs))
+        return wldap.ldap('localhost')
+
+    def test_search(self):
+        l = self.use()
+        msg = l.search_s(BASE, LDAP_SCOPE_SUBTREE, '(uid=*)', ['uid'], False)
+        self.assertEqual(wldap.parse_message(msg), [{'uid': ['0']},
+                                                    {'uid': ['1']}])
+        msg.release()
+        l.simple_bind_s(None, None)
+        l.add_s('cn=new,' + BASE, ('cn', ['new']))
+        l.delete_s('cn=new,' + BASE)
+        l.unbind()
+
+    def test_latency(self):
+        l = self.use(latency={'search': 0.5, 'bind': 0.1}, entry_time=0.01)
+        l.simple_bind_s(None, None)
+        self.assertAlmostEqual(self.clock.time(), 0.1)
+        l.search_s(BASE, LDAP_SCOPE_SUBTREE, '(uid=*)', [], False).release()
+        self.assertAlmostEqual(self.clock.time(), 0.62)
+        l.unbind()
+
+    def test_timeout(self):
+        l = self.use(latency=2.0)
+        future = l.search(BASE, LDAP_SCOPE_SUBTREE, None, [], False)
+        self.assertEqual(l.result(future._msgid, LDAP_MSG_ALL, 1.0), None)
+        self.assertAlmostEqual(self.clock.time(), 1.0)
+        msg = future.result()
+        self.assertEqual(len(msg), 4)
+        self.assertAlmostEqual(self.clock.time(), 2.0)
+        msg.release()
+        l.unbind()
+
+    def test_concurrency(self):
+        # Four concurrent searches on two workers: the last ones wait for the
+        # first ones to complete.
+        l = self.use(latency=1.0, concurrency=2)
+        futures = [l.search(BASE, LDAP_SCOPE_BASE, None, [], False)
+                   for _ in range(4)]
+        wldap.wait_all(futures)
+        self.assertAlmostEqual(self.clock.time(), 2.0)
+        for future in futures:
+            future.result().release()
+        l.unbind()
+
+    def test_errors(self):
+        l = self.use(error_rate={'search': 1.0}, error_code=LDAP_BUSY)
+        l.simple_bind_s(None, None)
+        with self.assertRaises(wldap.LdapError) as context:
+            l.search_s(BASE, LDAP_SCOPE_SUBTREE, None, [], False)
+        self.assertEqual(context.exception.args[1], LDAP_BUSY)
+        l.unbind()
+
+    def test_errors_not_applied(self):
+        l = self.use(error_rate={'delete': 1.0, 'add': 1.0})
+        self.assertRaises(wldap.LdapError, l.delete_s, 'uid=0,' + BASE)
+        self.assertRaises(wldap.LdapError, l.add_s, 'uid=9,' + BASE,
+                          ('uid', ['9']))
+        msg = l.search_s(BASE, LDAP_SCOPE_SUBTREE, '(uid=*)', ['uid'], False)
+        self.assertEqual(wldap.parse_message(msg), [{'uid': ['0']},
+                                                    {'uid': ['1']}])
+        msg.release()
+        l.unbind()
+
+    def test_reproducible(self):
+        def run(seed):
+            self.clock = VirtualClock()
+            l = self.use(jitter=0.1, seed=seed)
+            times = []
+            for _ in range(5):
+                l.simple_bind_s(None, None)
+                times.append(self.clock.time())
+            l.unbind()
+            return times
+        self.assertEqual(run(1), run(1))
+        self.assertNotEqual(run(1), run(2))
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, MemoryBackend, latency={'serach': 1.0})
+        self.assertRaises(ValueError, MemoryBackend, concurrency=0)
@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ctypes import create_string_buffer
+from ctypes import create_string_buffer, create_unicode_buffer
+import pickle
 import unittest
 
 # Mock is standard with Python 3.3 but is an external dependency with 2.x, and
@@ -22,11 +23,19 @@ try:
 except ImportError:
     import mock
 
+import wldap
+from wldap.exceptions import LdapError
 from wldap.message import Message, MessageAttribute, MessageEntry
 from wldap.message import parse_binary_message, parse_message
+from wldap.memory import Directory, MemoryBackend
+from wldap.message import _HAS_VIEWS, parse_message_columns
+from wldap.wldap32_constants import LDAP_NO_SUCH_ATTRIBUTE
+from wldap.wldap32_constants import LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_structures import BerElement
+from tests.mock_dll import patch_dll, use_backend
 
 
-@mock.patch('wldap.wldap32_dll.dll')
+@patch_dll
 class TestMessage(unittest.TestCase):
 
     def test_binary_values(self, dll):
@@ -53,6 +62,53 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(msg_attrb.name, 'test')
         self.assertEqual(list(msg_attrb.values), ['dummy'])
 
+    def test_entry_dn(self, dll):
+        dn = create_unicode_buffer('cn=test')
+        dll.ldap_get_dnW.return_value = dn
+
+        msg_entry = MessageEntry(mock.Mock(), mock.Mock())
+        self.assertEqual(msg_entry.dn, 'cn=test')
+        dll.ldap_memfreeW.assert_called_once_with(dn)
+
+    def test_entry_cache(self, dll):
+        dll.ldap_get_valuesW.return_value = ['dummy']
+
+        msg_entry = MessageEntry(mock.Mock(), mock.Mock())
+        self.assertEqual(list(msg_entry['test'].values), ['dummy'])
+        self.assertEqual(list(msg_entry['TEST'].values), ['dummy'])
+        self.assertEqual(msg_entry.get('test'), ['dummy'])
+        self.assertTrue('test' in msg_entry)
+        self.assertEqual(dll.ldap_get_valuesW.call_count, 1)
+        self.assertEqual(dll.ldap_value_freeW.call_count, 1)
+
+    def test_entry_cache_missing(self, dll):
+        dll.ldap_get_valuesW.return_value = None
+
+        msg_entry = MessageEntry(mock.Mock(), mock.Mock())
+        self.assertFalse('test' in msg_entry)
+        self.assertEqual(msg_entry.get('test', 42), 42)
+        self.assertEqual(list(msg_entry['test'].values), [])
+        self.assertEqual(dll.ldap_get_valuesW.call_count, 1)
+
+    def test_entry_cache_missing_error(self, dll):
+        dll.ldap_err2string.return_value = 'test'
+        dll.ldap_get_valuesW.side_effect = LdapError(LDAP_NO_SUCH_ATTRIBUTE)
+
+        msg_entry = MessageEntry(mock.Mock(), mock.Mock())
+        self.assertFalse('test' in msg_entry)
+
+    def test_entry_to_dict(self, dll):
+        dll.ldap_first_attributeW.return_value = 'a'
+        dll.ldap_next_attributeW.side_effect = ['B', None]
+        dll.ldap_get_valuesW.side_effect = [['1'], ['2', '3']]
+
+        msg_entry = MessageEntry(mock.Mock(), mock.Mock())
+        self.assertEqual(msg_entry.to_dict(), {'a': ['1'], 'B': ['2', '3']})
+        self.assertEqual(msg_entry.to_dict(), {'a': ['1'], 'B': ['2', '3']})
+        self.assertFalse('c' in msg_entry)
+        self.assertEqual(list(msg_entry['b'].values), ['2', '3'])
+        self.assertEqual(dll.ldap_get_valuesW.call_count, 2)
+
     def test_message(self, dll):
         mock_l = mock.Mock()
         mock_m = mock.Mock()
@@ -76,6 +132,15 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(len(message), 3)
         self.assertEqual(sum(1 for item in message), 3)
 
+    def test_message_iter_reuse_entries(self, dll):
+        dll.ldap_first_entry.return_value = 1
+        dll.ldap_next_entry.side_effect = [2, None, 2, None]
+
+        message = Message(mock.Mock(), mock.Mock())
+        first, second = list(message), list(message)
+        self.assertEqual(len(first), 2)
+        self.assertTrue(first[0] is second[0] and first[1] is second[1])
+
     def test_message_entry_iter(self, dll):
         dll.ldap_count_entries.return_value = 3
         dll.ldap_first_attributeW.return_value = 1
@@ -138,6 +203,71 @@ class TestMessage(unittest.TestCase):
         message = Message(mock_l, mock_m)
         self.assertEqual(parse_binary_message(message), expects)
 
+    @unittest.skipUnless(_HAS_VIEWS, 'memoryview.toreadonly is not available')
+    def test_parse_message_binary_views(self, dll):
+        dll.ldap_first_entry.return_value = 'entry_1'
+        dll.ldap_next_entry.return_value = None
+        dll.ldap_first_attributeW.return_value = 'attr'
+        dll.ldap_next_attributeW.return_value = None
+
+        buf = create_string_buffer(b'blob___')
+        res = [mock.Mock(), mock.Mock(), None]
+        res[0].contents.bv_len = 4
+        res[0].contents.bv_val = buf
+        res[1].contents.bv_len = 0
+        res[1].contents.bv_val = None
+        dll.ldap_get_values_lenW.return_value = res
+
+        message = Message(mock.Mock(), mock.Mock())
+        entries = parse_binary_message(message, views=True)
+        view, empty = entries[0]['attr']
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tobytes(), b'blob')
+        self.assertEqual(empty.tobytes(), b'')
+
+        # The views point into the values array, which is only freed with the
+        # message.
+        buf[0:1] = b'B'
+        self.assertEqual(view.tobytes(), b'Blob')
+        self.assertFalse(dll.ldap_value_free_len.called)
+
+        message.release()
+        dll.ldap_value_free_len.assert_called_once_with(res)
+        self.assertRaises(ValueError, view.tobytes)
+        self.assertRaises(ValueError, len, empty)
+
+    @unittest.skipUnless(_HAS_VIEWS, 'memoryview.toreadonly is not available')
+    def test_parse_message_binary_views_derived(self, dll):
+        dll.ldap_first_entry.return_value = 'entry_1'
+        dll.ldap_next_entry.return_value = None
+        dll.ldap_first_attributeW.return_value = 'attr'
+        dll.ldap_next_attributeW.return_value = None
+
+        buf = create_string_buffer(b'blob')
+        res = [mock.Mock(), mock.Mock(), None]
+        for berval in res[:2]:
+            berval.contents.bv_len = 4
+            berval.contents.bv_val = buf
+        dll.ldap_get_values_lenW.return_value = res
+
+        message = Message(mock.Mock(), mock.Mock())
+        view, exported = parse_binary_message(message, views=True)[0]['attr']
+        derived = view[1:]
+        export = pickle.PickleBuffer(exported)
+
+        # Neither the derived view nor the exported one are invalidated, and
+        # the values array is only freed once they are both gone.
+        message.release()
+        self.assertRaises(ValueError, view.tobytes)
+        self.assertEqual(derived.tobytes(), b'lob')
+        self.assertEqual(exported.tobytes(), b'blob')
+        self.assertFalse(dll.ldap_value_free_len.called)
+        del derived
+        self.assertFalse(dll.ldap_value_free_len.called)
+        export.release()
+        del export, exported
+        dll.ldap_value_free_len.assert_called_once_with(res)
+
     def test_parse_message_empty(self, dll):
         dll.ldap_first_entry.return_value = None
 
@@ -145,3 +275,83 @@ class TestMessage(unittest.TestCase):
         mock_m = mock.Mock()
         message = Message(mock_l, mock_m)
         self.assertEqual(parse_message(message), [])
+
+    def test_parse_message_ber_free(self, dll):
+        ber_elements = []
+
+        def first_attribute(ldap, entry, p_ber):
+            ber_elements.append(BerElement())
+            p_ber._obj.contents = ber_elements[-1]
+            return 'attr'
+
+        dll.ldap_first_entry.return_value = 'entry_1'
+        dll.ldap_next_entry.return_value = None
+        dll.ldap_first_attributeW.side_effect = first_attribute
+        dll.ldap_next_attributeW.return_value = None
+        dll.ldap_get_valuesW.return_value = ['value']
+
+        message = Message(mock.Mock(), mock.Mock())
+        self.assertEqual(parse_message(message), [{'attr': ['value']}])
+        self.assertEqual(dll.ber_free.call_count, 1)
+        self.assertEqual(dll.ldap_value_freeW.call_count, 1)
+
+    def test_parse_message_columns(self, dll):
+        dll.ldap_first_entry.return_value = 'entry_1'
+        dll.ldap_next_entry.side_effect = ['entry_2', None]
+        dll.ldap_get_dnW.side_effect = [create_unicode_buffer('cn=1'),
+                                        create_unicode_buffer('cn=2')]
+        dll.ldap_get_valuesW.side_effect = [['1.1'], ['1.2', '1.3'], None,
+                                            ['4']]
+
+        expects = {
+            'dn': ['cn=1', 'cn=2'],
+            'a': [['1.1'], False],
+            'b': [['1.2', '1.3'], ['4']],
+        }
+
+        message = Message(mock.Mock(), mock.Mock())
+        columns = parse_message_columns(message, ['a', 'b'], missing=False)
+        self.assertEqual(columns, expects)
+        self.assertEqual(dll.ldap_memfreeW.call_count, 2)
+        self.assertEqual(dll.ldap_value_freeW.call_count, 3)
+        self.assertFalse(dll.ldap_first_attributeW.called)
+
+    def test_parse_message_columns_empty(self, dll):
+        dll.ldap_first_entry.return_value = None
+
+        message = Message(mock.Mock(), mock.Mock())
+        columns = parse_message_columns(message, ['a'], dn_column='DN')
+        self.assertEqual(columns, {'DN': [], 'a': []})
+
+    def test_parse_message_columns_dn_collision(self, dll):
+        message = Message(mock.Mock(), mock.Mock())
+        self.assertRaises(ValueError, parse_message_columns, message,
+                          ['cn', 'dn'])
+        self.assertFalse(dll.ldap_first_entry.called)
+
+
+class TestParseMessageColumns(unittest.TestCase):
+
+    def setUp(self):
+        directory = Directory()
+        directory.add('dc=com', [('objectClass', ['domain'])])
+        directory.add('cn=a,dc=com', [('objectClass', ['person']),
+                                      ('cn', ['a']), ('mail', ['a@com'])])
+        directory.add('cn=b,dc=com', [('objectClass', ['person']),
+                                      ('cn', ['b'])])
+        use_backend(self, MemoryBackend(directory))
+        self.ldap = wldap.ldap('localhost')
+
+    def tearDown(self):
+        self.ldap.unbind()
+
+    def test_missing(self):
+        for binary in (False, True):
+            msg = self.ldap.search_s('dc=com', LDAP_SCOPE_ONELEVEL, None,
+                                     ['cn', 'mail'], False)
+            columns = parse_message_columns(msg, ['cn', 'mail'], binary,
+                                            missing=False)
+            msg.release()
+            mail = b'a@com' if binary else 'a@com'
+            self.assertEqual(columns['dn'], ['cn=a,dc=com', 'cn=b,dc=com'])
+            self.assertEqual(columns['mail'], [[mail], False])
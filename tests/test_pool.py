@@ -0,0 +1,156 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from wldap.exceptions import Error, LdapError, TimeoutError
+from wldap.pool import LdapPool, is_reachable
+from wldap.wldap32_constants import LDAP_OPT_ON, LDAP_SERVER_DOWN
+from tests.mock_dll import patch_dll
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_factory():
+    sessions = []
+
+    def factory():
+        sessions.append(mock.Mock(_unbound=False))
+        return sessions[-1]
+    return factory, sessions
+
+
+class TestLdapPool(unittest.TestCase):
+
+    def test_min_size(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, min_size=2, max_size=3)
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual(pool.stats['idle'], 2)
+
+    def test_bad_sizes(self):
+        self.assertRaises(ValueError, LdapPool, None, 3, 2)
+        self.assertRaises(ValueError, LdapPool, None, 0, 0)
+
+    def test_reuse(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, validate=None)
+        with pool.connection() as l1:
+            pass
+        with pool.connection() as l2:
+            self.assertEqual(pool.stats['in_use'], 1)
+        self.assertTrue(l1 is l2)
+        self.assertEqual(len(sessions), 1)
+
+    def test_max_size_timeout(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, max_size=1, validate=None)
+        session = pool.acquire()
+        self.assertRaises(TimeoutError, pool.acquire, 0.01)
+        pool.release(session)
+        self.assertTrue(pool.acquire(0) is session)
+
+    def test_wait_stats(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, max_size=1, validate=None)
+        session = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, [session])
+        timer.start()
+        self.assertTrue(pool.acquire(5) is session)
+        timer.join()
+
+        stats = pool.stats
+        self.assertEqual(stats['wait_count'], 1)
+        self.assertTrue(stats['wait_time'] > 0)
+        self.assertEqual(stats['wait_time'], stats['wait_time_max'])
+
+    def test_validate(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, validate=lambda l: l is not sessions[0])
+        pool.release(pool.acquire())
+        session = pool.acquire()
+        self.assertTrue(session is sessions[1])
+        sessions[0].unbind.assert_called_once_with()
+        self.assertEqual(pool.stats['size'], 1)
+
+    def test_idle_timeout(self):
+        clock = FakeClock()
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, min_size=1, idle_timeout=10, validate=None,
+                        clock=clock)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        clock.now = 20
+        self.assertTrue(pool.acquire() is second)
+        first.unbind.assert_called_once_with()
+        self.assertFalse(second.unbind.called)
+        self.assertEqual(pool.stats['size'], 1)
+
+    def test_discard_broken(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, validate=None)
+        with mock.patch('wldap.wldap32_dll.ldap_err2string'):
+            try:
+                with pool.connection():
+                    raise LdapError(LDAP_SERVER_DOWN)
+            except LdapError:
+                pass
+        sessions[0].unbind.assert_called_once_with()
+        self.assertEqual(pool.stats['size'], 0)
+
+    def test_factory_error(self):
+        pool = LdapPool(mock.Mock(side_effect=ValueError), max_size=1)
+        self.assertRaises(ValueError, pool.acquire)
+        self.assertEqual(pool.stats['size'], 0)
+
+    def test_close(self):
+        factory, sessions = make_factory()
+        pool = LdapPool(factory, min_size=1, validate=None)
+        session = pool.acquire()
+        pool.close()
+        self.assertRaises(Error, pool.acquire)
+        pool.release(session)
+        session.unbind.assert_called_once_with()
+
+
+@patch_dll
+class TestIsReachable(unittest.TestCase):
+
+    def test_reachable(self, dll):
+        dll.ldap_get_option.side_effect = \
+            lambda l, opt, p_value: setattr(p_value._obj, 'value', LDAP_OPT_ON)
+        self.assertTrue(is_reachable(mock.Mock(_unbound=False)))
+
+    def test_unreachable(self, dll):
+        self.assertFalse(is_reachable(mock.Mock(_unbound=True)))
+        dll.ldap_err2string.return_value = 'test'
+        dll.ldap_get_option.side_effect = LdapError(LDAP_SERVER_DOWN)
+        self.assertFalse(is_reachable(mock.Mock(_unbound=False)))
@@ -0,0 +1,116 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from wldap import filter as filters
+from wldap import protocol
+from wldap.wldap32_constants import LDAP_RES_ADD, LDAP_RES_SEARCH_ENTRY
+
+
+class TestProtocol(unittest.TestCase):
+
+    def roundtrip(self, op, controls=None):
+        data = bytearray(protocol.encode_message(7, op, controls))
+        message, end = protocol.decode_message(data)
+        self.assertEqual(end, len(data))
+        self.assertEqual(message.msgid, 7)
+        return message
+
+    def test_bind_request(self):
+        # A simple bind of "cn=x" with password "y".
+        data = protocol.encode_message(1, protocol.BindRequest(3, 'cn=x',
+                                                               b'y'))
+        self.assertEqual(data, b'\x30\x11\x02\x01\x01\x60\x0c\x02\x01\x03'
+                               b'\x04\x04cn=x\x80\x01y')
+        message = self.roundtrip(protocol.BindRequest(3, 'cn=x', b'y'))
+        self.assertEqual(message.op, protocol.BindRequest(3, 'cn=x', b'y'))
+
+    def test_requests(self):
+        requests = [
+            protocol.UnbindRequest(),
+            protocol.SearchRequest('dc=example', 2, 0, 10, 0, False,
+                                   filters.parse('(&(cn=a*)(!(uid=1)))'),
+                                   ['cn', 'mail']),
+            protocol.ModifyRequest('cn=a', [(0, 'mail', [b'a@b']),
+                                            (1, 'sn', [])]),
+            protocol.AddRequest('cn=a', [('cn', [b'a']),
+                                         ('objectClass', [b'top', b'x'])]),
+            protocol.DelRequest('cn=a'),
+            protocol.CompareRequest('cn=a', 'cn', b'a'),
+            protocol.AbandonRequest(3),
+        ]
+        for op in requests:
+            self.assertEqual(self.roundtrip(op).op, op)
+
+    def test_responses(self):
+        responses = [
+            protocol.BindResponse(49, '', 'invalid', None),
+            protocol.SearchResultEntry('cn=a', [('cn', [b'a']),
+                                                ('jpegPhoto', [b'\x00\xff'])]),
+            protocol.SearchResultReference(['ldap://a/', 'ldap://b/']),
+            protocol.SearchResultDone(10, 'dc=example', '',
+                                      ['ldap://other/']),
+            protocol.AddResponse(0, '', '', None),
+            protocol.ExtendedResponse(2, '', '', None, '1.2.3', b'v'),
+        ]
+        for op in responses:
+            self.assertEqual(self.roundtrip(op).op, op)
+
+    def test_filters(self):
+        for text in ('(cn=a)', '(cn=*)', '(cn~=a)', '(uid>=1)', '(uid<=1)',
+                     '(cn=a*b*c)', '(cn=*b)', '(cn:dn:1.2:=a)', '(:1.2:=a)',
+                     '(|(a=1)(&(b=2)(c=3)))'):
+            item = filters.parse(text)
+            data = bytearray(protocol.encode_filter(item))
+            element = (data[0], 2, len(data))
+            self.assertEqual(protocol.decode_filter(data, element), item)
+
+    def test_controls(self):
+        controls = [protocol.Control('1.2.840.113556.1.4.319', True, b'\x30'),
+                    protocol.Control('1.2.3', False, None)]
+        message = self.roundtrip(protocol.DelRequest('cn=a'), controls)
+        self.assertEqual(message.controls, controls)
+
+    def test_paged_results(self):
+        value = protocol.encode_paged_results(100, b'cookie')
+        self.assertEqual(protocol.decode_paged_results(value),
+                         (100, b'cookie'))
+        self.assertEqual(protocol.decode_paged_results(
+            protocol.encode_paged_results(0, b'')), (0, b''))
+        self.assertRaises(ValueError, protocol.decode_paged_results, b'\x30')
+
+    def test_incomplete(self):
+        data = protocol.encode_message(1, protocol.DelRequest('cn=a'))
+        for size in range(len(data)):
+            message, offset = protocol.decode_message(bytearray(data[:size]))
+            self.assertEqual((message, offset), (None, 0))
+
+    def test_consecutive(self):
+        data = bytearray(protocol.encode_message(1, protocol.DelRequest('a')) +
+                         protocol.encode_message(2, protocol.DelRequest('b')))
+        first, offset = protocol.decode_message(data)
+        second, offset = protocol.decode_message(data, offset)
+        self.assertEqual([first.op.dn, second.op.dn], ['a', 'b'])
+        self.assertEqual(offset, len(data))
+
+    def test_unsupported(self):
+        data = bytearray(b'\x30\x05\x02\x01\x01\x7f\x00')
+        self.assertRaises(ValueError, protocol.decode_message, data)
+
+    def test_message_type(self):
+        self.assertEqual(protocol.message_type(
+            protocol.AddResponse(0, '', '', None)), LDAP_RES_ADD)
+        self.assertEqual(protocol.message_type(
+            protocol.SearchResultEntry('cn=a', [])), LDAP_RES_SEARCH_ENTRY)
@@ -0,0 +1,124 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import dn
+from wldap.memory import Directory, MemoryBackend
+from wldap.message import parse_message, parse_message_records
+from wldap.records import RecordSet
+from wldap.wldap32_constants import LDAP_SCOPE_ONELEVEL
+from tests.mock_dll import use_backend
+
+
+class TestRecordSet(unittest.TestCase):
+
+    def setUp(self):
+        self.records = RecordSet()
+        self.records.append({'cn': ['a'], 'objectClass': ['top', 'person']})
+        self.records.append({'objectClass': ['top', 'person'], 'mail': ['m']})
+
+    def test_schema(self):
+        self.assertEqual(self.records.schema, ['cn', 'objectClass', 'mail'])
+        self.assertEqual(len(self.records), 2)
+        self.assertEqual(self.records.dns, [])
+
+    def test_record(self):
+        first, second = self.records
+        self.assertEqual(first['cn'], ('a',))
+        self.assertEqual(first['OBJECTCLASS'], ('top', 'person'))
+        self.assertEqual(sorted(first), ['cn', 'objectClass'])
+        self.assertEqual(len(second), 2)
+        self.assertNotIn('cn', second)
+        self.assertRaises(KeyError, lambda: second['cn'])
+        self.assertEqual(second.get('cn'), None)
+        self.assertEqual(first.dn, None)
+
+    def test_interned(self):
+        first, second = self.records
+        self.assertIs(first['objectClass'], second['objectClass'])
+
+    def test_intern_limit(self):
+        records = RecordSet()
+        for idx in range(2000):
+            records.append({'uid': [str(idx)], 'objectClass': ['person']})
+        uid, object_class = records._interned
+        self.assertEqual(uid, [None, None])
+        self.assertEqual(len(object_class[0]), 1)
+        self.assertIs(records[0]['objectClass'], records[-1]['objectClass'])
+
+        records.compact()
+        self.assertIs(records._interned, None)
+        records.append({'uid': ['a'], 'cn': ['a']})
+        self.assertEqual(records[-1].to_dict(), {'uid': ['a'], 'cn': ['a']})
+
+    def test_to_dicts(self):
+        self.assertEqual(self.records.to_dicts(), [
+            {'cn': ['a'], 'objectClass': ['top', 'person']},
+            {'objectClass': ['top', 'person'], 'mail': ['m']}])
+
+    def test_dns(self):
+        records = RecordSet()
+        records.append({'cn': ['a']}, 'cn=a')
+        self.assertEqual(records.dns, ['cn=a'])
+        self.assertEqual(records[0].dn, 'cn=a')
+        self.assertEqual([record.dn for record in records], ['cn=a'])
+
+
+class TestParseMessageRecords(unittest.TestCase):
+
+    def setUp(self):
+        directory = Directory()
+        directory.add('dc=com', [('dc', ['com'])])
+        for name in ('a', 'b', 'c'):
+            directory.add('cn=%s,dc=com' % name, [
+                ('objectClass', ['top', 'person']), ('cn', [name]),
+                ('jpegPhoto', [b'\x00' + name.encode('ascii')])])
+        use_backend(self, MemoryBackend(directory))
+        self.ldap = wldap.ldap('localhost')
+        self.msg = self.ldap.search_s('dc=com', LDAP_SCOPE_ONELEVEL, None,
+                                      ['objectClass', 'cn', 'jpegPhoto'],
+                                      False)
+
+    def tearDown(self):
+        self.msg.release()
+        self.ldap.unbind()
+
+    def test_parse(self):
+        records = parse_message_records(self.msg)
+        self.assertEqual(records.to_dicts(), parse_message(self.msg))
+        self.assertEqual(len(records.schema), 3)
+        self.assertIs(records._interned, None)
+
+    def test_binary(self):
+        records = parse_message_records(self.msg, binary=True)
+        self.assertEqual([record['jpegPhoto'] for record in records],
+                         [(b'\x00a',), (b'\x00b',), (b'\x00c',)])
+
+    def test_with_dn(self):
+        records = parse_message_records(self.msg, with_dn=True)
+        self.assertEqual(records.dns, ['cn=a,dc=com', 'cn=b,dc=com',
+                                       'cn=c,dc=com'])
+        records = parse_message_records(self.msg, with_dn=dn.parse)
+        self.assertEqual(records[1].dn, dn.parse('CN=B,DC=COM'))
@@ -0,0 +1,168 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import filter as filters
+from wldap.memory import Directory, MemoryBackend
+from wldap.replica import Replica
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SCOPE_SUBTREE
+from tests.mock_dll import use_backend
+
+
+FILTERS = [
+    '(objectClass=*)',
+    '(cn=user1)',
+    '(CN=USER1*)',
+    '(cn=*1*)',
+    '(cn=u*r*2)',
+    '(uid>=5)',
+    '(uid<=5)',
+    '(uid=07)',
+    '(cn>=user3)',
+    '(&(objectClass=person)(!(uid=3)))',
+    '(|(mail=*@example.org)(uid=1))',
+    '(mail=*)',
+    '(!(mail=*))',
+    '(:caseIgnoreMatch:=user4)',
+    '(description=a[*]b?)',
+    '(description=a[*)',
+    '(&)',
+    '(|)',
+]
+
+
+class TestReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Directory()
+        self.directory.add('dc=com', [('objectClass', ['domain']),
+                                      ('dc', ['com'])])
+        self.directory.add('ou=people,dc=com', [
+            ('objectClass', ['organizationalUnit']), ('ou', ['people'])])
+        for idx in range(12):
+            attributes = [('objectClass', ['top', 'person']),
+                          ('cn', ['user%d' % idx]), ('uid', [str(idx)])]
+            if idx % 3:
+                domain = 'example.org' if idx % 2 else 'example.com'
+                attributes.append(('mail', ['user%d@%s' % (idx, domain)]))
+            self.directory.add('cn=user%d,ou=people,dc=com' % idx, attributes)
+        self.directory.add('cn=other,dc=com', [
+            ('objectClass', ['person']), ('cn', ['other']),
+            ('description', ['a[*]b?', 'A[*]B?'])])
+        use_backend(self, MemoryBackend(self.directory))
+        self.ldap = wldap.ldap('localhost')
+        self.replica = Replica(indexes=['cn', 'uid'])
+
+    def tearDown(self):
+        self.replica.close()
+        self.ldap.unbind()
+
+    def search(self, filt):
+        return list(self.ldap.search_iter('dc=com', LDAP_SCOPE_SUBTREE, filt,
+                                          ['*'], False, with_dn=True))
+
+    def test_load(self):
+        self.assertEqual(self.replica.load(self.ldap, 'dc=com',
+                                           LDAP_SCOPE_SUBTREE, batch=5), 15)
+        self.assertEqual(len(self.replica), 15)
+        self.assertEqual(self.replica.query(with_dn=True),
+                         self.search('(objectClass=*)'))
+
+    def test_load_paged(self):
+        self.assertEqual(self.replica.load(self.ldap, 'dc=com',
+                                           LDAP_SCOPE_SUBTREE, page_size=4,
+                                           batch=5), 15)
+        self.assertEqual(self.replica.query(with_dn=True),
+                         self.search('(objectClass=*)'))
+
+    def test_query(self):
+        self.replica.load(self.ldap, 'dc=com', LDAP_SCOPE_SUBTREE)
+        entries = self.search('(objectClass=*)')
+        for filt in FILTERS:
+            accept = filters.compile(filt)
+            expected = [entry for entry in entries if accept(entry[1])]
+            self.assertEqual(self.replica.query(filt, with_dn=True), expected,
+                             filt)
+            self.assertEqual(self.replica.count(filt), len(expected), filt)
+
+    def test_scope(self):
+        self.replica.load(self.ldap, 'dc=com', LDAP_SCOPE_SUBTREE)
+        self.assertEqual(self.replica.count(None, 'ou=People,dc=com'), 13)
+        self.assertEqual(self.replica.count(None, 'OU=people, DC=com',
+                                            LDAP_SCOPE_ONELEVEL), 12)
+        self.assertEqual(self.replica.count(None, 'dc=com',
+                                            LDAP_SCOPE_ONELEVEL), 2)
+        self.assertEqual(self.replica.count(None, 'dc=com',
+                                            LDAP_SCOPE_BASE), 1)
+        self.assertEqual(self.replica.count(None, ''), 15)
+
+    def test_attributes(self):
+        self.replica.load(self.ldap, 'dc=com', LDAP_SCOPE_SUBTREE)
+        self.assertEqual(self.replica.query('(cn=user1)', attr=['CN', 'sn']),
+                         [{'cn': ['user1']}])
+
+    def test_put_delete(self):
+        self.replica.put('cn=a,dc=com', {'cn': ['a'], 'uid': ['1']})
+        self.replica.put('CN=A,DC=com', {'cn': ['A'], 'mail': [b'\xff']})
+        self.assertEqual(self.replica.query(with_dn=True),
+                         [('CN=A,DC=com', {'cn': ['A'], 'mail': [b'\xff']})])
+        self.assertEqual(self.replica.count('(uid=*)'), 0)
+        self.replica.delete('cn=a, dc=com')
+        self.assertEqual(len(self.replica), 0)
+        self.assertEqual(self.replica.connection.execute(
+            'SELECT COUNT(*) FROM attribute_values').fetchone()[0], 0)
+
+    def plan(self, filt):
+        sql, params = self.replica._select('e.id', filt, None, None)
+        return ' '.join(str(row) for row in self.replica.connection.execute(
+            'EXPLAIN QUERY PLAN ' + sql, params))
+
+    def test_index(self):
+        for filt in ('(cn=user1*)', '(cn>=user3)'):
+            self.assertIn('SEARCH attribute_values USING INDEX '
+                          'attribute_values_cn (norm', self.plan(filt), filt)
+        for filt in ('(uid=7)', '(uid>=7)', '(uid<=7)'):
+            self.assertIn('SEARCH attribute_values USING INDEX '
+                          'attribute_values_uid_num', self.plan(filt), filt)
+
+    def test_load_error(self):
+        self.replica.put('cn=kept,dc=com', {'cn': ['kept']})
+        with mock.patch.object(self.replica, '_put',
+                               side_effect=[None, ValueError]):
+            self.assertRaises(ValueError, self.replica.load, self.ldap,
+                              'dc=com', LDAP_SCOPE_SUBTREE)
+        self.assertEqual(len(self.replica), 1)
+
+    def test_load_transaction(self):
+        # Within a `with replica:` block, batches are not committed.
+        try:
+            with self.replica:
+                self.replica.load(self.ldap, 'dc=com', LDAP_SCOPE_SUBTREE,
+                                  batch=2)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(len(self.replica), 0)
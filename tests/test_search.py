@@ -0,0 +1,306 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ctypes import string_at
+import unittest
+import uuid
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from wldap import filter as filters
+from wldap.exceptions import LdapError, TimeoutError
+from wldap.message import Message
+from wldap.search import PagedSearch, PreparedSearch, SearchIterator
+from wldap.search import SearchPage
+from wldap.wldap32_constants import LDAP_CONTROL_NOT_FOUND, LDAP_MSG_ALL
+from wldap.wldap32_constants import LDAP_MSG_ONE, LDAP_NO_SUCH_OBJECT
+from wldap.wldap32_constants import LDAP_RES_SEARCH_ENTRY
+from wldap.wldap32_constants import LDAP_RES_SEARCH_REFERENCE
+from wldap.wldap32_constants import LDAP_RES_SEARCH_RESULT
+from wldap.wldap32_constants import LDAP_SIZELIMIT_EXCEEDED
+from wldap.wldap32_structures import LDAP_BERVAL
+from tests.mock_dll import patch_dll
+
+
+@patch_dll
+class TestSearchIterator(unittest.TestCase):
+
+    def _setup(self, dll, msgtypes):
+        # Each search entry message holds a single entry with a single
+        # attribute, which value is the message index.
+        messages = [Message(None, str(idx)) for idx in range(len(msgtypes))]
+        ldap = mock.Mock()
+        ldap.result.side_effect = messages + [None]
+
+        dll.ldap_msgtype.side_effect = lambda msg: msgtypes[int(msg)]
+        dll.ldap_first_entry.side_effect = lambda l, msg: msg
+        dll.ldap_next_entry.return_value = None
+        dll.ldap_first_attributeW.return_value = 'attr'
+        dll.ldap_next_attributeW.return_value = None
+        dll.ldap_get_valuesW.side_effect = lambda l, entry, name: [entry]
+        dll.ldap_result2error.return_value = 0
+        return ldap, messages
+
+    def test_iterate(self, dll):
+        ldap, messages = self._setup(dll, [LDAP_RES_SEARCH_ENTRY,
+                                           LDAP_RES_SEARCH_REFERENCE,
+                                           LDAP_RES_SEARCH_ENTRY,
+                                           LDAP_RES_SEARCH_RESULT])
+
+        entries = list(SearchIterator(ldap, 42))
+        self.assertEqual(entries, [{'attr': ['0']}, {'attr': ['2']}])
+        self.assertTrue(all(msg._message is None for msg in messages))
+        self.assertEqual(dll.ldap_msgfree.call_count, 4)
+        ldap.result.assert_any_call(42, LDAP_MSG_ONE, None)
+        self.assertFalse(ldap.abandon.called)
+
+    def test_iterate_max_buffered(self, dll):
+        ldap, _ = self._setup(dll, [LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_RESULT])
+
+        iterator = SearchIterator(ldap, 42, max_buffered=2)
+        self.assertEqual(next(iterator), {'attr': ['0']})
+        self.assertEqual(ldap.result.call_count, 2)
+        self.assertEqual(next(iterator), {'attr': ['1']})
+        self.assertEqual(ldap.result.call_count, 2)
+        self.assertEqual(next(iterator), {'attr': ['2']})
+        self.assertRaises(StopIteration, next, iterator)
+
+    def test_iterate_error(self, dll):
+        ldap, _ = self._setup(dll, [LDAP_RES_SEARCH_RESULT])
+        dll.ldap_err2string.return_value = 'test'
+        dll.ldap_result2error.return_value = LDAP_NO_SUCH_OBJECT
+
+        self.assertRaises(LdapError, list, SearchIterator(ldap, 42))
+        self.assertEqual(dll.ldap_msgfree.call_count, 1)
+
+    def test_iterate_error_after_entries(self, dll):
+        ldap, _ = self._setup(dll, [LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_RESULT])
+        dll.ldap_err2string.return_value = 'test'
+        dll.ldap_result2error.return_value = LDAP_SIZELIMIT_EXCEEDED
+
+        iterator = SearchIterator(ldap, 42)
+        self.assertEqual(next(iterator), {'attr': ['0']})
+        self.assertEqual(next(iterator), {'attr': ['1']})
+        self.assertRaises(LdapError, next, iterator)
+        self.assertRaises(StopIteration, next, iterator)
+        self.assertFalse(ldap.abandon.called)
+
+    def test_iterate_timeout(self, dll):
+        ldap = mock.Mock()
+        ldap.result.return_value = None
+
+        iterator = SearchIterator(ldap, 42, timeout_seconds=1.5)
+        self.assertRaises(TimeoutError, next, iterator)
+        ldap.result.assert_called_once_with(42, LDAP_MSG_ONE, 1.5)
+
+    def test_iterate_with_dn(self, dll):
+        from ctypes import create_unicode_buffer
+        ldap, _ = self._setup(dll, [LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_RESULT])
+        dll.ldap_get_dnW.return_value = create_unicode_buffer('cn=0')
+
+        entries = list(SearchIterator(ldap, 42, with_dn=True))
+        self.assertEqual(entries, [('cn=0', {'attr': ['0']})])
+
+    def test_close(self, dll):
+        ldap, _ = self._setup(dll, [LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_ENTRY,
+                                    LDAP_RES_SEARCH_RESULT])
+
+        iterator = SearchIterator(ldap, 42, max_buffered=1)
+        next(iterator)
+        iterator.close()
+        ldap.abandon.assert_called_once_with(42)
+        self.assertRaises(StopIteration, next, iterator)
+        iterator.close()
+        self.assertEqual(ldap.abandon.call_count, 1)
+
+
+@patch_dll
+class TestPagedSearch(unittest.TestCase):
+
+    def _setup(self, dll, cookies):
+        # Each page holds a single entry with a single attribute, which value
+        # is the page index. Page index is also used as the message ID.
+        ldap = mock.Mock()
+        ldap._make_attrs.side_effect = lambda attrs: attrs
+        ldap.result.side_effect = lambda msgid, all_, timeout: \
+            Message(None, str(msgid))
+
+        bervals = []
+        cookie_args = []
+        requested_cookies = []
+
+        def search_ext(*args):
+            requested_cookies.append(cookie_args.pop())
+            args[10]._obj.value = len(requested_cookies) - 1
+            return 0
+
+        def create_page_control(l, size, p_cookie, critical, p_control):
+            berval = p_cookie._obj
+            cookie_args.append(string_at(berval.bv_val, berval.bv_len))
+            return 0
+
+        def parse_page_control(l, controls, p_count, p_cookie):
+            cookie = cookies[len(bervals)]
+            bervals.append(LDAP_BERVAL.from_value(cookie))
+            p_cookie._obj.contents = bervals[-1]
+            return 0
+
+        dll.ldap_create_page_controlW.side_effect = create_page_control
+        dll.ldap_search_extW.side_effect = search_ext
+        dll.ldap_parse_page_controlW.side_effect = parse_page_control
+        dll.ldap_first_entry.side_effect = lambda l, msg: msg
+        dll.ldap_next_entry.return_value = None
+        dll.ldap_first_attributeW.return_value = 'attr'
+        dll.ldap_next_attributeW.return_value = None
+        dll.ldap_get_valuesW.side_effect = lambda l, entry, name: [entry]
+        return ldap, requested_cookies
+
+    def test_iterate(self, dll):
+        ldap, requested = self._setup(dll, [b'c1', b'c2', b''])
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10)
+        pages = list(paged)
+        self.assertEqual(pages, [SearchPage([{'attr': ['0']}], b'c1'),
+                                 SearchPage([{'attr': ['1']}], b'c2'),
+                                 SearchPage([{'attr': ['2']}], b'')])
+        self.assertEqual(requested, [b'', b'c1', b'c2'])
+        self.assertEqual(dll.ldap_control_freeW.call_count, 3)
+        self.assertEqual(dll.ber_bvfree.call_count, 3)
+        self.assertEqual(dll.ldap_msgfree.call_count, 3)
+        ldap.result.assert_called_with(2, LDAP_MSG_ALL, None)
+        self.assertFalse(ldap.abandon.called)
+
+    def test_prefetch(self, dll):
+        ldap, requested = self._setup(dll, [b'c1', b''])
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10)
+        next(paged)
+        self.assertEqual(requested, [b'', b'c1'])
+
+    def test_resume(self, dll):
+        ldap, requested = self._setup(dll, [b''])
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10,
+                            cookie=b'c1')
+        self.assertEqual(len(list(paged)), 1)
+        self.assertEqual(requested, [b'c1'])
+
+    def test_no_page_control(self, dll):
+        ldap, _ = self._setup(dll, [])
+        dll.ldap_parse_page_controlW.side_effect = None
+        dll.ldap_parse_page_controlW.return_value = LDAP_CONTROL_NOT_FOUND
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10)
+        self.assertEqual(list(paged), [SearchPage([{'attr': ['0']}], b'')])
+
+    def test_error(self, dll):
+        ldap, _ = self._setup(dll, [b''])
+        dll.ldap_err2string.return_value = 'test'
+        dll.ldap_parse_resultW.side_effect = \
+            lambda l, msg, p_code, *args: setattr(p_code._obj, 'value', 32)
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10)
+        self.assertRaises(LdapError, next, paged)
+        self.assertEqual(dll.ldap_msgfree.call_count, 1)
+
+    def test_close(self, dll):
+        ldap, _ = self._setup(dll, [b'c1', b''])
+
+        paged = PagedSearch(ldap, 'base', 'scope', 'filt', ['attr'], 0, 10)
+        next(paged)
+        paged.close()
+        ldap.abandon.assert_called_once_with(1)
+        self.assertRaises(StopIteration, next, paged)
+
+
+@patch_dll
+class TestPreparedSearch(unittest.TestCase):
+
+    def _setup(self, template, attr=['attr']):
+        ldap = mock.Mock()
+        ldap.check_filter.return_value = True
+        ldap._make_attrs.side_effect = lambda attrs: list(attrs)
+        return ldap, PreparedSearch(ldap, 'base', 'scope', template, attr, 0)
+
+    def test_filter(self, dll):
+        ldap, prepared = self._setup('(&(uid={0})(mail={mail}))')
+        ldap.check_filter.assert_called_once_with('(&(uid=x)(mail=x))')
+        self.assertEqual(prepared.filter('a*', mail=u'(b)\\'),
+                         '(&(uid=a\\2a)(mail=\\28b\\29\\5c))')
+        self.assertEqual(prepared.filter(42, mail=b'c'),
+                         '(&(uid=42)(mail=\\63))')
+        self.assertRaises(IndexError, prepared.filter, mail='c')
+
+    def test_filter_binary(self, dll):
+        guid = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef').bytes_le
+        ldap, prepared = self._setup('(objectGUID={})')
+        self.assertEqual(prepared.filter(guid),
+                         '(objectGUID=\\67\\45\\23\\01\\ab\\89\\ef\\cd'
+                         '\\01\\23\\45\\67\\89\\ab\\cd\\ef)')
+        self.assertEqual(filters.parse(prepared.filter(guid)),
+                         filters.Equality('objectGUID', guid))
+
+    def test_invalid_fields(self, dll):
+        for template in ('(uid={0!r})', '(uid={0:>4})', '(uid={0.real})',
+                         '(uid={0[1]})', '(uid={name.attr})'):
+            self.assertRaises(ValueError, self._setup, template)
+
+    def test_invalid_filter(self, dll):
+        dll.ldap_err2string.return_value = 'test'
+        ldap = mock.Mock()
+        ldap.check_filter.return_value = LdapError(87)
+        self.assertRaises(LdapError, PreparedSearch, ldap, 'base', 'scope',
+                          '(uid={})(', ['attr'], 0)
+
+    def test_search_s(self, dll):
+        ldap, prepared = self._setup('(uid={})')
+        self.assertEqual(ldap._make_attrs.call_count, 1)
+        for value in ('a', 'b'):
+            message = prepared.search_s(value)
+            dll.ldap_search_sW.assert_called_with(
+                ldap._l, 'base', 'scope', '(uid=%s)' % value, ['attr'], 0,
+                mock.ANY)
+            message.release()
+        calls = dll.ldap_search_sW.call_args_list
+        self.assertIs(calls[0][0][4], calls[1][0][4])
+        self.assertEqual(ldap._make_attrs.call_count, 1)
+
+    def test_search(self, dll):
+        ldap, prepared = self._setup('(objectClass=person)')
+        dll.ldap_searchW.return_value = 42
+        prepared.search()
+        dll.ldap_searchW.assert_called_once_with(
+            ldap._l, 'base', 'scope', '(objectClass=person)', ['attr'], 0)
+        ldap._future.assert_called_once_with(42)
+
+    def test_search_iter(self, dll):
+        ldap, prepared = self._setup('(cn={})')
+        dll.ldap_searchW.return_value = 42
+        iterator = prepared.search_iter('a')
+        dll.ldap_searchW.assert_called_once_with(
+            ldap._l, 'base', 'scope', '(cn=a)', ['attr'], 0)
+        self.assertIsInstance(iterator, SearchIterator)
+        self.assertEqual(iterator._msgid, 42)
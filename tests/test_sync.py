@@ -0,0 +1,148 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap.changeset import Changeset
+from wldap.memory import Directory, MemoryBackend
+from wldap.replica import Replica
+from wldap.sync import ADD, DELETE, MODIFY, Change, DictStore, SyncEngine
+from tests.mock_dll import use_backend
+
+
+class TestSyncEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Directory(usn=True)
+        self.directory.add('', [('objectClass', ['top']),
+                                ('dsServiceName', ['CN=DC1'])])
+        self.directory.add('dc=com', [('objectClass', ['domain'])])
+        for name in ('a', 'b', 'c'):
+            self.directory.add('cn=%s,dc=com' % name, [
+                ('objectClass', ['person']), ('cn', [name])])
+        use_backend(self, MemoryBackend(self.directory))
+        self.ldap = wldap.ldap('localhost')
+        self.store = DictStore()
+        self.engine = SyncEngine(self.ldap, self.store, 'dc=com',
+                                 filt='objectClass=person', attr=['cn'])
+        self.changes = []
+        self.engine.subscribe(self.changes.append)
+
+    def tearDown(self):
+        self.ldap.unbind()
+
+    def modify(self, dn, value):
+        changeset = Changeset()
+        changeset.replace('description', [value])
+        self.ldap.modify_s(dn, changeset)
+
+    def test_initial_load(self):
+        self.assertEqual(self.engine.sync(), 3)
+        self.assertEqual(sorted(self.store.dns()),
+                         ['cn=a,dc=com', 'cn=b,dc=com', 'cn=c,dc=com'])
+        self.assertEqual([change.kind for change in self.changes], [ADD] * 3)
+        self.assertEqual(self.changes[0],
+                         Change(ADD, 'cn=a,dc=com', {'cn': ['a']}))
+        self.assertEqual(self.engine.watermark, self.directory.usn)
+        self.assertEqual(self.store.get_state('server'), 'CN=DC1')
+
+    def test_paged(self):
+        engine = SyncEngine(self.ldap, DictStore(), 'dc=com',
+                            filt='(objectClass=person)', attr=['cn'],
+                            page_size=2)
+        self.assertEqual(engine.sync(), 3)
+        self.modify('cn=b,dc=com', 'changed')
+        self.assertEqual(engine.sync(), 1)
+
+    def test_deltas(self):
+        self.engine.sync()
+        del self.changes[:]
+        self.assertEqual(self.engine.sync(), 0)
+
+        self.modify('cn=b,dc=com', 'changed')
+        self.ldap.add_s('cn=d,dc=com', ('objectClass', ['person']),
+                        ('cn', ['d']))
+        self.modify('dc=com', 'not in the filter')
+        self.assertEqual(self.engine.sync(), 2)
+        self.assertEqual(self.changes, [
+            Change(MODIFY, 'cn=b,dc=com', {'cn': ['b']}),
+            Change(ADD, 'cn=d,dc=com', {'cn': ['d']})])
+        self.assertEqual(self.engine.watermark, self.directory.usn)
+        self.assertEqual(len(self.store), 4)
+
+    def test_reconcile(self):
+        self.engine.sync()
+        del self.changes[:]
+        self.ldap.delete_s('cn=a,dc=com')
+        self.assertEqual(self.engine.sync(), 0)
+        self.assertIn('cn=a,dc=com', self.store)
+
+        self.assertEqual(self.engine.sync(reconcile=True), 1)
+        self.assertEqual(self.changes, [Change(DELETE, 'cn=a,dc=com', None)])
+        self.assertNotIn('cn=a,dc=com', self.store)
+
+    def test_server_change(self):
+        self.engine.sync()
+        self.store.put('cn=stale,dc=com', {'cn': ['stale']})
+        changeset = Changeset()
+        changeset.replace('dsServiceName', ['CN=DC2'])
+        self.ldap.modify_s('', changeset)
+        del self.changes[:]
+
+        self.assertEqual(self.engine.sync(), 4)
+        self.assertEqual(sorted(change.kind for change in self.changes),
+                         [DELETE] + [MODIFY] * 3)
+        self.assertEqual(self.store.get_state('server'), 'CN=DC2')
+
+    def test_server_unknown(self):
+        self.engine.sync()
+        changeset = Changeset()
+        changeset.delete('dsServiceName', [])
+        self.ldap.modify_s('', changeset)
+        self.modify('cn=a,dc=com', 'changed')
+        del self.changes[:]
+
+        self.assertEqual(self.engine.sync(), 1)
+        self.assertEqual(self.changes,
+                         [Change(MODIFY, 'cn=a,dc=com', {'cn': ['a']})])
+        self.assertEqual(self.store.get_state('server'), 'CN=DC1')
+
+    def test_subscriber_error(self):
+        self.engine.subscribe(mock.Mock(side_effect=ValueError))
+        with mock.patch('wldap.sync._logger') as logger:
+            self.assertEqual(self.engine.sync(), 3)
+        self.assertEqual(logger.exception.call_count, 3)
+        self.assertEqual(len(self.changes), 3)
+
+    def test_replica(self):
+        replica = Replica(indexes=['cn'])
+        engine = SyncEngine(self.ldap, replica, 'dc=com',
+                            filt='(objectClass=person)', batch=2)
+        self.assertEqual(engine.sync(), 3)
+        self.modify('cn=c,dc=com', 'changed')
+        self.assertEqual(engine.sync(), 1)
+        self.assertEqual(replica.query('(description=changed)', attr=['cn']),
+                         [{'cn': ['c']}])
+        self.assertEqual(replica.get_state('watermark'), self.directory.usn)
+        replica.close()
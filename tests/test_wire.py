@@ -0,0 +1,250 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ctypes import byref, c_ulong
+import socket
+import unittest
+
+# Mock is standard with Python 3.3 but is an external dependency with 2.x, and
+# listed in requirements.txt as such.
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    import wldap
+from wldap import protocol
+from wldap import wldap32_dll
+from wldap.message import parse_binary_message
+from wldap.pool import is_reachable
+from wldap.wire import WireBackend, _parse_host
+from wldap.wldap32_constants import LDAP_ALREADY_EXISTS
+from wldap.wldap32_constants import LDAP_AUTH_METHOD_NOT_SUPPORTED
+from wldap.wldap32_constants import LDAP_FILTER_ERROR
+from wldap.wldap32_constants import LDAP_INVALID_CREDENTIALS, LDAP_MSG_ALL
+from wldap.wldap32_constants import LDAP_NO_SUCH_OBJECT, LDAP_OPT_SIZELIMIT
+from wldap.wldap32_constants import LDAP_PARAM_ERROR, LDAP_RES_ADD
+from wldap.wldap32_constants import LDAP_RES_ANY, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SCOPE_SUBTREE, LDAP_SERVER_DOWN
+from wldap.wldap32_constants import LDAP_SIZELIMIT_EXCEEDED, LDAP_SUCCESS
+from tests.ldap_server import LdapServer
+from tests.mock_dll import use_backend
+
+
+BASE = 'dc=example,dc=com'
+
+
+class TestParseHost(unittest.TestCase):
+
+    def test_parse_host(self):
+        self.assertEqual(_parse_host(None, 389), ('localhost', 389))
+        self.assertEqual(_parse_host('a b', 389), ('a', 389))
+        self.assertEqual(_parse_host('a:636', 389), ('a', 636))
+        self.assertEqual(_parse_host('ldap://a:10/', 389), ('a', 10))
+        self.assertEqual(_parse_host('[::1]:10', 389), ('::1', 10))
+        self.assertEqual(_parse_host('[::1]', 389), ('::1', 389))
+
+
+class TestWireBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LdapServer().start()
+        directory = self.server.directory
+        directory.add(BASE, [('objectClass', ['domain']), ('dc', ['example'])])
+        directory.add('ou=people,' + BASE, [('objectClass', ['ou']),
+                                            ('ou', ['people'])])
+        for name, uid in (('alice', '1'), ('bob', '2')):
+            directory.add('cn=%s,ou=people,%s' % (name, BASE), [
+                ('objectClass', ['person']), ('cn', [name]), ('uid', [uid]),
+                ('userPassword', ['secret-' + name]),
+                ('jpegPhoto', [b'\x00\xff' + name.encode('ascii')])])
+
+        use_backend(self, WireBackend())
+        self.ldap = wldap.ldap('127.0.0.1', self.server.port)
+
+    def tearDown(self):
+        self.ldap.unbind()
+        self.server.stop()
+
+    def search_s(self, filt, scope=LDAP_SCOPE_SUBTREE, attrs=None):
+        msg = self.ldap.search_s(BASE, scope, filt, attrs or [], False)
+        return wldap.parse_message(msg)
+
+    def assertLdapError(self, code, fn, *args):
+        with self.assertRaises(wldap.LdapError) as context:
+            fn(*args)
+        self.assertEqual(context.exception.args[1], code)
+
+    def test_simple_bind(self):
+        self.ldap.simple_bind_s(None, None)
+        self.ldap.simple_bind_s('cn=alice,ou=people,' + BASE, 'secret-alice')
+        self.assertLdapError(LDAP_INVALID_CREDENTIALS, self.ldap.simple_bind_s,
+                             'cn=alice,ou=people,' + BASE, 'secret-bob')
+
+    def test_bind(self):
+        self.ldap.bind_s(None, None, wldap.LDAP_AUTH_SIMPLE)
+        future = self.ldap.bind('cn=bob,ou=people,' + BASE, 'secret-bob',
+                                wldap.LDAP_AUTH_SIMPLE)
+        self.assertEqual(wldap32_dll.ldap_result2error(
+            self.ldap._l, future.result()._message, 0), LDAP_SUCCESS)
+        self.assertLdapError(LDAP_AUTH_METHOD_NOT_SUPPORTED, self.ldap.bind_s,
+                             None, None, wldap.LDAP_AUTH_NEGOTIATE)
+
+    def test_connect(self):
+        self.ldap.connect(1.0)
+        self.assertTrue(is_reachable(self.ldap))
+
+    def test_connect_failure(self):
+        # Bind then release a port, so that nothing is listening on it.
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        l = wldap.ldap('127.0.0.1', port)
+        self.assertLdapError(LDAP_SERVER_DOWN, l.connect)
+        self.assertLdapError(LDAP_SERVER_DOWN, l.search_s, BASE,
+                             LDAP_SCOPE_SUBTREE, None, [], False)
+        l.unbind()
+
+    def test_search_s(self):
+        self.assertEqual(self.search_s('(uid>=2)', attrs=['cn', 'uid']),
+                         [{'cn': ['bob'], 'uid': ['2']}])
+        self.assertEqual(len(self.search_s('(objectClass=*)')), 4)
+        self.assertEqual(self.search_s('(cn=*)', LDAP_SCOPE_ONELEVEL), [])
+
+    def test_search_message(self):
+        msg = self.ldap.search_s('ou=people,' + BASE, LDAP_SCOPE_ONELEVEL,
+                                 '(cn=*)', ['cn'], False)
+        self.assertEqual(len(msg), 2)
+        entries = list(msg)
+        self.assertEqual([entry.dn for entry in entries],
+                         ['cn=alice,ou=people,' + BASE,
+                          'cn=bob,ou=people,' + BASE])
+        self.assertEqual([(a.name, list(a.values)) for a in entries[1]],
+                         [('cn', ['bob'])])
+        msg.release()
+
+    def test_search_binary(self):
+        msg = self.ldap.search_s(BASE, LDAP_SCOPE_SUBTREE, '(cn=alice)',
+                                 ['jpegPhoto'], False)
+        self.assertEqual(parse_binary_message(msg),
+                         [{'jpegPhoto': [b'\x00\xffalice']}])
+        views = parse_binary_message(msg, views=True)
+        self.assertEqual(views[0]['jpegPhoto'][0].tobytes(), b'\x00\xffalice')
+        msg.release()
+
+    def test_search_errors(self):
+        self.assertLdapError(LDAP_FILTER_ERROR, self.ldap.search_s, BASE,
+                             LDAP_SCOPE_SUBTREE, '(cn=', [], False)
+        self.assertLdapError(LDAP_NO_SUCH_OBJECT, self.ldap.search_s,
+                             'dc=missing', LDAP_SCOPE_SUBTREE, None, [],
+                             False)
+
+    def test_search_sizelimit(self):
+        limit = c_ulong(1)
+        wldap32_dll.ldap_set_option(self.ldap._l, LDAP_OPT_SIZELIMIT,
+                                    byref(limit))
+        self.assertLdapError(LDAP_SIZELIMIT_EXCEEDED, self.ldap.search_s,
+                             BASE, LDAP_SCOPE_SUBTREE, None, [], False)
+
+    def test_search_future(self):
+        future = self.ldap.search(BASE, LDAP_SCOPE_SUBTREE, '(uid=*)', ['uid'],
+                                  False)
+        self.assertEqual(wldap.parse_message(future.result(5)),
+                         [{'uid': ['1']}, {'uid': ['2']}])
+
+    def test_search_paged(self):
+        pages = list(self.ldap.search_paged(BASE, LDAP_SCOPE_SUBTREE,
+                                            '(objectClass=*)', ['cn'], False,
+                                            page_size=3, with_dn=True))
+        self.assertEqual([len(page.entries) for page in pages], [3, 1])
+        self.assertEqual(pages[-1].cookie, b'')
+        resumed = self.ldap.search_paged(BASE, LDAP_SCOPE_SUBTREE,
+                                         '(objectClass=*)', ['cn'], False,
+                                         page_size=3, cookie=pages[0].cookie,
+                                         with_dn=True)
+        self.assertEqual([page.entries for page in resumed],
+                         [pages[1].entries])
+
+    def test_search_iter(self):
+        entries = self.ldap.search_iter(BASE, LDAP_SCOPE_SUBTREE, '(uid=*)',
+                                        ['uid'], False, with_dn=True,
+                                        max_buffered=1)
+        self.assertEqual(list(entries),
+                         [('cn=alice,ou=people,' + BASE, {'uid': ['1']}),
+                          ('cn=bob,ou=people,' + BASE, {'uid': ['2']})])
+
+    def test_dispatcher(self):
+        self.ldap.enable_dispatcher()
+        futures = [self.ldap.search(BASE, LDAP_SCOPE_SUBTREE, '(uid=%d)' % i,
+                                    ['uid'], False) for i in (1, 2)]
+        wldap.wait_all(futures, 5)
+        self.assertEqual([wldap.parse_message(f.result()) for f in futures],
+                         [[{'uid': ['1']}], [{'uid': ['2']}]])
+
+    def test_add_modify_delete(self):
+        dn = 'cn=carol,ou=people,' + BASE
+        self.ldap.add_s(dn, ('objectClass', ['person']), ('cn', ['carol']))
+        self.assertLdapError(LDAP_ALREADY_EXISTS, self.ldap.add_s, dn,
+                             ('cn', ['carol']))
+
+        changeset = wldap.Changeset()
+        changeset.add('mail', ['carol@example.com'])
+        changeset.replace_binary('jpegPhoto', [b'\x00\x01'])
+        self.ldap.modify_s(dn, changeset)
+        msg = self.ldap.search_s(dn, wldap.LDAP_SCOPE_BASE, None, [], False)
+        self.assertEqual(parse_binary_message(msg), [{
+            'objectClass': [b'person'], 'cn': [b'carol'],
+            'mail': [b'carol@example.com'], 'jpegPhoto': [b'\x00\x01']}])
+
+        self.ldap.delete_s(dn)
+        self.assertLdapError(LDAP_NO_SUCH_OBJECT, self.ldap.delete_s, dn)
+
+    def test_async_add(self):
+        future = self.ldap.add('cn=dave,' + BASE, ('cn', ['dave']))
+        msg = future.result(5)
+        self.assertEqual(wldap32_dll.ldap_msgtype(msg._message), LDAP_RES_ADD)
+        self.assertEqual(wldap32_dll.ldap_result2error(
+            self.ldap._l, msg._message, 0), LDAP_SUCCESS)
+        self.assertEqual(self.search_s('(cn=dave)', attrs=['cn']),
+                         [{'cn': ['dave']}])
+
+    def test_compare(self):
+        dn = 'cn=alice,ou=people,' + BASE
+        self.assertTrue(wldap32_dll.ldap_compare_s(self.ldap._l, dn, 'uid',
+                                                   '1'))
+        self.assertFalse(wldap32_dll.ldap_compare_s(self.ldap._l, dn, 'uid',
+                                                    '2'))
+        self.assertRaises(wldap.LdapError, wldap32_dll.ldap_compare_s,
+                          self.ldap._l, 'cn=nobody,' + BASE, 'uid', '1')
+
+    def test_abandon(self):
+        future = self.ldap.search(BASE, LDAP_SCOPE_SUBTREE, None, [], False)
+        self.assertTrue(future.cancel())
+        self.assertFalse(self.ldap.abandon(future._msgid))
+
+        # The session goes on, and the abandoned search results are dropped.
+        self.assertEqual(len(self.search_s('(cn=*)')), 2)
+        self.assertIn(protocol.AbandonRequest(future._msgid),
+                      self.server.requests)
+
+    def test_result_timeout(self):
+        # Nothing is outstanding: waiting for any message just times out.
+        self.assertEqual(self.ldap.result(LDAP_RES_ANY, LDAP_MSG_ALL, 0.05),
+                         None)
+        self.assertLdapError(LDAP_PARAM_ERROR, self.ldap.result, 42,
+                             LDAP_MSG_ALL, 0.05)
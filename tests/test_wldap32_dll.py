@@ -21,6 +21,9 @@ try:
 except ImportError:
     import mock
 
+# Wldap opens the wldap at import time, so we have to mock.patch early.
+with mock.patch('ctypes.cdll'):
+    from wldap import wldap32_dll
 from wldap.exceptions import LdapError
 from wldap.wldap32_constants import ReturnCodes
 from wldap.wldap32_dll import (errcheck_compare, errcheck_pointer,
@@ -66,3 +69,27 @@ class TestErrCheck(unittest.TestCase):
 
     def test_errcheck_sentinel_ko(self):
         self.assertRaises(LdapError, errcheck_sentinel, -1, 'func', 'args')
+
+
+class TestUseBackend(unittest.TestCase):
+
+    def test_use_backend(self):
+        backend = mock.Mock()
+        previous = wldap32_dll.use_backend(backend)
+        try:
+            self.assertIs(wldap32_dll.dll, backend)
+            self.assertIs(wldap32_dll.ldap_search, backend.ldap_searchW)
+            wldap32_dll.ldap_abandon('ld', 42)
+            backend.ldap_abandon.assert_called_once_with('ld', 42)
+        finally:
+            self.assertIs(wldap32_dll.use_backend(previous), backend)
+        self.assertIs(wldap32_dll.dll, previous)
+        self.assertIsNot(wldap32_dll.ldap_search, backend.ldap_searchW)
+
+    def test_use_backend_missing(self):
+        previous = wldap32_dll.use_backend(object())
+        try:
+            self.assertRaises(NotImplementedError, wldap32_dll.ldap_search,
+                              'ld', 'base', 0, 'filter', None, 0)
+        finally:
+            wldap32_dll.use_backend(previous)
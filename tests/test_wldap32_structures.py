@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ctypes import string_at
+from ctypes import cast, c_void_p, string_at
+import array
+import gc
 import unittest
 
 from wldap.wldap32_structures import LDAPMod, LDAP_BERVAL, LDAP_TIMEVAL
@@ -26,6 +28,55 @@ class Test_LDAP_BERVAL(unittest.TestCase):
         self.assertEqual(res.bv_len, 5)
         self.assertEqual(string_at(res.bv_val, 5), val)
 
+    def test_from_value_keeps_bytes(self):
+        res = LDAP_BERVAL.from_value(str(12345).encode('ascii') + b' bytes')
+        gc.collect()
+        self.assertEqual(string_at(res.bv_val, res.bv_len), b'12345 bytes')
+
+    def address(self, berval):
+        return cast(berval.bv_val, c_void_p).value
+
+    def test_from_value_bytearray(self):
+        val = bytearray(b'bytearray')
+        res = LDAP_BERVAL.from_value(val)
+        self.assertEqual(res.bv_len, 9)
+
+        # The berval points into the bytearray memory, and keeps it alive.
+        val[0:1] = b'B'
+        self.assertEqual(string_at(res.bv_val, 9), b'Bytearray')
+        address = self.address(res)
+        del val
+        gc.collect()
+        self.assertEqual(string_at(res.bv_val, 9), b'Bytearray')
+        self.assertEqual(self.address(res), address)
+
+    def test_from_value_memoryview(self):
+        buf = bytearray(b'0123456789')
+        res = LDAP_BERVAL.from_value(memoryview(buf)[2:6])
+        self.assertEqual(res.bv_len, 4)
+        self.assertEqual(string_at(res.bv_val, 4), b'2345')
+        buf[2:3] = b'X'
+        self.assertEqual(string_at(res.bv_val, 4), b'X345')
+
+    def test_from_value_readonly_memoryview(self):
+        val = b'read-only'
+        res = LDAP_BERVAL.from_value(memoryview(val))
+        self.assertEqual(string_at(res.bv_val, 9), val)
+
+        # A slice of a read-only buffer can only be copied.
+        res = LDAP_BERVAL.from_value(memoryview(val)[5:])
+        self.assertEqual(string_at(res.bv_val, 4), b'only')
+
+    def test_from_value_array(self):
+        val = array.array('B', [1, 2, 3])
+        res = LDAP_BERVAL.from_value(val)
+        self.assertEqual(res.bv_len, 3)
+        self.assertEqual(string_at(res.bv_val, 3), b'\x01\x02\x03')
+
+    def test_from_value_non_contiguous(self):
+        view = memoryview(bytearray(b'0123456789'))[::2]
+        self.assertRaises(ValueError, LDAP_BERVAL.from_value, view)
+
 
 class Test_LDAP_TIMEVAL(unittest.TestCase):
 
@@ -44,3 +95,14 @@ class Test_LDAPMod(unittest.TestCase):
 
     def test_bad_args(self):
         self.assertRaises(ValueError, LDAPMod, 'op', 'attr')
+
+    def test_bin_values_buffers(self):
+        values = [bytearray(b'photo'), memoryview(bytearray(b'cert'))]
+        mod = LDAPMod(LDAPMod.LDAP_MOD_REPLACE, 'attr', bin_values=values)
+        bvals = mod.mod_vals.modv_bvals
+        self.assertEqual(string_at(bvals[0].contents.bv_val, 5), b'photo')
+        self.assertEqual(string_at(bvals[1].contents.bv_val, 4), b'cert')
+        self.assertFalse(bvals[2])
+
+        # The buffers can't be resized while the LDAPMod points into them.
+        self.assertRaises(BufferError, values[0].extend, b'...')
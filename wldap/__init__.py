@@ -13,7 +13,14 @@
 # limitations under the License.
 
 from wldap.exceptions import LdapError, TimeoutError
+from wldap.future import Future, as_completed, wait, wait_all
 from wldap.ldap import ldap
+from wldap.cache import SearchCache
 from wldap.changeset import Changeset
-from wldap.message import parse_message
+from wldap.decoders import DecoderRegistry
+from wldap.message import parse_message, parse_message_columns
+from wldap.message import parse_message_records
+from wldap.pool import LdapPool
+from wldap.replica import Replica
+from wldap.sync import SyncEngine
 from wldap.wldap32_constants import *
@@ -0,0 +1,165 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module requires asyncio (Python 3.4+), and is therefore not imported by
+# the wldap package itself.
+
+import asyncio
+from ctypes import byref, c_size_t
+
+from wldap import wldap32_dll as dll
+from wldap.wldap32_constants import LDAP_OPT_DESC
+
+
+class AsyncLdap(object):
+    """asyncio facade over a wldap.ldap session.
+
+    Asynchronous operations return asyncio futures. Rather than polling, the
+    session socket (as obtained through LDAP_OPT_DESC) is registered with the
+    event loop, and results are only received when it becomes readable:
+    they go through the session ResultDispatcher (see
+    wldap.ldap.enable_dispatcher), which completes the matching future.
+
+    Note that waiting for a socket readiness requires a selector based event
+    loop (asyncio.SelectorEventLoop on Windows).
+    """
+
+    def __init__(self, ldap, loop=None):
+        """Construct a new AsyncLdap instance, enabling the session
+        ResultDispatcher.
+
+        Args:
+            ldap: a connected wldap.ldap instance
+            loop: the event loop to use, asyncio.get_event_loop() if None
+        """
+        self._dispatcher = ldap.enable_dispatcher()
+        self._fd = None
+        self._ldap = ldap
+        self._loop = loop or asyncio.get_event_loop()
+        self._pending = {}  # msgid -> (wldap.Future, asyncio.Future)
+
+    def _get_socket(self):
+        # Cf. MSDN ldap_get_option documentation: LDAP_OPT_DESC gives the
+        # socket descriptor (a SOCKET, which is pointer sized) of the session.
+        sock = c_size_t()
+        dll.ldap_get_option(self._ldap._l, LDAP_OPT_DESC, byref(sock))
+        return sock.value
+
+    def _on_cancelled(self, msgid, aio_future):
+        if aio_future.cancelled() and msgid in self._pending:
+            # Cancelling the wldap Future abandons the operation, and
+            # unregisters it from the dispatcher.
+            future, _ = self._pending.pop(msgid)
+            future.cancel()
+            self._unwatch_if_idle()
+
+    def _on_done(self, future):
+        # Called once the dispatcher routed the result of `future`. The
+        # asyncio future may have been cancelled meanwhile (for example by
+        # asyncio.wait_for), before _on_cancelled was called.
+        _, aio_future = self._pending.pop(future._msgid, (None, None))
+        if aio_future is None or aio_future.done():
+            return
+        exception = future.exception(0)
+        if exception is not None:
+            aio_future.set_exception(exception)
+        else:
+            aio_future.set_result(future.result(0))
+
+    def _on_readable(self):
+        # Receive the available results with a zero timeout: at this point
+        # data is available, so this makes one ldap_result call per result,
+        # whatever the number of outstanding operations.
+        try:
+            while self._pending and self._dispatcher.poll(0) is not None:
+                pass
+        except Exception as exc:
+            # Such failures are not tied to an operation: they all fail.
+            for msgid, (_, aio_future) in list(self._pending.items()):
+                del self._pending[msgid]
+                if not aio_future.done():
+                    aio_future.set_exception(exc)
+        self._unwatch_if_idle()
+
+    def _unwatch_if_idle(self):
+        if not self._pending and self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _watch(self, future):
+        aio_future = asyncio.Future(loop=self._loop)
+        aio_future.add_done_callback(
+            lambda f, msgid=future._msgid: self._on_cancelled(msgid, f))
+        self._pending[future._msgid] = (future, aio_future)
+        future.add_done_callback(self._on_done)
+
+        if self._fd is None and self._pending:
+            self._fd = self._get_socket()
+            self._loop.add_reader(self._fd, self._on_readable)
+
+        # The response may have been received already by Wldap32.
+        self._loop.call_soon(self._on_readable)
+        return aio_future
+
+    @property
+    def ldap(self):
+        """The underlying wldap.ldap instance."""
+        return self._ldap
+
+    def add(self, dn, *args):
+        """Asynchronous version of wldap.ldap.add, returning an asyncio
+        future.
+        """
+        return self._watch(self._ldap.add(dn, *args))
+
+    def bind(self, dn, cred, method):
+        """Asynchronous version of wldap.ldap.bind, returning an asyncio
+        future.
+        """
+        return self._watch(self._ldap.bind(dn, cred, method))
+
+    def close(self):
+        """Abandon all outstanding operations, and stop watching the session
+        socket.
+        """
+        for msgid, (future, aio_future) in list(self._pending.items()):
+            del self._pending[msgid]
+            future.cancel()
+            aio_future.cancel()
+        self._unwatch_if_idle()
+
+    def delete(self, dn):
+        """Asynchronous version of wldap.ldap.delete, returning an asyncio
+        future.
+        """
+        return self._watch(self._ldap.delete(dn))
+
+    def modify(self, dn, changeset):
+        """Asynchronous version of wldap.ldap.modify, returning an asyncio
+        future.
+        """
+        return self._watch(self._ldap.modify(dn, changeset))
+
+    def search(self, base, scope, filt, attr, attronly):
+        """Asynchronous version of wldap.ldap.search, returning an asyncio
+        future which result is a Message.
+        """
+        return self._watch(self._ldap.search(base, scope, filt, attr,
+                                             attronly))
+
+    def simple_bind(self, dn, passwd):
+        """Asynchronous version of wldap.ldap.simple_bind, returning an
+        asyncio future.
+        """
+        return self._watch(self._ldap.simple_bind(dn, passwd))
@@ -0,0 +1,792 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Base class for the pure Python implementations of the Wldap32 functions.
+
+A Backend exposes the functions of wldap32_dll.exposed_functions under their
+Wldap32 names, with the same arguments and return values, so that it can be
+installed through wldap32_dll.use_backend. Sessions, messages, entries and
+BerElements are opaque ctypes pointers, as they are with Wldap32.
+
+Subclasses provide the transport of protocol.LDAPMessage objects (see the
+Backend._open, _connect, _write, _read and _close methods), while the Backend
+takes care of message IDs, of queuing the responses until ldap_result asks
+for them, and of exposing these responses through the LDAPMessage* API.
+"""
+
+from collections import OrderedDict, deque
+from ctypes import POINTER, addressof, c_char, c_size_t, c_ulong, c_void_p
+from ctypes import c_wchar, c_wchar_p, cast, create_unicode_buffer, pointer
+from ctypes import string_at
+from itertools import takewhile
+import threading
+import time
+
+from wldap import filter as filters
+from wldap import protocol
+from wldap import wldap32_dll
+from wldap.wldap32_constants import LDAP_AUTH_METHOD_NOT_SUPPORTED
+from wldap.wldap32_constants import LDAP_AUTH_SIMPLE, LDAP_CONTROL_NOT_FOUND
+from wldap.wldap32_constants import LDAP_DECODING_ERROR, LDAP_FILTER_ERROR
+from wldap.wldap32_constants import LDAP_MSG_ALL, LDAP_MSG_ONE
+from wldap.wldap32_constants import LDAP_NO_SUCH_ATTRIBUTE, LDAP_OPT_DEREF
+from wldap.wldap32_constants import LDAP_OPT_DESC, LDAP_OPT_HOST_REACHABLE
+from wldap.wldap32_constants import LDAP_OPT_OFF, LDAP_OPT_ON
+from wldap.wldap32_constants import LDAP_OPT_PROTOCOL_VERSION
+from wldap.wldap32_constants import LDAP_OPT_SIZELIMIT, LDAP_OPT_TIMELIMIT
+from wldap.wldap32_constants import LDAP_PARAM_ERROR, LDAP_RES_ANY
+from wldap.wldap32_constants import LDAP_SERVER_DOWN, LDAP_SUCCESS
+from wldap.wldap32_constants import ReturnCodes
+from wldap.wldap32_structures import BerElement, LDAP, LDAP_BERVAL
+from wldap.wldap32_structures import LDAP_TIMEVAL, LDAPControl, LDAPMessage
+from wldap.wldap32_structures import LDAPMod
+
+
+_ERROR_STRINGS = dict((code, name[len('LDAP_'):].replace('_', ' ').lower())
+                      for name, code in vars(ReturnCodes).items()
+                      if name.startswith('LDAP_'))
+_ERROR_STRINGS[LDAP_SUCCESS] = 'success'
+
+_MAX_MSGID = 0x7fffffff
+
+
+class BackendError(Exception):
+    """Raised within a Backend to fail the current API call with the LDAP
+    error `code`, which is then reported as Wldap32 would (through the
+    function return value and LdapGetLastError).
+    """
+
+    def __init__(self, code):
+        super(BackendError, self).__init__(code)
+        self.code = code
+
+
+class Session(object):
+    """State of an LDAP session: options, and the received responses which
+    were not obtained through ldap_result yet, queued by message ID in order
+    of arrival.
+    """
+
+    def __init__(self, host, port):
+        self.completed = set()  # Message IDs whose final response is queued
+        self.error = None  # Error code once the session is unusable
+        self.host = host
+        self.lock = threading.Condition()
+        self.next_msgid = 1
+        self.options = {
+            LDAP_OPT_DEREF: 0,
+            LDAP_OPT_PROTOCOL_VERSION: 3,
+            LDAP_OPT_SIZELIMIT: 0,
+            LDAP_OPT_TIMELIMIT: 0,
+        }
+        self.outstanding = set()  # Message IDs awaiting a response
+        self.port = port
+        self.queues = OrderedDict()
+        self.reading = False
+
+
+class _Message(object):
+
+    def __init__(self, msgid, ops, controls=None):
+        last = ops[-1]
+        self.controls = controls or []  # Those of the final response
+        self.entries = [op for op in ops
+                        if type(op) is protocol.SearchResultEntry]
+        self.entry_handles = []
+        self.msgid = msgid
+        self.msgtype = protocol.message_type(last if protocol.is_result(last)
+                                             else ops[0])
+        self.result = last if protocol.is_result(last) else None
+
+
+class _Entry(object):
+
+    def __init__(self, message, index):
+        self.index = index
+        self.message = message
+        self.op = message.entries[index]
+
+
+class _AttributeIterator(object):
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+        self.index = 0
+
+    def next_name(self):
+        if self.index >= len(self.attributes):
+            return None
+        self.index = self.index + 1
+        return self.attributes[self.index - 1][0]
+
+
+def _address(value):
+    # Handles and output parameters come either as ctypes pointers, as byref()
+    # objects or as None.
+    return cast(value, c_void_p).value
+
+
+def _write_pointer(out, handle):
+    if out is not None:
+        c_void_p.from_address(_address(out)).value = _address(handle)
+
+
+def _write_ulong(out, value):
+    if out is not None:
+        c_ulong.from_address(_address(out)).value = value
+
+
+def _timeout(timeval):
+    # Convert a LDAP_TIMEVAL* (possibly NULL) to fractional seconds, or None.
+    if timeval is None or not _address(timeval):
+        return None
+    tv = cast(timeval, LDAP_TIMEVAL.pointer).contents
+    return tv.tv_sec + tv.tv_usec / 1e6
+
+
+def _strings(array):
+    # Values come as a nul-terminated PCHAR* array, which may be NULL.
+    if not array:
+        return []
+    return list(takewhile(bool, array))
+
+
+def _bervals(array):
+    # Values come as a nul-terminated berval** array, which may be NULL.
+    values = []
+    idx = 0
+    while array and array[idx]:
+        berval = array[idx].contents
+        values.append(string_at(berval.bv_val, berval.bv_len)
+                      if berval.bv_len else b'')
+        idx = idx + 1
+    return values
+
+
+def _controls(array):
+    """Read a nul-terminated LDAPControl* array, which may be NULL, to a list
+    of protocol.Control.
+    """
+    controls = []
+    idx = 0
+    while array and array[idx]:
+        control = array[idx].contents
+        value = control.ldctl_value
+        controls.append(protocol.Control(
+            control.ldctl_oid, bool(control.ldctl_iscritical),
+            string_at(value.bv_val, value.bv_len) if value.bv_val else None))
+        idx = idx + 1
+    return controls
+
+
+def _modifications(mods):
+    """Read a nul-terminated LDAPMod* array to a list of (operation,
+    attribute, [values]) triples, with values as bytes.
+    """
+    changes = []
+    idx = 0
+    while mods and mods[idx]:
+        mod = mods[idx].contents
+        if mod.mod_op & LDAPMod.LDAP_MOD_BVALUES:
+            values = _bervals(mod.mod_vals.modv_bvals)
+        else:
+            values = [value.encode('utf-8')
+                      for value in _strings(mod.mod_vals.modv_strvals)]
+        changes.append((mod.mod_op & ~LDAPMod.LDAP_MOD_BVALUES, mod.mod_type,
+                        values))
+        idx = idx + 1
+    return changes
+
+
+def _result_code(ops):
+    return ops[-1].op.code
+
+
+class Backend(object):
+    """Implementation of the Wldap32 functions on top of a transport for
+    protocol.LDAPMessage objects, to be provided by subclasses.
+
+    Search requests may carry server controls (ldap_search_ext), of which the
+    paged results control has its dedicated functions. The structures these
+    functions return (controls and cookies) live until freed through the
+    matching Wldap32 function.
+    """
+
+    def __init__(self):
+        self._handles = {}
+        self._local = threading.local()
+
+        # Bind the functions under their Wldap32 names. As with ctypes, those
+        # which have an errcheck report their failures through their return
+        # value, which then goes through that errcheck.
+        for template in wldap32_dll._function_templates:
+            fn = getattr(self, template.exported_name, None)
+            if fn is None:
+                continue
+            if template.errcheck is not None:
+                fn = self._checked(fn, template)
+            setattr(self, template.api_name, fn)
+
+    def _checked(self, fn, template):
+        errcheck = template.errcheck
+        sentinel = errcheck is wldap32_dll.errcheck_sentinel
+        retcode = template.restype is c_ulong
+
+        def _call(*args):
+            self._local.code = LDAP_SUCCESS
+            try:
+                result = fn(*args)
+            except BackendError as e:
+                self._local.code = e.code
+                result = -1 if sentinel else (e.code if retcode else None)
+            return errcheck(result, _call, args)
+        return _call
+
+    ###########################################################################
+    # Handles
+
+    def _register(self, obj, pointer_type):
+        # Each handle owns a distinct (one byte) memory block, which address
+        # identifies it.
+        block = (c_char * 1)()
+        self._handles[addressof(block)] = (obj, block)
+        return cast(block, pointer_type)
+
+    def _find(self, handle, kind):
+        item = self._handles.get(_address(handle))
+        if item is None or not isinstance(item[0], kind):
+            return None
+        return item[0]
+
+    def _lookup(self, handle, kind):
+        obj = self._find(handle, kind)
+        if obj is None:
+            raise BackendError(LDAP_PARAM_ERROR)
+        return obj
+
+    def _release(self, handle):
+        self._handles.pop(_address(handle), None)
+
+    def _allocate(self, obj, pointer_type, *refs):
+        # Keep a returned ctypes object, and the objects its memory points
+        # into, alive until released.
+        self._handles[addressof(obj)] = (obj, refs)
+        return cast(addressof(obj), pointer_type)
+
+    def _control(self, control):
+        # Return an LDAPControl* for the protocol.Control `control`.
+        value = control.value
+        structure = LDAPControl(control.oid)
+        structure.ldctl_iscritical = bool(control.critical)
+        if value is not None:
+            structure.ldctl_value = LDAP_BERVAL.from_value(value)
+        return self._allocate(structure, LDAPControl.pointer, value)
+
+    def _entry_handle(self, message, index):
+        if index >= len(message.entries):
+            return LDAPMessage.pointer()
+        while len(message.entry_handles) <= index:
+            entry = _Entry(message, len(message.entry_handles))
+            message.entry_handles.append(self._register(entry,
+                                                        LDAPMessage.pointer))
+        return message.entry_handles[index]
+
+    ###########################################################################
+    # Transport, to be implemented by subclasses
+
+    def _open(self, host, port):
+        """Return the Session for `host` and `port`, without connecting."""
+        return Session(host, port)
+
+    def _connect(self, session, timeout):
+        """Establish the connection of `session`, if not already done."""
+        pass
+
+    def _write(self, session, msgid, op, controls=None):
+        """Send the protocol operation `op` as message `msgid`, along with
+        the list of protocol.Control `controls`, if any.
+        """
+        raise NotImplementedError()
+
+    def _read(self, session, timeout):
+        """Wait at most `timeout` seconds (indefinitely if None) for incoming
+        messages, and return the (possibly empty) list of those received.
+        """
+        raise NotImplementedError()
+
+    def _close(self, session):
+        """Unbind and close `session`."""
+        pass
+
+    def _descriptor(self, session):
+        """Return the socket descriptor of `session` (LDAP_OPT_DESC)."""
+        raise BackendError(LDAP_PARAM_ERROR)
+
+    def _time(self):
+        """Return the current time, in fractional seconds, against which the
+        ldap_result timeouts are measured.
+        """
+        return time.time()
+
+    ###########################################################################
+    # Messages
+
+    def _next_msgid(self, session):
+        with session.lock:
+            if session.error is not None:
+                raise BackendError(session.error)
+            msgid = session.next_msgid
+            session.next_msgid = msgid % _MAX_MSGID + 1
+            return msgid
+
+    def _send(self, session, op, controls=None):
+        """Send a request, and return its message ID."""
+        msgid = self._next_msgid(session)
+        with session.lock:
+            session.outstanding.add(msgid)
+        try:
+            self._write(session, msgid, op, controls)
+        except BackendError:
+            with session.lock:
+                session.outstanding.discard(msgid)
+            raise
+        return msgid
+
+    def _dispatch(self, session, messages):
+        # Queue the received messages: must be called with the session lock.
+        for message in messages:
+            msgid = message.msgid
+            if msgid == 0:
+                # Unsolicited notification, that is a notice of disconnection.
+                session.error = LDAP_SERVER_DOWN
+            elif msgid in session.outstanding:  # Else it was abandoned
+                session.queues.setdefault(msgid, deque()).append(message)
+                if protocol.is_result(message.op):
+                    session.completed.add(msgid)
+
+    def _take(self, session, msgid, all_):
+        # Dequeue the messages to return from ldap_result, if any: must be
+        # called with the session lock.
+        if msgid == LDAP_RES_ANY:
+            candidates = list(session.queues)
+        else:
+            candidates = [msgid] if msgid in session.queues else []
+
+        for candidate in candidates:
+            queue = session.queues[candidate]
+            if all_ == LDAP_MSG_ALL:
+                if candidate not in session.completed:
+                    continue
+                ops = list(queue)
+            elif all_ == LDAP_MSG_ONE:
+                ops = [queue[0]]
+            else:  # LDAP_MSG_RECEIVED
+                ops = list(queue)
+
+            for _ in ops:
+                queue.popleft()
+            if not queue:
+                del session.queues[candidate]
+                if candidate in session.completed:
+                    session.completed.discard(candidate)
+                    session.outstanding.discard(candidate)
+            return ops
+        return None
+
+    def _receive(self, session, msgid, all_, timeout):
+        """Wait for the responses to `msgid` (LDAP_RES_ANY for any request),
+        as ldap_result does.
+
+        Returns the list of received protocol.LDAPMessage, or None on timeout.
+        A single thread reads from the transport at a time, while the others
+        wait for it to queue what it received.
+        """
+        deadline = None if timeout is None else self._time() + timeout
+        attempted = False
+        with session.lock:
+            while True:
+                ops = self._take(session, msgid, all_)
+                if ops:
+                    return ops
+                if session.error is not None:
+                    raise BackendError(session.error)
+                if msgid != LDAP_RES_ANY and msgid not in session.outstanding:
+                    raise BackendError(LDAP_PARAM_ERROR)
+
+                remaining = None
+                if deadline is not None:
+                    remaining = max(deadline - self._time(), 0)
+                    if attempted and remaining == 0:
+                        return None
+                attempted = True
+
+                if session.reading:
+                    session.lock.wait(remaining)
+                    continue
+                session.reading = True
+                session.lock.release()
+                error = None
+                try:
+                    messages = self._read(session, remaining)
+                except BackendError as e:
+                    messages, error = [], e.code
+                finally:
+                    session.lock.acquire()
+                    session.reading = False
+                    session.lock.notify_all()
+                if error is not None:
+                    session.error = error
+                self._dispatch(session, messages)
+
+    def _abandon(self, session, msgid):
+        with session.lock:
+            if msgid not in session.outstanding:
+                raise BackendError(LDAP_PARAM_ERROR)
+            session.completed.discard(msgid)
+            session.outstanding.discard(msgid)
+            session.queues.pop(msgid, None)
+        self._write(session, self._next_msgid(session),
+                    protocol.AbandonRequest(msgid))
+
+    ###########################################################################
+    # Requests
+
+    def _session(self, ld):
+        return self._lookup(ld, Session)
+
+    def _request(self, ld, op, controls=None):
+        return self._send(self._session(ld), op, controls)
+
+    def _request_s(self, ld, op):
+        session = self._session(ld)
+        return self._receive(session, self._send(session, op), LDAP_MSG_ALL,
+                             None)
+
+    def _search_request(self, ld, base, scope, filt, attrs, attrsonly):
+        try:
+            parsed = filters.parse(filt or '(objectClass=*)')
+        except ValueError:
+            raise BackendError(LDAP_FILTER_ERROR)
+        options = self._session(ld).options
+        return protocol.SearchRequest(base or '', scope,
+                                      options[LDAP_OPT_DEREF],
+                                      options[LDAP_OPT_SIZELIMIT],
+                                      options[LDAP_OPT_TIMELIMIT],
+                                      bool(attrsonly), parsed,
+                                      _strings(attrs))
+
+    @staticmethod
+    def _bind_request(dn, cred, method):
+        if method != LDAP_AUTH_SIMPLE:
+            raise BackendError(LDAP_AUTH_METHOD_NOT_SUPPORTED)
+        return protocol.BindRequest(3, dn or '', cred or '')
+
+    @staticmethod
+    def _add_request(dn, attrs):
+        return protocol.AddRequest(dn, [(name, values) for _, name, values
+                                        in _modifications(attrs)])
+
+    @staticmethod
+    def _compare_request(dn, attr, value):
+        return protocol.CompareRequest(dn, attr, (value or '').encode('utf-8'))
+
+    ###########################################################################
+    # Wldap32 functions
+
+    def ber_free(self, ber, fbuf):
+        self._release(ber)
+
+    def ber_bvfree(self, bv):
+        self._release(bv)
+
+    def ldap_abandon(self, ld, msgid):
+        # No errcheck for ldap_abandon: failures are reported by the result.
+        try:
+            self._abandon(self._session(ld), msgid)
+        except BackendError as e:
+            self._local.code = e.code
+            return e.code
+        return LDAP_SUCCESS
+
+    def ldap_add(self, ld, dn, attrs):
+        return self._request(ld, self._add_request(dn, attrs))
+
+    def ldap_add_s(self, ld, dn, attrs):
+        return _result_code(self._request_s(ld, self._add_request(dn, attrs)))
+
+    def ldap_bind(self, ld, dn, cred, method):
+        return self._request(ld, self._bind_request(dn, cred, method))
+
+    def ldap_bind_s(self, ld, dn, cred, method):
+        return _result_code(self._request_s(ld, self._bind_request(dn, cred,
+                                                                   method)))
+
+    def ldap_check_filter(self, ld, filt):
+        try:
+            filters.parse(filt or '')
+        except ValueError:
+            return LDAP_FILTER_ERROR
+        return LDAP_SUCCESS
+
+    def ldap_cleanup(self, instance):
+        return LDAP_SUCCESS
+
+    def ldap_compare(self, ld, dn, attr, value):
+        return self._request(ld, self._compare_request(dn, attr, value))
+
+    def ldap_compare_s(self, ld, dn, attr, value):
+        return _result_code(self._request_s(ld, self._compare_request(
+            dn, attr, value)))
+
+    def ldap_connect(self, ld, timeout):
+        self._connect(self._session(ld), _timeout(timeout))
+        return LDAP_SUCCESS
+
+    def ldap_control_free(self, control):
+        self._release(control)
+        return LDAP_SUCCESS
+
+    def ldap_controls_free(self, controls):
+        idx = 0
+        while controls and controls[idx]:
+            self._release(controls[idx])
+            idx = idx + 1
+        self._release(controls)
+        return LDAP_SUCCESS
+
+    def ldap_count_entries(self, ld, res):
+        entry = self._find(res, _Entry)
+        if entry is not None:
+            return len(entry.message.entries) - entry.index
+        return len(self._lookup(res, _Message).entries)
+
+    def ldap_create_page_control(self, ld, size, cookie, critical, control):
+        value = b''
+        if cookie is not None and _address(cookie):
+            berval = cast(cookie, LDAP_BERVAL.pointer).contents
+            if berval.bv_len:
+                value = string_at(berval.bv_val, berval.bv_len)
+        _write_pointer(control, self._control(protocol.Control(
+            protocol.PAGED_RESULTS_OID, critical,
+            protocol.encode_paged_results(size, value))))
+        return LDAP_SUCCESS
+
+    def ldap_delete(self, ld, dn):
+        return self._request(ld, protocol.DelRequest(dn))
+
+    def ldap_delete_s(self, ld, dn):
+        return _result_code(self._request_s(ld, protocol.DelRequest(dn)))
+
+    def ldap_err2string(self, code):
+        return _ERROR_STRINGS.get(code, 'unknown error')
+
+    def ldap_first_attribute(self, ld, entry, ber):
+        attributes = _AttributeIterator(self._lookup(entry,
+                                                     _Entry).op.attributes)
+        _write_pointer(ber, self._register(attributes, BerElement.pointer))
+        return attributes.next_name()
+
+    def ldap_first_entry(self, ld, res):
+        return self._entry_handle(self._lookup(res, _Message), 0)
+
+    def ldap_get_dn(self, ld, entry):
+        dn = create_unicode_buffer(self._lookup(entry, _Entry).op.dn)
+        return cast(dn, POINTER(c_wchar))
+
+    def ldap_get_option(self, ld, option, outvalue):
+        session = self._session(ld)
+        if option == LDAP_OPT_DESC:
+            c_size_t.from_address(_address(outvalue)).value = \
+                self._descriptor(session)
+            return LDAP_SUCCESS
+        if option == LDAP_OPT_HOST_REACHABLE:
+            value = LDAP_OPT_ON if session.error is None else LDAP_OPT_OFF
+        elif option in session.options:
+            value = session.options[option]
+        else:
+            raise BackendError(LDAP_PARAM_ERROR)
+        c_ulong.from_address(_address(outvalue)).value = value
+        return LDAP_SUCCESS
+
+    def _values(self, entry, attr):
+        name = attr.lower()
+        for description, values in self._lookup(entry, _Entry).op.attributes:
+            if description.lower() == name:
+                return values
+        raise BackendError(LDAP_NO_SUCH_ATTRIBUTE)
+
+    def ldap_get_values(self, ld, entry, attr):
+        values = [value.decode('utf-8', 'replace')
+                  for value in self._values(entry, attr)]
+        array = (c_wchar_p * (len(values) + 1))(*values)
+        return cast(array, POINTER(c_wchar_p))
+
+    def ldap_get_values_len(self, ld, entry, attr):
+        values = [pointer(LDAP_BERVAL.from_value(value))
+                  for value in self._values(entry, attr)]
+        array = (LDAP_BERVAL.pointer * (len(values) + 1))(*values)
+        return cast(array, POINTER(LDAP_BERVAL.pointer))
+
+    def ldap_init(self, host, port):
+        return self._register(self._open(host, port), LDAP.pointer)
+
+    def ldap_memfree(self, block):
+        pass
+
+    def ldap_modify(self, ld, dn, mods):
+        return self._request(ld, protocol.ModifyRequest(dn,
+                                                        _modifications(mods)))
+
+    def ldap_modify_s(self, ld, dn, mods):
+        return _result_code(self._request_s(ld, protocol.ModifyRequest(
+            dn, _modifications(mods))))
+
+    def ldap_msgfree(self, res):
+        message = self._find(res, _Message)
+        if message is not None:
+            for handle in message.entry_handles:
+                self._release(handle)
+            self._release(res)
+        return LDAP_SUCCESS
+
+    def ldap_msgid(self, res):
+        message = self._find(res, _Message)
+        return message.msgid if message is not None else -1
+
+    def ldap_msgtype(self, res):
+        message = self._find(res, _Message)
+        return message.msgtype if message is not None else LDAP_RES_ANY
+
+    def ldap_next_attribute(self, ld, entry, ber):
+        attributes = self._find(ber, _AttributeIterator)
+        return attributes.next_name() if attributes is not None else None
+
+    def ldap_next_entry(self, ld, entry):
+        entry = self._find(entry, _Entry)
+        if entry is None:
+            return LDAPMessage.pointer()
+        return self._entry_handle(entry.message, entry.index + 1)
+
+    def ldap_parse_page_control(self, ld, controls, count, cookie):
+        # No errcheck for ldap_parse_page_control: LDAP_CONTROL_NOT_FOUND is
+        # an expected outcome.
+        for control in _controls(controls):
+            if control.oid != protocol.PAGED_RESULTS_OID:
+                continue
+            try:
+                size, value = protocol.decode_paged_results(control.value)
+            except ValueError:
+                return LDAP_DECODING_ERROR
+            _write_ulong(count, size)
+            _write_pointer(cookie, self._allocate(
+                LDAP_BERVAL.from_value(value), LDAP_BERVAL.pointer, value))
+            return LDAP_SUCCESS
+        return LDAP_CONTROL_NOT_FOUND
+
+    def ldap_parse_result(self, ld, res, code, matched, message, referrals,
+                          controls, freeit):
+        result = self._lookup(res, _Message)
+        _write_ulong(code, result.result.code if result.result
+                     else LDAP_SUCCESS)
+        # Matched DNs, error messages and referrals are not returned.
+        for out in (matched, message, referrals):
+            _write_pointer(out, None)
+        if controls is not None:
+            array = None
+            if result.controls:
+                pointers = [self._control(item) for item in result.controls]
+                array = self._allocate(
+                    (LDAPControl.pointer * (len(pointers) + 1))(*pointers),
+                    POINTER(LDAPControl.pointer))
+            _write_pointer(controls, array)
+        if freeit:
+            self.ldap_msgfree(res)
+        return LDAP_SUCCESS
+
+    def ldap_result(self, ld, msgid, all_, timeout, res):
+        if msgid == 0xffffffff:  # LDAP_RES_ANY as an ULONG
+            msgid = LDAP_RES_ANY
+        ops = self._receive(self._session(ld), msgid, all_, _timeout(timeout))
+        if ops is None:
+            return 0  # Timeout
+        message = _Message(ops[0].msgid, [item.op for item in ops],
+                           ops[-1].controls)
+        _write_pointer(res, self._register(message, LDAPMessage.pointer))
+        return message.msgtype
+
+    def ldap_result2error(self, ld, res, freeit):
+        message = self._find(res, _Message)
+        if message is None:
+            return LDAP_PARAM_ERROR
+        code = message.result.code if message.result else LDAP_SUCCESS
+        if freeit:
+            self.ldap_msgfree(res)
+        return code
+
+    def ldap_search(self, ld, base, scope, filt, attrs, attrsonly):
+        return self._request(ld, self._search_request(ld, base, scope, filt,
+                                                      attrs, attrsonly))
+
+    def ldap_search_ext(self, ld, base, scope, filt, attrs, attrsonly,
+                        server_controls, client_controls, time_limit,
+                        size_limit, msgid):
+        # As with Wldap32, the limits of the call replace those of the
+        # session options.
+        request = self._search_request(ld, base, scope, filt, attrs,
+                                       attrsonly)._replace(
+            size_limit=size_limit, time_limit=time_limit)
+        _write_ulong(msgid, self._request(ld, request,
+                                          _controls(server_controls)))
+        return LDAP_SUCCESS
+
+    def ldap_search_s(self, ld, base, scope, filt, attrs, attrsonly, res):
+        ops = self._request_s(ld, self._search_request(ld, base, scope, filt,
+                                                       attrs, attrsonly))
+        code = _result_code(ops)
+        if code == LDAP_SUCCESS:
+            message = _Message(ops[0].msgid, [item.op for item in ops],
+                               ops[-1].controls)
+            _write_pointer(res, self._register(message, LDAPMessage.pointer))
+        return code
+
+    def ldap_set_option(self, ld, option, invalue):
+        session = self._session(ld)
+        if option not in session.options:
+            raise BackendError(LDAP_PARAM_ERROR)
+        session.options[option] = c_ulong.from_address(_address(invalue)).value
+        return LDAP_SUCCESS
+
+    def ldap_simple_bind(self, ld, dn, passwd):
+        return self.ldap_bind(ld, dn, passwd, LDAP_AUTH_SIMPLE)
+
+    def ldap_simple_bind_s(self, ld, dn, passwd):
+        return self.ldap_bind_s(ld, dn, passwd, LDAP_AUTH_SIMPLE)
+
+    def _unbind(self, ld):
+        session = self._session(ld)
+        self._release(ld)
+        self._close(session)
+        return LDAP_SUCCESS
+
+    ldap_unbind = _unbind
+    ldap_unbind_s = _unbind
+
+    def ldap_value_free(self, values):
+        return LDAP_SUCCESS
+
+    def ldap_value_free_len(self, values):
+        return LDAP_SUCCESS
+
+    def LdapGetLastError(self):
+        return getattr(self._local, 'code', LDAP_SUCCESS)
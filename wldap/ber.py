@@ -0,0 +1,161 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Minimal BER encoder and decoder, covering the subset of X.690 used by LDAP
+(RFC 4511 section 5.1): definite length encodings and single byte tags only.
+
+Decoding works on bytearray objects, which index as integers in both Python
+2.x and 3.x, and designates elements by (tag, start, end) triples, where
+data[start:end] is the element content.
+"""
+
+# Universal tags
+BOOLEAN = 0x01
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+ENUMERATED = 0x0a
+SEQUENCE = 0x30
+SET = 0x31
+
+# Tag class and form bits
+APPLICATION = 0x40
+CONTEXT = 0x80
+CONSTRUCTED = 0x20
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes(bytearray([length]))
+    octets = bytearray()
+    while length:
+        octets.insert(0, length & 0xff)
+        length >>= 8
+    return bytes(bytearray([0x80 | len(octets)]) + octets)
+
+
+def encode(tag, content):
+    """Encode a TLV element from its tag and already encoded content."""
+    return bytes(bytearray([tag])) + encode_length(len(content)) + content
+
+
+def encode_boolean(value, tag=BOOLEAN):
+    return encode(tag, b'\xff' if value else b'\x00')
+
+
+def encode_integer(value, tag=INTEGER):
+    # Minimal two's complement representation.
+    octets = bytearray()
+    while True:
+        octets.insert(0, value & 0xff)
+        value >>= 8
+        if (value == 0 and not octets[0] & 0x80) or \
+                (value == -1 and octets[0] & 0x80):
+            break
+    return encode(tag, bytes(octets))
+
+
+def encode_enumerated(value, tag=ENUMERATED):
+    return encode_integer(value, tag)
+
+
+def encode_octet_string(value, tag=OCTET_STRING):
+    """Encode an OCTET STRING: text is encoded as UTF-8 (LDAPString)."""
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return encode(tag, value)
+
+
+def encode_sequence(elements, tag=SEQUENCE):
+    return encode(tag, b''.join(elements))
+
+
+def encode_set(elements, tag=SET):
+    return encode(tag, b''.join(elements))
+
+
+def decode_header(data, offset=0):
+    """Decode the tag and length of the element at `offset`.
+
+    Returns a (tag, start, end) triple, or None if `data` doesn't hold the
+    whole element yet. Raises ValueError on malformed input.
+    """
+    size = len(data)
+    if offset + 2 > size:
+        return None
+    tag = data[offset]
+    if tag & 0x1f == 0x1f:
+        raise ValueError('Multiple byte tags are not supported')
+    length = data[offset + 1]
+    start = offset + 2
+    if length & 0x80:
+        count = length & 0x7f
+        if count == 0:
+            raise ValueError('Indefinite lengths are not supported')
+        if start + count > size:
+            return None
+        length = 0
+        for octet in data[start:start + count]:
+            length = (length << 8) | octet
+        start = start + count
+    end = start + length
+    if end > size:
+        return None
+    return tag, start, end
+
+
+def decode(data, offset=0):
+    """Same as decode_header, but raise ValueError on truncated input."""
+    element = decode_header(data, offset)
+    if element is None:
+        raise ValueError('Truncated BER element')
+    return element
+
+
+def decode_elements(data, start, end):
+    """Return the list of (tag, start, end) elements of a constructed content
+    spanning data[start:end].
+    """
+    elements = []
+    while start < end:
+        element = decode(data, start)
+        if element[2] > end:
+            raise ValueError('BER element overflows its container')
+        elements.append(element)
+        start = element[2]
+    return elements
+
+
+def decode_boolean(data, start, end):
+    return any(data[start:end])
+
+
+def decode_integer(data, start, end):
+    if start == end:
+        raise ValueError('Empty INTEGER')
+    value = 0
+    for octet in data[start:end]:
+        value = (value << 8) | octet
+    if data[start] & 0x80:
+        value -= 1 << (8 * (end - start))
+    return value
+
+
+def decode_octet_string(data, start, end):
+    return bytes(data[start:end])
+
+
+def decode_string(data, start, end):
+    """Decode an LDAPString (UTF-8 encoded OCTET STRING) to text."""
+    return bytes(data[start:end]).decode('utf-8')
@@ -0,0 +1,146 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque, namedtuple
+
+from wldap import wldap32_dll as dll
+from wldap.exceptions import LdapError
+from wldap.future import FIRST_COMPLETED, wait
+from wldap.wldap32_constants import LDAP_SUCCESS
+
+
+# The outcome of a single bulk operation: `index` is the position of the
+# operation in the submitted iterable, and `error` is None on success or the
+# exception the operation failed with.
+BulkOutcome = namedtuple('BulkOutcome', ['index', 'dn', 'error'])
+
+
+class BulkReport(object):
+    """The per-operation outcomes of a bulk write, in submission order."""
+
+    def __init__(self, outcomes):
+        self.outcomes = sorted(outcomes, key=lambda outcome: outcome.index)
+
+    def __iter__(self):
+        return iter(self.outcomes)
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    @property
+    def failed(self):
+        """The list of outcomes of the failed operations."""
+        return [outcome for outcome in self.outcomes
+                if outcome.error is not None]
+
+    @property
+    def succeeded(self):
+        """The number of successful operations."""
+        return sum(1 for outcome in self.outcomes if outcome.error is None)
+
+
+def _check_result(ldap, future):
+    # The result message of a write operation holds its result code.
+    message = future.result()
+    try:
+        code = dll.ldap_result2error(ldap._l, message._message, 0)
+    finally:
+        message.release()
+    if code != LDAP_SUCCESS:
+        raise LdapError(code)
+
+
+def run_bulk(ldap, operations, submit, window):
+    """Pipeline write operations, keeping at most `window` of them in flight.
+
+    Operations targeting the same DN (compared case insensitively) are
+    serialized in submission order, while operations targeting different DNs
+    run concurrently.
+
+    Args:
+        ldap: the wldap.ldap instance to write on
+        operations: an iterable of (dn, argument) pairs
+        submit: a callable taking a dn and an argument, and returning the
+            Future of the corresponding asynchronous operation
+        window: the maximum number of operations in flight
+
+    Returns a BulkReport.
+    """
+    if window < 1:
+        raise ValueError('window must be at least 1')
+
+    busy = set()  # keys of the DNs with an operation in flight
+    in_flight = {}  # Future -> (index, dn, key)
+    queued = {}  # key -> deque of (index, dn, argument), for busy DNs
+    queued_count = 0
+    outcomes = []
+    iterator = enumerate(operations)
+
+    def start(index, dn, argument, key):
+        try:
+            future = submit(dn, argument)
+        except Exception as e:
+            outcomes.append(BulkOutcome(index, dn, e))
+        else:
+            busy.add(key)
+            in_flight[future] = (index, dn, key)
+
+    def start_queued(key):
+        # Start the next operation waiting for this DN, moving on to the
+        # following one if it fails to be submitted. Returns the number of
+        # operations taken off the queue.
+        count = 0
+        while key in queued and key not in busy:
+            index, dn, argument = queued[key].popleft()
+            if not queued[key]:
+                del queued[key]
+            start(index, dn, argument, key)
+            count = count + 1
+        return count
+
+    exhausted = False
+    while True:
+        # Operations waiting for a busy DN count against the window, so that
+        # the iterable is never read too far ahead.
+        while not exhausted and len(in_flight) + queued_count < window:
+            try:
+                index, (dn, argument) = next(iterator)
+            except StopIteration:
+                exhausted = True
+                break
+            key = dn.lower()
+            if key in busy:
+                queued.setdefault(key, deque()).append((index, dn, argument))
+                queued_count = queued_count + 1
+            else:
+                start(index, dn, argument, key)
+
+        # Queued operations always wait for one in flight, so nothing in
+        # flight means nothing left to do.
+        if not in_flight:
+            break
+
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            index, dn, key = in_flight.pop(future)
+            busy.discard(key)
+            try:
+                _check_result(ldap, future)
+            except Exception as e:
+                outcomes.append(BulkOutcome(index, dn, e))
+            else:
+                outcomes.append(BulkOutcome(index, dn, None))
+            queued_count = queued_count - start_queued(key)
+
+    return BulkReport(outcomes)
@@ -0,0 +1,184 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict, namedtuple
+import sys
+import threading
+import time
+
+from wldap import dn as dns
+
+
+# A cached search result: `results` as returned by parse_message, the time
+# after which it is stale, and its estimated size in bytes.
+_CacheItem = namedtuple('_CacheItem', ['results', 'expires', 'size'])
+
+
+def _parse_dn(dn):
+    # Malformed DNs, which the directory rejects, match no cached search.
+    try:
+        return dns.parse(dn or '')
+    except ValueError:
+        return None
+
+
+def _affects(dn, base, scope):
+    # Whether writing the parsed `dn` may change the outcome of a search of
+    # `scope` under the parsed `base`: the base itself, as deleting it makes
+    # the search fail, or any entry the search may return.
+    if dn is None or base is None:
+        return False
+    return dn == base or dn.in_scope(base, scope)
+
+
+def _size(results):
+    # A rough estimate of the memory held by parsed results, accounting for
+    # the values and attribute names (which dominate) but not for sharing.
+    size = sys.getsizeof(results)
+    for entry in results:
+        if isinstance(entry, tuple):  # A (dn, attributes) pair
+            size += sys.getsizeof(entry[0])
+            entry = entry[1]
+        size += sys.getsizeof(entry)
+        for name, values in entry.items():
+            size += sys.getsizeof(name) + sys.getsizeof(values)
+            size += sum(sys.getsizeof(value) for value in values)
+    return size
+
+
+class SearchCache(object):
+    """Parsed search results, keyed by normalized search parameters.
+
+    Results expire `ttl` seconds after they were stored, and the least
+    recently used ones are evicted once the cache holds more than
+    `max_entries` results or `max_bytes` bytes. Searches returning no entry
+    are cached too, for `negative_ttl` seconds.
+
+    Writes through a session using the cache (see ldap.enable_cache) drop the
+    cached results of the searches whose scope covers the written DN. Writes
+    from other sessions or clients are not seen, and only show after the TTL.
+
+    Cached results are shared between callers, and must not be modified.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=1024, max_bytes=None,
+                 negative_ttl=None, clock=time.time):
+        """Construct a new SearchCache instance.
+
+        Args:
+            ttl: the number of fractional seconds a result stays valid
+            max_entries: the maximum number of cached results, or None
+            max_bytes: the maximum estimated size of the cached results, or
+                None for no limit
+            negative_ttl: the number of fractional seconds an empty result
+                stays valid, `ttl` if None, and 0 not to cache empty results
+            clock: a function returning the current time in seconds
+        """
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._clock = clock
+        self._generation = 0
+        self._items = OrderedDict()  # key -> _CacheItem, least recent first
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._ttl = ttl
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def bytes(self):
+        """The estimated size of the cached results."""
+        return self._bytes
+
+    @property
+    def generation(self):
+        """A counter incremented by each invalidation, to pass to put()."""
+        return self._generation
+
+    @staticmethod
+    def key(base, scope, filt, attr, attronly, binary=False):
+        """Return the cache key of a search, as for ldap.search_s."""
+        return (_parse_dn(base), scope, (filt or '').strip(),
+                tuple(sorted(set(name.lower() for name in attr or []))),
+                bool(attronly), bool(binary))
+
+    def _pop(self, key):
+        item = self._items.pop(key)
+        self._bytes -= item.size
+        return item
+
+    def get(self, key):
+        """Return the cached results for `key`, or None."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item.expires <= self._clock():
+                self._pop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            # Reinsert to mark as most recently used: OrderedDict has no
+            # move_to_end with Python 2.
+            self._items[key] = self._pop(key)
+            self._bytes += item.size
+            self.hits += 1
+            return item.results
+
+    def put(self, key, results, generation=None):
+        """Store `results` for `key`.
+
+        Args:
+            key: the key of the search, as returned by SearchCache.key
+            results: the parsed results of the search
+            generation: the value of SearchCache.generation when the search
+                was issued: results are dropped if an invalidation happened
+                since, as they may predate the write
+        """
+        ttl = self._ttl if results else self._negative_ttl
+        if ttl <= 0:
+            return
+        size = _size(results)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._items:
+                self._pop(key)
+            self._items[key] = _CacheItem(results, self._clock() + ttl, size)
+            self._bytes += size
+            while self._items and (
+                    (self._max_entries is not None and
+                     len(self._items) > self._max_entries) or
+                    (self._max_bytes is not None and
+                     self._bytes > self._max_bytes)):
+                self._pop(next(iter(self._items)))
+
+    def invalidate(self, dn):
+        """Drop the cached results of the searches which may return `dn`."""
+        dn = _parse_dn(dn)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._items
+                        if _affects(dn, key[0], key[1])]:
+                self._pop(key)
+
+    def clear(self):
+        """Drop all the cached results."""
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+            self._bytes = 0
@@ -17,6 +17,30 @@ from ctypes import addressof
 from wldap.wldap32_structures import LDAPMod
 
 
+class _Changes(list):
+    """The list of changes of a Changeset, dropping the LDAPMod* array
+    compiled from it whenever it is modified.
+    """
+
+    compiled = None
+
+
+def _invalidating(method):
+    def _invalidate(self, *args, **kwargs):
+        self.compiled = None
+        return method(self, *args, **kwargs)
+    _invalidate.__name__ = method.__name__
+    return _invalidate
+
+
+# Every mutating list method, some of which only exist with Python 2.
+for _name in ('__delitem__', '__delslice__', '__iadd__', '__imul__',
+              '__setitem__', '__setslice__', 'append', 'clear', 'extend',
+              'insert', 'pop', 'remove', 'reverse', 'sort'):
+    if hasattr(list, _name):
+        setattr(_Changes, _name, _invalidating(getattr(list, _name)))
+
+
 class Changeset(object):
     """The Changeset class describes the list of operation to apply in a modify
     operation.
@@ -32,8 +56,17 @@ class Changeset(object):
     def __init__(self):
         self.changes = []
 
+    @property
+    def changes(self):
+        """The list of LDAPMod structures of the changeset."""
+        return self._changes
+
+    @changes.setter
+    def changes(self, changes):
+        self._changes = _Changes(changes)
+
     def _append(self, mod_op, mod_type, **kwargs):
-        self.changes.append(LDAPMod(mod_op, mod_type, **kwargs))
+        self._changes.append(LDAPMod(mod_op, mod_type, **kwargs))
         return self
 
     def add(self, attr, values):
@@ -51,8 +84,9 @@ class Changeset(object):
 
         Args:
             attr: the name of the attribute to which values should be added
-            values: a sequence of bytes to be appended to the existing values
-                in the attribute
+            values: a sequence of bytes (or any contiguous buffer, such as
+                bytearray, memoryview or mmap, whose memory is used without
+                copy) to be appended to the existing values in the attribute
         """
         return self._append(LDAPMod.LDAP_MOD_ADD, attr, bin_values=values)
 
@@ -77,8 +111,8 @@ class Changeset(object):
 
         Args:
             attr: the name of the attribute from which values should be removed
-            values: a sequence of bytes to be deleted from the current
-                attribute values
+            values: a sequence of bytes (or any contiguous buffer) to be
+                deleted from the current attribute values
         """
         return self._append(LDAPMod.LDAP_MOD_DELETE, attr, bin_values=values)
 
@@ -103,15 +137,32 @@ class Changeset(object):
 
         Args:
             attr: the name of the attribute where values should be replaced
-            values: a sequence of bytes to replace the current attribute
-                values with
+            values: a sequence of bytes (or any contiguous buffer, such as
+                bytearray, memoryview or mmap, whose memory is used without
+                copy) to replace the current attribute values with
         """
         return self._append(LDAPMod.LDAP_MOD_REPLACE, attr, bin_values=values)
 
-    def to_api_param(self):
+    def compile(self):
         """Convert the changeset to a C nul-terminated array of LDAPMod*
         suitable to pass to Wldap32 ldap_add* and ldap_modify* API functions.
+
+        The array is built once and reused until the changeset is modified,
+        so that applying the same changeset to many entries doesn't marshal it
+        again for each call. Returns None for an empty changeset.
         """
-        if self.changes == []:
+        changes = self._changes
+        if not changes:
             return None
-        return [LDAPMod.pointer(item) for item in self.changes] + [None]
+
+        # Modifying the list of changes, through the methods of the changeset
+        # or directly, drops the compiled array.
+        if changes.compiled is None:
+            pointers = [LDAPMod.pointer(item) for item in changes]
+            changes.compiled = (LDAPMod.pointer * (len(changes) + 1))(
+                *pointers)
+        return changes.compiled
+
+    def to_api_param(self):
+        """Same as compile(), kept for compatibility."""
+        return self.compile()
@@ -0,0 +1,309 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decoding of attribute values to Python types, by attribute name or by
+attribute syntax.
+
+    >>> from wldap.decoders import DecoderRegistry
+    >>> decoders = DecoderRegistry()
+    >>> decoders.load_schema(l)  # Optional: decode by syntax too
+    >>> entries = wldap.parse_message(msg, decoders=decoders)
+    >>> entries[0]['pwdLastSet']
+    [datetime.datetime(2013, 6, 19, 12, 0)]
+
+Dates and times are returned as naive datetime objects in UTC.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+import re
+import struct
+import threading
+import uuid
+
+from wldap.wldap32_constants import LDAP_SCOPE_BASE
+
+
+# A decoder `function` takes a single value, as a unicode string or as bytes
+# when `binary` is set.
+Decoder = namedtuple('Decoder', ['function', 'binary'])
+
+_GENERALIZED_TIME = re.compile(r'^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})?(\d{2})?'
+                               r'(?:[.,](\d+))?(Z|[+-]\d{2}(?:\d{2})?)?$')
+_FILETIME_EPOCH = datetime(1601, 1, 1)
+_FILETIME_NEVER = 0x7fffffffffffffff
+
+
+def decode_integer(value):
+    return int(value)
+
+
+def decode_boolean(value):
+    value = value.upper()
+    if value not in ('TRUE', 'FALSE'):
+        raise ValueError('Invalid boolean value %r' % value)
+    return value == 'TRUE'
+
+
+def decode_generalized_time(value):
+    """Decode a GeneralizedTime (such as 20130619120000.0Z) to a datetime.
+    """
+    match = _GENERALIZED_TIME.match(value)
+    if match is None:
+        raise ValueError('Invalid GeneralizedTime value %r' % value)
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    result = datetime(int(year), int(month), int(day), int(hour),
+                      int(minute or 0), int(second or 0))
+    if fraction:
+        # The fraction applies to the last unit given.
+        unit = 1 if second else 60 if minute else 3600
+        result += timedelta(seconds=unit * float('0.' + fraction))
+    if zone and zone != 'Z':
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5] or 0))
+        result = result - offset if zone[0] == '+' else result + offset
+    return result
+
+
+def decode_filetime(value):
+    """Decode a FILETIME (100 nanosecond intervals since 1601, as held by
+    pwdLastSet or lastLogonTimestamp) to a datetime, or to None for the 0 and
+    "never" values.
+    """
+    value = int(value)
+    if value <= 0 or value >= _FILETIME_NEVER:
+        return None
+    return _FILETIME_EPOCH + timedelta(microseconds=value // 10)
+
+
+def encode_generalized_time(value):
+    """Encode a datetime to a GeneralizedTime, the reverse of
+    decode_generalized_time: naive datetimes are taken as UTC.
+    """
+    if value.utcoffset() is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    text = '%04d%02d%02d%02d%02d%02d' % (value.year, value.month, value.day,
+                                         value.hour, value.minute,
+                                         value.second)
+    if value.microsecond:
+        text = text + ('.%06d' % value.microsecond).rstrip('0')
+    return text + 'Z'
+
+
+def encode_filetime(value):
+    """Encode a datetime to a FILETIME, the reverse of decode_filetime."""
+    if value.utcoffset() is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    delta = value - _FILETIME_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10000000 + \
+        delta.microseconds * 10
+
+
+def decode_sid(value):
+    """Decode a binary security identifier to its S-1-5-... string form."""
+    value = bytes(value)
+    if len(value) < 8 or len(value) != 8 + 4 * bytearray(value)[1]:
+        raise ValueError('Invalid SID value %r' % value)
+    count = bytearray(value)[1]
+    authority = struct.unpack('>Q', b'\0\0' + value[2:8])[0]
+    subauthorities = struct.unpack('<%dI' % count, value[8:])
+    return 'S-%d-%d' % (bytearray(value)[0], authority) + ''.join(
+        '-%d' % subauthority for subauthority in subauthorities)
+
+
+def decode_guid(value):
+    """Decode a binary GUID (as held by objectGUID) to a uuid.UUID."""
+    return uuid.UUID(bytes_le=bytes(value))
+
+
+# Decoders by syntax OID (RFC 4517, and Active Directory syntaxes).
+SYNTAXES = {
+    '1.3.6.1.4.1.1466.115.121.1.7': Decoder(decode_boolean, False),
+    '1.3.6.1.4.1.1466.115.121.1.24': Decoder(decode_generalized_time, False),
+    '1.3.6.1.4.1.1466.115.121.1.27': Decoder(decode_integer, False),
+    '1.2.840.113556.1.4.906': Decoder(decode_integer, False),  # Large integer
+}
+
+# Decoders by attribute name, for the attributes which syntax doesn't tell
+# the type (FILETIME values are large integers, SIDs octet strings).
+ATTRIBUTES = {
+    'accountexpires': Decoder(decode_filetime, False),
+    'badpasswordtime': Decoder(decode_filetime, False),
+    'lastlogoff': Decoder(decode_filetime, False),
+    'lastlogon': Decoder(decode_filetime, False),
+    'lastlogontimestamp': Decoder(decode_filetime, False),
+    'lockouttime': Decoder(decode_filetime, False),
+    'objectguid': Decoder(decode_guid, True),
+    'objectsid': Decoder(decode_sid, True),
+    'pwdlastset': Decoder(decode_filetime, False),
+    'sidhistory': Decoder(decode_sid, True),
+    'tokengroups': Decoder(decode_sid, True),
+}
+
+_NAMES = re.compile(r"\bNAME\s+(?:'([^']*)'|\(([^)]*)\))")
+_SUPERIOR = re.compile(r'\bSUP\s+(\S+)')
+_SYNTAX = re.compile(r"\bSYNTAX\s+'?([0-9.]+)")
+
+
+def parse_attribute_types(descriptions):
+    """Return a dictionary mapping the lower cased names of the attributes
+    of a list of attributeTypes descriptions (RFC 4512) to their syntax OID,
+    following SUP for the attributes which inherit it.
+    """
+    syntaxes = {}
+    superiors = {}
+    for description in descriptions:
+        match = _NAMES.search(description)
+        if match is None:
+            continue
+        names = [match.group(1)] if match.group(1) is not None else \
+            re.findall(r"'([^']*)'", match.group(2))
+        syntax = _SYNTAX.search(description)
+        superior = _SUPERIOR.search(description)
+        for name in names:
+            name = name.lower()
+            if syntax is not None:
+                syntaxes[name] = syntax.group(1)
+            elif superior is not None:
+                superiors[name] = superior.group(1).lower()
+
+    for name in superiors:
+        seen = set([name])
+        superior = superiors[name]
+        while superior not in syntaxes and superior in superiors and \
+                superior not in seen:
+            seen.add(superior)
+            superior = superiors[superior]
+        if superior in syntaxes:
+            syntaxes[name] = syntaxes[superior]
+    return syntaxes
+
+
+class DecoderRegistry(object):
+    """Decoders by attribute name and by syntax OID, to pass to the result
+    parsers (see parse_message).
+
+    Attribute name decoders come first, then those of the attribute syntax,
+    as read from the directory schema by load_schema. Attributes without a
+    decoder keep their values as strings. Values which fail to decode are
+    kept undecoded too.
+    """
+
+    def __init__(self, defaults=True):
+        """Construct a new DecoderRegistry instance.
+
+        Args:
+            defaults: True to start with the decoders of SYNTAXES and
+                ATTRIBUTES
+        """
+        self._attributes = dict(ATTRIBUTES) if defaults else {}
+        self._decoders = {}  # Attribute name -> Decoder or None, memoized
+        self._lock = threading.Lock()
+        self._schema = None  # Attribute name -> syntax OID
+        self._syntaxes = dict(SYNTAXES) if defaults else {}
+
+    def register_attribute(self, name, function, binary=False):
+        """Decode the values of attribute `name` with `function`, which takes
+        a value as a unicode string, or as bytes if `binary` is set.
+        """
+        self._attributes[name.lower()] = Decoder(function, binary)
+        self._decoders.clear()
+
+    def register_syntax(self, oid, function, binary=False):
+        """Decode the values of the attributes of syntax `oid` with
+        `function`, as for register_attribute.
+        """
+        self._syntaxes[oid] = Decoder(function, binary)
+        self._decoders.clear()
+
+    @property
+    def schema(self):
+        """The attribute name to syntax OID mapping loaded by load_schema, or
+        None.
+        """
+        return self._schema
+
+    def load_schema(self, ldap, reload=False):
+        """Read the attribute syntaxes from the subschema subentry of the
+        directory, unless they were already loaded.
+
+        Args:
+            ldap: the wldap.ldap session to read the schema with
+            reload: True to read the schema even if already loaded
+
+        Returns the attribute name to syntax OID mapping, and raises LdapError
+        on error.
+        """
+        from wldap.message import parse_message  # wldap.message imports us
+
+        with self._lock:
+            if self._schema is not None and not reload:
+                return self._schema
+            msg = ldap.search_s('', LDAP_SCOPE_BASE, '(objectClass=*)',
+                                ['subschemaSubentry'], False)
+            try:
+                root = parse_message(msg)
+            finally:
+                msg.release()
+            subentry = root and root[0].get('subschemaSubentry')
+            descriptions = []
+            if subentry:
+                msg = ldap.search_s(subentry[0], LDAP_SCOPE_BASE,
+                                    '(objectClass=subschema)',
+                                    ['attributeTypes'], False)
+                try:
+                    entries = parse_message(msg)
+                finally:
+                    msg.release()
+                for entry in entries:
+                    for name, values in entry.items():
+                        if name.lower() == 'attributetypes':
+                            descriptions.extend(values)
+            self._schema = parse_attribute_types(descriptions)
+            self._decoders.clear()
+            return self._schema
+
+    def lookup(self, name):
+        """Return the Decoder for attribute `name`, or None."""
+        try:
+            return self._decoders[name]
+        except KeyError:
+            pass
+        key = name.lower()
+        decoder = self._attributes.get(key)
+        if decoder is None and self._schema is not None:
+            decoder = self._syntaxes.get(self._schema.get(key))
+        self._decoders[name] = decoder
+        return decoder
+
+    def decode(self, name, values):
+        """Decode the list of `values` of attribute `name`, which must be
+        bytes for binary decoders and unicode strings otherwise.
+        """
+        decoder = self.lookup(name)
+        if decoder is None:
+            return values
+        return decode_values(decoder.function, values)
+
+
+def decode_values(function, values):
+    """Return the list of `values` decoded by `function`, keeping as is the
+    values it fails to decode.
+    """
+    result = []
+    for value in values:
+        try:
+            result.append(function(value))
+        except (ValueError, TypeError, struct.error):
+            result.append(value)
+    return result
@@ -0,0 +1,164 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ctypes import byref
+import threading
+import time
+
+from wldap import wldap32_dll as dll
+from wldap.message import Message
+from wldap.wldap32_constants import LDAP_MSG_ALL, LDAP_RES_ANY
+from wldap.wldap32_structures import LDAP_TIMEVAL, LDAPMessage
+
+
+class ResultDispatcher(object):
+    """Demultiplexes the results of all the outstanding operations of a
+    session.
+
+    Rather than each Future calling ldap_result for its own message ID, the
+    dispatcher calls it once for any message ID (LDAP_RES_ANY), and routes the
+    completed result to the matching Future. The ldap_result out-parameters
+    are allocated once and reused for every call.
+
+    Once a session has a dispatcher, all its results should go through it:
+    results for message IDs no Future is registered for are kept until
+    claimed with claim().
+    """
+
+    def __init__(self, ldap):
+        """Construct a new ResultDispatcher instance.
+
+        Args:
+            ldap: the wldap.ldap instance which results to dispatch
+        """
+        self._completed = {}  # msgid -> Message, for unregistered msgids
+        self._futures = {}  # msgid -> Future
+        self._ldap = ldap
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._reading = False  # Whether a thread is in ldap_result
+        self._res = LDAPMessage.pointer()
+        self._res_ref = byref(self._res)
+        self._timeval = LDAP_TIMEVAL()
+        self._timeval_ref = byref(self._timeval)
+
+    def _read(self, timeout_seconds):
+        # Call ldap_result and route its result, as the reader: the lock is
+        # not held during the call, so that other threads can register,
+        # unregister and check their Futures meanwhile.
+        future = None
+        try:
+            timeval = None
+            if timeout_seconds is not None:
+                self._timeval.set_fractional_seconds(timeout_seconds)
+                timeval = self._timeval_ref
+            ret = dll.ldap_result(self._ldap._l, LDAP_RES_ANY, LDAP_MSG_ALL,
+                                  timeval, self._res_ref)
+            if ret == 0:  # 0 is a timeout
+                return None
+
+            # The pointer value is copied, as _res is overwritten by the next
+            # call.
+            res = LDAPMessage.pointer.from_buffer_copy(self._res)
+            message = Message(self._ldap._l, res)
+            msgid = dll.ldap_msgid(res)
+            with self._lock:
+                future = self._futures.pop(msgid, None)
+                if future is None:
+                    self._completed[msgid] = message
+                else:
+                    future._result = message
+        finally:
+            with self._condition:
+                self._reading = False
+                self._condition.notify_all()
+
+        # Callbacks are invoked once no longer the reader, so that they can
+        # wait on other Futures of the session.
+        if future is not None:
+            future._invoke_callbacks()
+        return msgid
+
+    def claim(self, msgid):
+        """Return the result received for `msgid` if no Future was registered
+        for it, or None.
+        """
+        with self._lock:
+            return self._completed.pop(msgid, None)
+
+    def poll(self, timeout_seconds=None):
+        """Receive and route a single completed result.
+
+        If another thread is already receiving a result, wait for it to be
+        routed instead, for at most `timeout_seconds`.
+
+        Args:
+            timeout_seconds: a fractional number of seconds to wait for a
+                result, block indefinitely if None (default)
+
+        Returns the message ID of the result, or None on timeout or if the
+        result was received by another thread. Raises LdapError on error.
+        """
+        with self._condition:
+            if self._reading:
+                self._condition.wait(timeout_seconds)
+                return None
+            self._reading = True
+        return self._read(timeout_seconds)
+
+    def register(self, future):
+        """Register a Future to route its result to. If the result was already
+        received, it is routed immediately.
+        """
+        with self._lock:
+            message = self._completed.pop(future._msgid, None)
+            if message is None:
+                self._futures[future._msgid] = future
+                return
+        future._set_result(message)
+
+    def unregister(self, future):
+        """Stop routing results to a Future, for example once cancelled."""
+        with self._lock:
+            if self._futures.get(future._msgid) is future:
+                del self._futures[future._msgid]
+
+    def wait(self, future, timeout_seconds=None):
+        """Route results until `future` is completed.
+
+        A single thread calls ldap_result at a time: the others wait for it to
+        route a result, then check whether it completed their Future.
+
+        Returns whether `future` is completed, that is False on timeout.
+        Raises LdapError on error.
+        """
+        deadline = None
+        if timeout_seconds is not None:
+            deadline = time.time() + timeout_seconds
+
+        remaining = timeout_seconds
+        while True:
+            with self._condition:
+                if future._has_result_or_exc():
+                    return True
+                if deadline is not None:
+                    remaining = max(0, deadline - time.time())
+                if self._reading:
+                    if remaining == 0:
+                        return False
+                    self._condition.wait(remaining)
+                    continue
+                self._reading = True
+            if self._read(remaining) is None:
+                return future._has_result_or_exc()
@@ -0,0 +1,347 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Distinguished names parsing, normalization and comparison (RFC 4514).
+
+    >>> from wldap import dn
+    >>> user = dn.parse('CN=Smith\\, John,OU=People,DC=example,DC=com')
+    >>> user.rdn
+    (('CN', 'Smith, John'),)
+    >>> user.parent == dn.parse('ou=people, dc=example, dc=com')
+    True
+    >>> user.is_descendant_of(dn.parse('dc=example,dc=com'))
+    True
+
+DNs compare and hash by their normalized form: attribute types and values
+are compared case insensitively, escaping and insignificant spaces don't
+matter, and neither does the order of the attributes of multi-valued RDNs.
+
+Parsing results are kept in a bounded LRU cache, and the RDNs and normalized
+forms of the cached DNs are interned: the millions of DNs of a large result
+set share their common suffixes, and equal DNs share the same normalized key,
+which makes equality a single identity check. Interned objects are dropped
+along with the last cached DN holding them.
+"""
+
+from collections import OrderedDict
+import threading
+
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+
+
+# Characters escaped by a backslash when formatting values, and those which
+# may follow a backslash when parsing them.
+_ESCAPED = frozenset(',+"\\<>;')
+_SPECIAL = frozenset(',+"\\<>;=# ')
+_HEX = frozenset('0123456789abcdefABCDEF')
+
+_CACHE_SIZE = 10000
+
+_cache = OrderedDict()  # text -> DN, least recently used first
+_cache_size = _CACHE_SIZE
+_interned = {}  # value -> [value, number of cached DNs holding it]
+_lock = threading.Lock()
+
+
+def _intern(value):
+    # Return the interned object equal to `value`, or `value` itself: only
+    # the cached DNs add to the interning table (see _retain).
+    entry = _interned.get(value)
+    return value if entry is None else entry[0]
+
+
+def _retain(dn):
+    # Intern the objects of a DN entering the cache (under _lock). Those it
+    # holds are either interned already, or become so.
+    for value in dn.rdns + dn._key + (dn._key,):
+        entry = _interned.get(value)
+        if entry is None:
+            _interned[value] = [value, 1]
+        else:
+            entry[1] = entry[1] + 1
+
+
+def _release(dn):
+    # Drop the interned objects no other cached DN holds (under _lock).
+    for value in dn.rdns + dn._key + (dn._key,):
+        entry = _interned[value]
+        entry[1] = entry[1] - 1
+        if not entry[1]:
+            del _interned[value]
+
+
+def _evict():
+    while len(_cache) > _cache_size:
+        _release(_cache.popitem(last=False)[1])
+
+
+def escape_value(value):
+    """Escape an attribute value to use in a DN string."""
+    escaped = ''.join('\\' + c if c in _ESCAPED else
+                      '\\00' if c == '\0' else c for c in value)
+    if value[:1] in ('#', ' '):
+        escaped = '\\' + escaped
+    if len(value) > 1 and value[-1] == ' ':
+        escaped = escaped[:-1] + '\\ '
+    return escaped
+
+
+def _format(rdns):
+    return ','.join('+'.join('%s=%s' % (name, escape_value(value))
+                             for name, value in rdn) for rdn in rdns)
+
+
+def _parse_value(text, start):
+    # Parse the value starting at `start`, and return it along with the
+    # position of the separator ending it (or the end of `text`).
+    length = len(text)
+    idx = start
+    while idx < length and text[idx] == ' ':
+        idx = idx + 1
+
+    if idx < length and text[idx] == '#':  # BER encoded value, kept as is
+        end = idx + 1
+        while end < length and text[end] in _HEX:
+            end = end + 1
+        value = text[idx:end]
+        while end < length and text[end] == ' ':
+            end = end + 1
+        if end < length and text[end] not in ',;+':
+            raise ValueError('Invalid hexadecimal value in %r' % text)
+        return value, end
+
+    if idx < length and text[idx] == '"':  # Quoted value (RFC 2253)
+        chars = []
+        idx = idx + 1
+        while idx < length and text[idx] != '"':
+            if text[idx] == '\\':
+                idx = idx + 1
+            chars.append(text[idx:idx + 1])
+            idx = idx + 1
+        if idx >= length:
+            raise ValueError('Unterminated quoted value in %r' % text)
+        idx = idx + 1
+        while idx < length and text[idx] == ' ':
+            idx = idx + 1
+        if idx < length and text[idx] not in ',;+':
+            raise ValueError('Invalid quoted value in %r' % text)
+        return ''.join(chars), idx
+
+    chars = []
+    pending = bytearray()  # Hex escaped bytes, decoded as UTF-8 together
+    significant = 0  # The length of the value without its trailing spaces
+    while idx < length:
+        c = text[idx]
+        if c in ',;+':
+            break
+        escaped = c == '\\'
+        if escaped:
+            pair = text[idx + 1:idx + 3]
+            if len(pair) == 2 and pair[0] in _HEX and pair[1] in _HEX:
+                pending.append(int(pair, 16))
+                idx = idx + 3
+                continue
+            if not pair or pair[0] not in _SPECIAL:
+                raise ValueError('Invalid escape sequence in %r' % text)
+            c = pair[0]
+            idx = idx + 1
+        if pending:
+            chars.append(_decode(pending, text))
+            pending = bytearray()
+            significant = len(chars)
+        chars.append(c)
+        idx = idx + 1
+        if escaped or c != ' ':
+            significant = len(chars)
+    if pending:
+        chars.append(_decode(pending, text))
+        significant = len(chars)
+    return ''.join(chars[:significant]), idx
+
+
+def _decode(data, text):
+    try:
+        return bytes(data).decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError('Invalid UTF-8 escape sequence in %r' % text)
+
+
+def _parse(text):
+    # Return the tuple of RDNs of `text`, each of them a tuple of (attribute
+    # type, value) pairs.
+    rdns = []
+    avas = []
+    idx = 0
+    length = len(text)
+    if not text.strip():
+        return ()
+    while True:
+        equal = text.find('=', idx)
+        if equal < 0:
+            raise ValueError('Missing attribute value in %r' % text)
+        name = text[idx:equal].strip()
+        if not name or any(c in _ESCAPED or c == ' ' for c in name):
+            raise ValueError('Invalid attribute type in %r' % text)
+        value, idx = _parse_value(text, equal + 1)
+        avas.append((name, value))
+        if idx == length:
+            break
+        if text[idx] != '+':
+            rdns.append(tuple(avas))
+            avas = []
+        idx = idx + 1
+    rdns.append(tuple(avas))
+    return tuple(rdns)
+
+
+def _normalize(rdn):
+    return tuple(sorted((name.lower(), value.lower()) for name, value in rdn))
+
+
+class DN(object):
+    """A parsed distinguished name: a sequence of RDNs, the first one naming
+    the entry itself and the last one the top of the tree.
+
+    Each RDN is a tuple of (attribute type, value) pairs, holding more than
+    one pair for multi-valued RDNs. Values are unescaped unicode strings,
+    except for BER encoded values ("#" followed by hexadecimal digits) which
+    are kept as they appear.
+
+    DNs are immutable, and should be obtained through parse() rather than
+    constructed directly.
+    """
+
+    __slots__ = ('rdns', '_hash', '_key', '_parent', '_text')
+
+    def __init__(self, rdns, text=None):
+        """Construct a new DN instance.
+
+        Args:
+            rdns: a sequence of RDNs, as tuples of (type, value) pairs
+            text: the string the RDNs were parsed from, if any
+        """
+        self.rdns = tuple(_intern(tuple(rdn)) for rdn in rdns)
+        self._key = _intern(tuple(_intern(_normalize(rdn))
+                                  for rdn in self.rdns))
+        self._hash = hash(self._key)
+        self._parent = None
+        self._text = text
+
+    def __eq__(self, other):
+        # DNs don't compare equal to strings, which hash differently.
+        if not isinstance(other, DN):
+            return NotImplemented
+        # Interned keys make equal DNs share the same key, unless one of them
+        # was evicted from the cache in between.
+        return self._key is other._key or (self._hash == other._hash and
+                                           self._key == other._key)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return self._hash
+
+    def __len__(self):
+        return len(self.rdns)
+
+    def __repr__(self):
+        return 'DN(%r)' % str(self)
+
+    def __str__(self):
+        if self._text is None:
+            self._text = _format(self.rdns)
+        return self._text
+
+    @property
+    def normalized(self):
+        """The normalized string form of the DN, equal for equal DNs."""
+        return _format(self._key)
+
+    @property
+    def rdn(self):
+        """The first RDN, naming the entry, or None for the empty DN."""
+        return self.rdns[0] if self.rdns else None
+
+    @property
+    def parent(self):
+        """The DN of the parent entry, or None for the empty DN."""
+        if self._parent is None and self.rdns:
+            self._parent = DN(self.rdns[1:])
+        return self._parent
+
+    def is_child_of(self, other):
+        """Whether the entry is immediately below `other`."""
+        return (len(self._key) == len(other._key) + 1 and
+                self._key[1:] == other._key)
+
+    def is_descendant_of(self, other):
+        """Whether the entry is below `other`, at any depth."""
+        depth = len(self._key) - len(other._key)
+        return depth > 0 and self._key[depth:] == other._key
+
+    def in_scope(self, base, scope):
+        """Whether a search of `scope` under `base` may return the entry.
+
+        Args:
+            base: the DN of the search base
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+        """
+        if not isinstance(base, DN):
+            base = parse(base)
+        if scope == LDAP_SCOPE_BASE:
+            return self == base
+        if scope == LDAP_SCOPE_ONELEVEL:
+            return self.is_child_of(base)
+        return self == base or self.is_descendant_of(base)
+
+
+def parse(text):
+    """Parse a DN string, as returned by the directory.
+
+    Results are cached, so that parsing the same string again returns the
+    same DN object. Raises ValueError on a malformed DN.
+    """
+    with _lock:
+        dn = _cache.pop(text, None)
+        if dn is not None:
+            _cache[text] = dn
+            return dn
+    rdns = _parse(text)
+    with _lock:
+        dn = _cache.get(text)
+        if dn is None:  # Unless parsed by another thread meanwhile
+            dn = DN(rdns, text)
+            _retain(dn)
+            _cache[text] = dn
+            _evict()
+    return dn
+
+
+def set_cache_size(size):
+    """Set the maximum number of parsed DNs kept in cache (10000 by
+    default).
+    """
+    global _cache_size
+    with _lock:
+        _cache_size = size
+        _evict()
+
+
+def clear_cache():
+    """Drop the cached parsing results and the interned RDNs."""
+    with _lock:
+        _cache.clear()
+        _interned.clear()
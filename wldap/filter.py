@@ -0,0 +1,404 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search filters (RFC 4515): parsing of the string representation into a
+tree of filter items, and evaluation of such a tree against an entry.
+
+Assertion values are bytes (escapes such as \\2a are resolved while parsing),
+attribute descriptions are text.
+
+Filters evaluated repeatedly, such as over cached or exported results, are
+best compiled into a predicate first:
+
+    >>> accept = filters.compile('(&(objectClass=person)(mail=*@example.com))')
+    >>> people = [entry for entry in parse_message(msg) if accept(entry)]
+"""
+
+from collections import namedtuple
+from datetime import datetime
+import binascii
+import re
+import uuid
+
+from wldap.decoders import encode_filetime, encode_generalized_time
+
+
+And = namedtuple('And', ['filters'])
+Or = namedtuple('Or', ['filters'])
+Not = namedtuple('Not', ['filter'])
+Equality = namedtuple('Equality', ['attribute', 'value'])
+Substrings = namedtuple('Substrings', ['attribute', 'initial', 'any',
+                                       'final'])
+GreaterOrEqual = namedtuple('GreaterOrEqual', ['attribute', 'value'])
+LessOrEqual = namedtuple('LessOrEqual', ['attribute', 'value'])
+Present = namedtuple('Present', ['attribute'])
+Approx = namedtuple('Approx', ['attribute', 'value'])
+Extensible = namedtuple('Extensible', ['rule', 'attribute', 'value',
+                                       'dn_attributes'])
+
+
+_ATTRIBUTE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9\-;.]*$')
+_ESCAPED = re.compile(r'[\\*()\x00]')
+
+
+def escape(value):
+    """Escape an assertion value for use in a filter string: the special
+    characters of a text value, and every byte of a bytes value (such as an
+    objectGUID), are escaped as \\XX.
+    """
+    if isinstance(value, bytes):
+        return ''.join('\\%02x' % byte for byte in bytearray(value))
+    return _ESCAPED.sub(lambda m: '\\%02x' % ord(m.group()), value)
+
+
+def _attribute(text):
+    if not _ATTRIBUTE.match(text):
+        raise ValueError('Invalid attribute description %r' % text)
+    return text
+
+
+def _unescape(text):
+    # Resolve \XX escapes to the corresponding byte, and encode the rest as
+    # UTF-8.
+    parts = text.split('\\')
+    value = bytearray(parts[0].encode('utf-8'))
+    for part in parts[1:]:
+        if len(part) < 2:
+            raise ValueError('Invalid escape sequence in %r' % text)
+        try:
+            value.extend(binascii.unhexlify(part[:2].encode('ascii')))
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise ValueError('Invalid escape sequence in %r' % text)
+        value.extend(part[2:].encode('utf-8'))
+    return bytes(value)
+
+
+def _parse_extensible(left, value):
+    # attr [":dn"] [":" matchingrule] ":=" value, or
+    # [":dn"] ":" matchingrule ":=" value
+    parts = left.split(':')
+    attribute = parts[0] or None
+    dn_attributes, rule = False, None
+    for part in parts[1:]:
+        if part.lower() == 'dn' and not dn_attributes and rule is None:
+            dn_attributes = True
+        elif part and rule is None:
+            rule = part
+        else:
+            raise ValueError('Invalid extensible match %r' % left)
+    if attribute is None and rule is None:
+        raise ValueError('Extensible match requires a type or a rule')
+    if attribute is not None:
+        _attribute(attribute)
+    return Extensible(rule, attribute, value, dn_attributes)
+
+
+def _parse_item(text):
+    try:
+        eq = text.index('=')
+    except ValueError:
+        raise ValueError('Invalid filter item %r' % text)
+    left, right = text[:eq], text[eq + 1:]
+
+    if left.endswith(':'):
+        return _parse_extensible(left[:-1], _unescape(right))
+    if left.endswith('~'):
+        return Approx(_attribute(left[:-1]), _unescape(right))
+    if left.endswith('>'):
+        return GreaterOrEqual(_attribute(left[:-1]), _unescape(right))
+    if left.endswith('<'):
+        return LessOrEqual(_attribute(left[:-1]), _unescape(right))
+
+    attribute = _attribute(left)
+    if right == '*':
+        return Present(attribute)
+    if '*' in right:
+        parts = right.split('*')
+        initial = _unescape(parts[0]) if parts[0] else None
+        final = _unescape(parts[-1]) if parts[-1] else None
+        any_ = [_unescape(part) for part in parts[1:-1] if part]
+        return Substrings(attribute, initial, any_, final)
+    return Equality(attribute, _unescape(right))
+
+
+def _parse(text, pos):
+    # Parse the filter starting with the '(' at `pos`, and return it along
+    # with the position following its closing ')'.
+    if pos >= len(text) or text[pos] != '(':
+        raise ValueError('Expected "(" at position %d' % pos)
+    pos = pos + 1
+    if pos >= len(text):
+        raise ValueError('Unexpected end of filter')
+
+    op = text[pos]
+    if op in '&|':
+        filters = []
+        pos = pos + 1
+        while pos < len(text) and text[pos] == '(':
+            child, pos = _parse(text, pos)
+            filters.append(child)
+        result = And(filters) if op == '&' else Or(filters)
+    elif op == '!':
+        child, pos = _parse(text, pos + 1)
+        result = Not(child)
+    else:
+        end = text.find(')', pos)
+        if end == -1:
+            raise ValueError('Unbalanced parenthesis')
+        if '(' in text[pos:end]:
+            raise ValueError('Unescaped "(" in filter item')
+        result = _parse_item(text[pos:end])
+        pos = end
+
+    if pos >= len(text) or text[pos] != ')':
+        raise ValueError('Expected ")" at position %d' % pos)
+    return result, pos + 1
+
+
+def parse(text):
+    """Parse the string representation of a search filter.
+
+    As Wldap32 does, a filter lacking the enclosing parenthesis (such as
+    "cn=foo") is accepted. Raises ValueError for invalid filters.
+    """
+    text = text.strip()
+    if not text.startswith('('):
+        text = '(' + text + ')'
+    result, pos = _parse(text, 0)
+    if pos != len(text):
+        raise ValueError('Trailing characters after the filter')
+    return result
+
+
+def _normalize(value):
+    # Approximation of the caseIgnoreMatch / integerMatch matching rules: no
+    # schema is available, so every value is compared case insensitively, and
+    # as an integer when both sides are.
+    value = value.lower()
+    try:
+        return 0, int(value)
+    except ValueError:
+        return 1, value
+
+
+def _values(entry, attribute):
+    return entry.get(attribute.lower(), ())
+
+
+def _match_substrings(item, value):
+    value = value.lower()
+    pos = 0
+    if item.initial is not None:
+        if not value.startswith(item.initial.lower()):
+            return False
+        pos = len(item.initial)
+    end = len(value)
+    if item.final is not None:
+        end = end - len(item.final)
+        if end < pos or not value.endswith(item.final.lower()):
+            return False
+    for part in item.any:
+        pos = value.find(part.lower(), pos, end)
+        if pos == -1:
+            return False
+        pos = pos + len(part)
+    return True
+
+
+def matches(item, entry):
+    """Evaluate a parsed filter against an entry, given as a dictionary
+    mapping lower cased attribute names to lists of bytes values.
+    """
+    kind = type(item)
+    if kind is And:
+        return all(matches(child, entry) for child in item.filters)
+    if kind is Or:
+        return any(matches(child, entry) for child in item.filters)
+    if kind is Not:
+        return not matches(item.filter, entry)
+    if kind is Present:
+        return bool(_values(entry, item.attribute))
+    if kind is Substrings:
+        return any(_match_substrings(item, value)
+                   for value in _values(entry, item.attribute))
+    if kind is Extensible and item.attribute is None:
+        return any(matches(Equality(name, item.value), entry)
+                   for name in entry)
+
+    expected = _normalize(item.value)
+    values = [_normalize(value) for value in _values(entry, item.attribute)]
+    if kind is GreaterOrEqual:
+        return any(value >= expected for value in values)
+    if kind is LessOrEqual:
+        return any(value <= expected for value in values)
+    return expected in values  # Equality, Approx and Extensible
+
+
+def _text(value, integer=False):
+    # Entries values may be unicode strings, bytes (parse_binary_message and
+    # the memory backend), or decoded values (see wldap.decoders), which are
+    # converted back to their LDAP form. Datetimes are GeneralizedTime, or
+    # FILETIME when compared to an `integer` assertion (as for pwdLastSet).
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value.decode('latin-1')
+    if isinstance(value, type(u'')):
+        return value
+    if isinstance(value, bool):
+        return u'TRUE' if value else u'FALSE'
+    if isinstance(value, datetime):
+        if integer:
+            return u'%d' % encode_filetime(value)
+        return u'%s' % encode_generalized_time(value)
+    if isinstance(value, uuid.UUID):  # As an objectGUID
+        return _text(value.bytes_le)
+    return u'%s' % (value,)
+
+
+def _getter(attribute):
+    # Attribute names are case insensitive: look the name up as given, then
+    # lower cased, then compare it against every name of the entry.
+    lowered = attribute.lower()
+
+    def get(entry):
+        values = entry.get(attribute)
+        if values is None:
+            values = entry.get(lowered)
+            if values is None:
+                for name in entry:
+                    if name.lower() == lowered:
+                        return entry[name]
+                return ()
+        return values
+    return get
+
+
+def _compile_all(children):
+    def match(entry):
+        for child in children:
+            if not child(entry):
+                return False
+        return True
+    return match
+
+
+def _compile_any(children):
+    def match(entry):
+        for child in children:
+            if child(entry):
+                return True
+        return False
+    return match
+
+
+def _equality(value):
+    # Return a function telling whether a list of values holds `value`.
+    expected = _normalize(_text(value))
+    if expected[0] == 0:  # Integer assertion
+        number = expected[1]
+
+        def match(values):
+            for value in values:
+                try:
+                    if int(_text(value, True)) == number:
+                        return True
+                except ValueError:
+                    pass
+            return False
+        return match
+
+    text = expected[1]
+
+    def match(values):
+        for value in values:
+            if _text(value).lower() == text:
+                return True
+        return False
+    return match
+
+
+def _compile_substrings(item):
+    parts = [item.initial or b''] + list(item.any) + [item.final or b'']
+    pattern = re.compile('.*?'.join(re.escape(_text(part)) for part in parts)
+                         + r'\Z', re.IGNORECASE | re.DOTALL | re.UNICODE)
+    get = _getter(item.attribute)
+
+    def match(entry):
+        for value in get(entry):
+            if pattern.match(_text(value)):
+                return True
+        return False
+    return match
+
+
+def _compile_ordering(attribute, value, greater):
+    get = _getter(attribute)
+    expected = _normalize(_text(value))
+    integer = expected[0] == 0
+
+    def match(entry):
+        for value in get(entry):
+            value = _normalize(_text(value, integer))
+            if value >= expected if greater else value <= expected:
+                return True
+        return False
+    return match
+
+
+def _compile(item):
+    kind = type(item)
+    if kind is And:
+        return _compile_all([_compile(child) for child in item.filters])
+    if kind is Or:
+        return _compile_any([_compile(child) for child in item.filters])
+    if kind is Not:
+        child = _compile(item.filter)
+        return lambda entry: not child(entry)
+    if kind is Present:
+        get = _getter(item.attribute)
+        return lambda entry: bool(get(entry))
+    if kind is Substrings:
+        return _compile_substrings(item)
+    if kind is GreaterOrEqual or kind is LessOrEqual:
+        return _compile_ordering(item.attribute, item.value,
+                                 kind is GreaterOrEqual)
+    match = _equality(item.value)
+    if kind is Extensible and item.attribute is None:
+        return lambda entry: any(match(values) for values in entry.values())
+    get = _getter(item.attribute)
+    return lambda entry: match(get(entry))  # Equality, Approx, Extensible
+
+
+def compile(text):
+    """Compile a search filter into a predicate, a function taking an entry
+    and returning whether the filter matches it.
+
+    Entries are dictionaries (or Records) mapping attribute names to values,
+    as returned by parse_message, parse_binary_message or
+    parse_message_records: names are matched case insensitively, and values
+    as matches() does. Values decoded by a wldap.decoders.DecoderRegistry are
+    compared in their LDAP form: booleans as TRUE or FALSE, UUIDs as
+    objectGUID bytes, and datetimes as GeneralizedTime (or as FILETIME
+    against an integer assertion). Decoded SIDs compare as their S-1-...
+    string. Each filter item is resolved once, so that evaluating
+    the predicate involves no parsing nor any dispatch on the filter tree.
+
+    Args:
+        text: the filter string, or an already parsed filter
+    """
+    if isinstance(text, (bytes, type(u''))):
+        text = parse(text)
+    return _compile(text)
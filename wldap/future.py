@@ -12,28 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import namedtuple
+import logging
+import time
+
 from wldap.exceptions import TimeoutError
+from wldap.wldap32_constants import LDAP_MSG_ALL
+
+
+# Same values as the concurrent.futures constants, so that either can be used.
+FIRST_COMPLETED = 'FIRST_COMPLETED'
+FIRST_EXCEPTION = 'FIRST_EXCEPTION'
+ALL_COMPLETED = 'ALL_COMPLETED'
+
+DoneAndNotDoneFutures = namedtuple('DoneAndNotDoneFutures', 'done not_done')
+
+# When waiting on Futures which don't share a ResultDispatcher, the maximum
+# time spent blocking on any single one of them.
+_POLL_INTERVAL = 0.01
+
+_logger = logging.getLogger(__name__)
 
 
 class Future(object):
     """The Future holds an asynchronous operation result.
 
     Its design is loosely inspired by PEP-3148: it should comply as described
-    for the cancel(), cancelled(), exception(), done() and result() operations.
+    for the add_done_callback(), cancel(), cancelled(), exception(), done() and
+    result() operations. See the module wait(), wait_all() and as_completed()
+    functions to wait on several Futures at once.
     """
 
-    def __init__(self, ldap, msgid):
+    def __init__(self, ldap, msgid, dispatcher=None):
+        """Construct a new Future instance.
+
+        Args:
+            ldap: the wldap.ldap instance the operation was issued on
+            msgid: the message ID of the operation
+            dispatcher: the ResultDispatcher of the session, if any, in which
+                case the result is obtained through it
+        """
+        self._callbacks = []
         self._cancelled = False
+        self._dispatcher = dispatcher
         self._exception = None
         self._ldap = ldap
         self._msgid = msgid
         self._result = None
+        if dispatcher is not None:
+            dispatcher.register(self)
 
     def _has_result_or_exc(self):
         return not (self._exception is None and self._result is None)
 
+    def _invoke_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                _logger.exception('exception calling callback for %r', self)
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self._invoke_callbacks()
+
+    def _set_result(self, result):
+        self._result = result
+        self._invoke_callbacks()
+
+    def add_done_callback(self, fn):
+        """Attach a callable to be called with the Future as its only argument
+        when it completes or is cancelled. The callable is called immediately
+        if the Future is already completed.
+
+        Callbacks are called by the thread which obtains the result, that is
+        from within result(), exception(), done() or the module wait
+        functions.
+        """
+        if self._has_result_or_exc() or self._cancelled:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
     def cancel(self):
         self._cancelled = self._ldap.abandon(self._msgid)
+        if self._cancelled:
+            if self._dispatcher is not None:
+                self._dispatcher.unregister(self)
+            self._invoke_callbacks()
         return self._cancelled
 
     def cancelled(self):
@@ -53,14 +120,19 @@ class Future(object):
 
     def _get_result(self, timeout_seconds=None, raise_timeout=True):
         try:
-            LDAP_MSG_ALL = 0x1
-            ret = self._ldap.result(self._msgid, LDAP_MSG_ALL, timeout_seconds)
+            if self._dispatcher is not None:
+                self._dispatcher.wait(self, timeout_seconds)
+                ret = self._result
+            else:
+                ret = self._ldap.result(self._msgid, LDAP_MSG_ALL,
+                                        timeout_seconds)
         except Exception as exc:
             ret = None
-            self._exception = exc
+            self._set_exception(exc)
         else:
             if ret is not None:
-                self._result = ret
+                if ret is not self._result:
+                    self._set_result(ret)
             elif raise_timeout:
                 raise TimeoutError()
         return ret
@@ -77,3 +149,108 @@ class Future(object):
         # currently being executed and cannot be cancelled". Well, the future
         # is either completed or can be cancelled, so that's always False.
         return False
+
+
+def _is_done(future):
+    return future.cancelled() or future._has_result_or_exc()
+
+
+def _wait_next(pending, timeout_seconds):
+    """Wait for at least one of the `pending` Futures to complete, or for the
+    timeout to expire.
+
+    When all Futures share the same ResultDispatcher, this is a single
+    ldap_result call. Otherwise each Future is polled, then the first one is
+    waited on for at most _POLL_INTERVAL seconds.
+
+    Returns the set of completed Futures.
+    """
+    dispatchers = set(future._dispatcher for future in pending)
+    if len(dispatchers) == 1 and None not in dispatchers:
+        dispatchers.pop().poll(timeout_seconds)
+    else:
+        done = set(future for future in pending if future.done())
+        if done:
+            return done
+        interval = _POLL_INTERVAL
+        if timeout_seconds is not None:
+            interval = min(interval, timeout_seconds)
+        next(iter(pending))._get_result(interval, False)
+    return set(future for future in pending if _is_done(future))
+
+
+def as_completed(fs, timeout=None):
+    """Return an iterator over the Futures of `fs`, yielding them as they
+    complete (same as concurrent.futures.as_completed).
+
+    Args:
+        fs: a sequence of Futures
+        timeout: a fractional number of seconds for all Futures to complete,
+            block indefinitely if None (default)
+
+    Raises TimeoutError if some Futures are still pending after `timeout`.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+
+    pending = set(fs)
+    done = set(future for future in pending if _is_done(future))
+    while True:
+        for future in done:
+            yield future
+        pending = pending - done
+        if not pending:
+            return
+
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining < 0:
+                raise TimeoutError()
+        done = _wait_next(pending, remaining)
+
+
+def wait(fs, timeout=None, return_when=ALL_COMPLETED):
+    """Wait for the Futures of `fs` to complete (same as
+    concurrent.futures.wait).
+
+    Args:
+        fs: a sequence of Futures
+        timeout: a fractional number of seconds to wait, block indefinitely if
+            None (default)
+        return_when: FIRST_COMPLETED, FIRST_EXCEPTION or ALL_COMPLETED
+
+    Returns a DoneAndNotDoneFutures (done, not_done) named tuple of sets.
+    """
+    done, not_done = set(), set(fs)
+    try:
+        for future in as_completed(fs, timeout):
+            done.add(future)
+            not_done.discard(future)
+            if return_when == FIRST_COMPLETED:
+                break
+            if (return_when == FIRST_EXCEPTION and not future.cancelled() and
+                    future._exception is not None):
+                break
+    except TimeoutError:
+        pass
+    return DoneAndNotDoneFutures(done, not_done)
+
+
+def wait_all(fs, timeout=None):
+    """Wait for all the Futures of `fs` to complete within a single deadline,
+    processing results in completion order.
+
+    Args:
+        fs: a sequence of Futures
+        timeout: a fractional number of seconds for all Futures to complete,
+            block indefinitely if None (default)
+
+    Returns the list of results, in the order of `fs`. Raises TimeoutError if
+    some Futures are still pending after `timeout`, or the exception of the
+    first failed Future.
+    """
+    for _ in as_completed(fs, timeout):
+        pass
+    return [future.result(0) for future in fs]
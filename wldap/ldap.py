@@ -15,10 +15,14 @@
 from ctypes import byref, c_wchar_p
 
 from wldap import wldap32_dll as dll
+from wldap.bulk import run_bulk
+from wldap.cache import SearchCache
 from wldap.changeset import Changeset
+from wldap.dispatcher import ResultDispatcher
 from wldap.exceptions import LdapError
 from wldap.future import Future
-from wldap.message import Message
+from wldap.message import Message, parse_binary_message, parse_message
+from wldap.search import PagedSearch, PreparedSearch, SearchIterator
 from wldap.wldap32_constants import LDAP_PORT, LDAP_SUCCESS
 from wldap.wldap32_structures import LDAP_TIMEVAL, LDAPMessage
 
@@ -33,17 +37,35 @@ class ldap(object):
             hostName: host string ("default" LDAP server if NULL)
             portNumber: TCP port to which to connect
         """
+        self._cache = None
+        self._dispatcher = None
         self._l = dll.ldap_init(hostName, portNumber)
         self._unbound = False
 
     def __del__(self):
         try:
-            if not self._unbound:
+            if hasattr(self, '_unbound') and not self._unbound:
                 self.unbind()
         except LdapError:  # pragma: no cover
             # I'm a C++ developed, my religion forbids me throwing from a dtor
             pass
 
+    def _future(self, msgid):
+        return Future(self, msgid, self._dispatcher)
+
+    def _invalidate(self, dn, future=None):
+        # Drop the cached searches a write to `dn` may affect, and again once
+        # an asynchronous write completes, as searches issued meanwhile may
+        # have cached the entry as it was before. The Future completes when
+        # its result is received: only once it is polled or waited for, unless
+        # the session has a dispatcher routing the results of all its Futures.
+        cache = self._cache
+        if cache is not None:
+            cache.invalidate(dn)
+            if future is not None:
+                future.add_done_callback(lambda _: cache.invalidate(dn))
+        return future
+
     @staticmethod
     def _make_attrs(attrs):
         # Convert attribute list to a C, nul-terminated string array.
@@ -79,7 +101,10 @@ class ldap(object):
         """
         changeset = Changeset()
         [changeset.add(attr, values) for attr, values in args]
-        dll.ldap_add_s(self._l, dn, changeset.to_api_param())
+        try:
+            dll.ldap_add_s(self._l, dn, changeset.to_api_param())
+        finally:
+            self._invalidate(dn)
 
     def add(self, dn, *args):
         """Initiate an asynchronous add operation to a directory tree.
@@ -92,8 +117,8 @@ class ldap(object):
         """
         changeset = Changeset()
         [changeset.add(attr, values) for attr, values in args]
-        return Future(self, dll.ldap_add(self._l, dn,
-                                         changeset.to_api_param()))
+        return self._invalidate(dn, self._future(dll.ldap_add(
+            self._l, dn, changeset.to_api_param())))
 
     def bind_s(self, dn, cred, method):
         """Initiate a synchronous operation to authenticate the client to the
@@ -140,7 +165,49 @@ class ldap(object):
         See http://msdn.microsoft.com/en-us/library/windows/desktop/aa366153(v=
         vs.85).aspx for details.
         """
-        return Future(self, dll.ldap_bind(self._l, dn, cred, method))
+        return self._future(dll.ldap_bind(self._l, dn, cred, method))
+
+    def bulk_add(self, entries, window=64):
+        """Add many entries, pipelining the asynchronous add operations.
+
+        At most `window` operations are in flight at any time. Operations on
+        the same DN complete in submission order, while operations on
+        different DNs run concurrently.
+
+        Args:
+            entries: an iterable of (dn, attributes) pairs, where attributes is
+                a sequence of (attribute, values) pairs as for ldap.add
+            window: the maximum number of operations in flight
+
+        Returns a wldap.bulk.BulkReport holding the outcome of each operation.
+        """
+        return run_bulk(self, entries, lambda dn, attrs: self.add(dn, *attrs),
+                        window)
+
+    def bulk_delete(self, dns, window=64):
+        """Delete many entries, pipelining the asynchronous delete operations
+        as for ldap.bulk_add.
+
+        Args:
+            dns: an iterable of distinguished names
+            window: the maximum number of operations in flight
+
+        Returns a wldap.bulk.BulkReport holding the outcome of each operation.
+        """
+        return run_bulk(self, ((dn, None) for dn in dns),
+                        lambda dn, _: self.delete(dn), window)
+
+    def bulk_modify(self, changes, window=64):
+        """Modify many entries, pipelining the asynchronous modify operations
+        as for ldap.bulk_add.
+
+        Args:
+            changes: an iterable of (dn, changeset) pairs
+            window: the maximum number of operations in flight
+
+        Returns a wldap.bulk.BulkReport holding the outcome of each operation.
+        """
+        return run_bulk(self, changes, self.modify, window)
 
     def check_filter(self, search_filter):
         """Verify `search_filter` syntax.
@@ -169,7 +236,10 @@ class ldap(object):
 
         Returns nothing, and raises LdapError on error.
         """
-        dll.ldap_delete_s(self._l, dn)
+        try:
+            dll.ldap_delete_s(self._l, dn)
+        finally:
+            self._invalidate(dn)
 
     def delete(self, dn):
         """Initiate a asynchronous delete operation from the directory tree.
@@ -179,7 +249,49 @@ class ldap(object):
 
         Returns a Future object, and raises LdapError on error.
         """
-        return Future(self, dll.ldap_delete(self._l, dn))
+        return self._invalidate(dn, self._future(dll.ldap_delete(self._l,
+                                                                 dn)))
+
+    def enable_cache(self, cache=None, **kwargs):
+        """Cache the results of search_cached, and invalidate them on writes
+        through this session (see wldap.cache.SearchCache).
+
+        A cache may be shared by sessions bound with the same identity, but
+        never across identities, as cached results would bypass the access
+        control of the directory.
+
+        Asynchronous writes drop the cached results they may affect when
+        issued, and again when their Future completes. Until then, searches
+        may cache the entries as they were before the write: wait on the
+        Future of a write, or enable_dispatcher() so that the result of any
+        Future completes it, before relying on the cache to reflect it.
+
+        Args:
+            cache: the SearchCache to use, or None to create one
+            **kwargs: the SearchCache constructor arguments, if cache is None
+
+        Returns the session SearchCache.
+        """
+        if cache is None:
+            cache = self._cache or SearchCache(**kwargs)
+        self._cache = cache
+        return cache
+
+    def enable_dispatcher(self):
+        """Route the results of the asynchronous operations of this session
+        through a single ResultDispatcher: waiting on any Future then calls
+        ldap_result for any message ID, and completes whichever Future the
+        received result belongs to.
+
+        Futures created before the dispatcher is enabled, as well as
+        search_iter and search_paged, keep on polling their own message ID
+        and should not be mixed with dispatched Futures.
+
+        Returns the session ResultDispatcher.
+        """
+        if self._dispatcher is None:
+            self._dispatcher = ResultDispatcher(self)
+        return self._dispatcher
 
     def modify_s(self, dn, changeset):
         """Initiate a synchronous modify operation to the directory tree.
@@ -190,7 +302,10 @@ class ldap(object):
 
         Returns nothing, and raises LdapError on error.
         """
-        dll.ldap_modify_s(self._l, dn, changeset.to_api_param())
+        try:
+            dll.ldap_modify_s(self._l, dn, changeset.to_api_param())
+        finally:
+            self._invalidate(dn)
 
     def modify(self, dn, changeset):
         """Initiate an asynchronous modify operation to the directory tree.
@@ -201,8 +316,30 @@ class ldap(object):
 
         Returns a Future object, and raises LdapError on error.
         """
-        return Future(self, dll.ldap_modify(self._l, dn,
-                                            changeset.to_api_param()))
+        return self._invalidate(dn, self._future(dll.ldap_modify(
+            self._l, dn, changeset.to_api_param())))
+
+    def prepare_search(self, base, scope, filt, attr, attronly, **kwargs):
+        """Prepare a search to run repeatedly with different filter
+        parameters, such as a lookup by account name.
+
+        Args:
+            base: distinguished name of the entry at which to start the search
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+            filt: the search filter template, holding str.format replacement
+                fields such as "(sAMAccountName={0})"
+            attr: a list of attribute names to be returned
+            attronly: True if both attribute types and values are to be
+                returned, False if only types are required
+            **kwargs: binary, with_dn, max_buffered and timeout_seconds, as
+                for search_iter
+
+        Returns a PreparedSearch. Raises LdapError if the filter template is
+        invalid, and ValueError if one of its fields has a conversion, a
+        format spec or a lookup.
+        """
+        return PreparedSearch(self, base, scope, filt, attr, attronly,
+                              **kwargs)
 
     def result(self, msgid, all_, timeout_seconds=None):
         """Obtain the result of an asynchronous operation.
@@ -242,6 +379,41 @@ class ldap(object):
                           byref(res))
         return Message(self._l, res)
 
+    def search_cached(self, base, scope, filt, attr, attronly, binary=False):
+        """Initiate a synchronous search operation, unless its parsed results
+        are in the session cache (see enable_cache).
+
+        Args:
+            base: distinguished name of the entry at which to start the search
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+            filt: the search filter
+            attr: a list of attribute names to be returned
+            attronly: True if both attribute types and values are to be
+                returned, False if only types are required
+            binary: True to return values as bytes rather than unicode strings
+
+        Returns a list as returned by parse_message (or parse_binary_message),
+        shared with the other callers and which must not be modified, and
+        raises LdapError on error.
+        """
+        cache = self._cache
+        if cache is not None:
+            key = cache.key(base, scope, filt, attr, attronly, binary)
+            results = cache.get(key)
+            if results is not None:
+                return results
+            generation = cache.generation
+
+        message = self.search_s(base, scope, filt, attr, attronly)
+        try:
+            results = (parse_binary_message if binary else parse_message)(
+                message)
+        finally:
+            message.release()
+        if cache is not None:
+            cache.put(key, results, generation)
+        return results
+
     def search(self, base, scope, filt, attr, attronly):
         """Initiate an asynchronous search operation.
 
@@ -257,9 +429,66 @@ class ldap(object):
         """
         # Convert attribute list to a C, nul-terminated string array.
         attr = self._make_attrs(attr)
-        return Future(self, dll.ldap_search(self._l, base, scope, filt, attr,
+        return self._future(dll.ldap_search(self._l, base, scope, filt, attr,
                                             attronly))
 
+    def search_paged(self, base, scope, filt, attr, attronly, page_size=1000,
+                     cookie=None, binary=False, with_dn=False,
+                     timeout_seconds=None):
+        """Initiate a paged search operation, and iterate over its pages.
+
+        Args:
+            base: distinguished name of the entry at which to start the search
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+            filt: the search filter
+            attr: a list of attribute names to be returned
+            attronly: True if both attribute types and values are to be
+                returned, False if only types are required
+            page_size: the number of entries to request per page
+            cookie: the cookie of the last processed SearchPage, to resume an
+                interrupted search (on the same connection)
+            binary: True to return values as bytes rather than unicode strings
+            with_dn: True to return (dn, attributes) pairs, or a callable such
+                as wldap.dn.parse to apply to dn
+            timeout_seconds: a fractional number of seconds to wait for each
+                page, block indefinitely if None (default)
+
+        Returns a PagedSearch yielding SearchPage (entries, cookie) tuples,
+        where entries are as returned by parse_message, and raises LdapError
+        on error.
+        """
+        return PagedSearch(self, base, scope, filt, attr, attronly, page_size,
+                           cookie, binary, with_dn, timeout_seconds)
+
+    def search_iter(self, base, scope, filt, attr, attronly, binary=False,
+                    with_dn=False, max_buffered=100, timeout_seconds=None):
+        """Initiate an asynchronous search operation, and iterate over its
+        entries as they are received.
+
+        Args:
+            base: distinguished name of the entry at which to start the search
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+            filt: the search filter
+            attr: a list of attribute names to be returned
+            attronly: True if both attribute types and values are to be
+                returned, False if only types are required
+            binary: True to return values as bytes rather than unicode strings
+            with_dn: True to yield (dn, attributes) pairs, or a callable such
+                as wldap.dn.parse to apply to dn
+            max_buffered: maximum number of received entries waiting to be
+                consumed
+            timeout_seconds: a fractional number of seconds to wait for each
+                result message, block indefinitely if None (default)
+
+        Returns a SearchIterator yielding dictionaries (as parse_message items),
+        and raises LdapError on error, once the entries received before the
+        error are yielded.
+        """
+        attr = self._make_attrs(attr)
+        msgid = dll.ldap_search(self._l, base, scope, filt, attr, attronly)
+        return SearchIterator(self, msgid, binary, with_dn, max_buffered,
+                              timeout_seconds)
+
     def simple_bind_s(self, dn, passwd):
         """Initiate a synchronous request to authenticate with the server using
         a plaintext password.
@@ -274,7 +503,7 @@ class ldap(object):
 
         Returns a Future object, and raises LdapError on error.
         """
-        return Future(self, dll.ldap_simple_bind(self._l, dn, passwd))
+        return self._future(dll.ldap_simple_bind(self._l, dn, passwd))
 
     def unbind_s(self):
         """Synchronously free resources associated with the LDAP session. There
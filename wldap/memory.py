@@ -0,0 +1,508 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory directory, and a Backend serving it with modelled latencies.
+
+The MemoryBackend answers the Wldap32 functions from a Directory held in the
+process, after a simulated service time. It is meant to study throughput and
+tail latency without a domain controller: latencies, jitter and error rates
+are configurable per operation, random draws come from a seeded generator,
+and time can be simulated by a VirtualClock so that runs are deterministic
+and don't actually wait.
+"""
+
+from collections import OrderedDict
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from wldap import filter as filters
+from wldap import protocol
+from wldap.backend import Backend, Session
+from wldap.wldap32_constants import LDAP_ALREADY_EXISTS, LDAP_BUSY
+from wldap.wldap32_constants import LDAP_COMPARE_FALSE, LDAP_COMPARE_TRUE
+from wldap.wldap32_constants import LDAP_INVALID_CREDENTIALS
+from wldap.wldap32_constants import LDAP_NO_SUCH_ATTRIBUTE
+from wldap.wldap32_constants import LDAP_NO_SUCH_OBJECT
+from wldap.wldap32_constants import LDAP_NOT_ALLOWED_ON_NONLEAF
+from wldap.wldap32_constants import LDAP_PROTOCOL_ERROR
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SIZELIMIT_EXCEEDED, LDAP_SUCCESS
+from wldap.wldap32_constants import LDAP_UNAVAILABLE_CRIT_EXTENSION
+from wldap.wldap32_structures import LDAPMod
+
+
+# Operation names, as used to configure the MemoryBackend, and the response
+# type of each request.
+_OPERATIONS = {
+    protocol.BindRequest: ('bind', protocol.BindResponse),
+    protocol.SearchRequest: ('search', protocol.SearchResultDone),
+    protocol.ModifyRequest: ('modify', protocol.ModifyResponse),
+    protocol.AddRequest: ('add', protocol.AddResponse),
+    protocol.DelRequest: ('delete', protocol.DelResponse),
+    protocol.CompareRequest: ('compare', protocol.CompareResponse),
+}
+OPERATIONS = sorted(name for name, _ in _OPERATIONS.values())
+
+
+def normalize_dn(dn):
+    return ','.join(rdn.strip() for rdn in dn.lower().split(','))
+
+
+def _parent(dn):
+    return dn.partition(',')[2]
+
+
+def _in_scope(dn, base, scope):
+    if scope == LDAP_SCOPE_BASE:
+        return dn == base
+    if scope == LDAP_SCOPE_ONELEVEL:
+        return _parent(dn) == base
+    return dn == base or not base or dn.endswith(',' + base)
+
+
+def _result(kind, code):
+    return kind(code, '', '', None)
+
+
+def _find(attributes, name):
+    name = name.lower()
+    for description in attributes:
+        if description.lower() == name:
+            return description
+    return None
+
+
+class Directory(object):
+    """A tree of entries, and the processing of protocol requests against it.
+
+    Entries are stored by normalized DN as (dn, attributes, lowered) triples,
+    where attributes is an OrderedDict mapping attribute names to lists of
+    bytes values, and lowered the same mapping by lower cased names (as
+    expected by filter.matches). No schema is enforced. The entry with an
+    empty DN, if any, stands for the root DSE.
+
+    With `usn` set, the directory numbers its updates as Active Directory
+    does: each stored entry gets its uSNChanged (and uSNCreated) attribute,
+    and the root DSE its highestCommittedUSN.
+
+    Searches support the paged results control (see process_message).
+    """
+
+    def __init__(self, usn=False):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.usn = 0 if usn else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, dn, attributes):
+        """Add or replace the entry `dn`, given its attributes as a sequence
+        of (name, values) pairs, where values are text or bytes.
+        """
+        self._store(dn, OrderedDict(
+            (name, [v if isinstance(v, bytes) else v.encode('utf-8')
+                    for v in values])
+            for name, values in attributes))
+
+    def _store(self, dn, attributes):
+        key = normalize_dn(dn)
+        if self.usn is not None and key:
+            usn = [str(self._next_usn()).encode('ascii')]
+            previous = self.entries.get(key)
+            created = previous and previous[2].get('usncreated')
+            attributes[_find(attributes, 'uSNCreated') or 'uSNCreated'] = \
+                created or usn
+            attributes[_find(attributes, 'uSNChanged') or 'uSNChanged'] = usn
+        lowered = dict((name.lower(), values)
+                       for name, values in attributes.items())
+        self.entries[key] = (dn, attributes, lowered)
+
+    def _next_usn(self):
+        self.usn = self.usn + 1
+        root = self.entries.get('')
+        if root is not None:
+            usn = [str(self.usn).encode('ascii')]
+            root[1][_find(root[1], 'highestCommittedUSN') or
+                    'highestCommittedUSN'] = usn
+            root[2]['highestcommittedusn'] = usn
+        return self.usn
+
+    def _get(self, dn):
+        return self.entries.get(normalize_dn(dn))
+
+    def process(self, request):
+        """Return the list of responses to the protocol operation `request`.
+        """
+        handler = getattr(self, '_' + type(request).__name__, None)
+        if handler is None:
+            return []
+        with self.lock:
+            return handler(request)
+
+    def process_message(self, message):
+        """Return the list of responses to the protocol.LDAPMessage
+        `message`, as LDAPMessage objects.
+
+        Beyond process(), this serves searches holding a paged results control
+        one page at a time: each page evaluates the search again, and its
+        cookie is the offset of the next page. Requests holding any other
+        critical control fail with LDAP_UNAVAILABLE_CRIT_EXTENSION.
+        """
+        op = message.op
+        if type(op) not in _OPERATIONS:
+            return []
+        response_type = _OPERATIONS[type(op)][1]
+        paging = None
+        for control in message.controls or []:
+            if (control.oid == protocol.PAGED_RESULTS_OID and
+                    response_type is protocol.SearchResultDone):
+                paging = control
+            elif control.critical:
+                return [protocol.LDAPMessage(message.msgid, _result(
+                    response_type, LDAP_UNAVAILABLE_CRIT_EXTENSION), [])]
+
+        responses = self.process(op)
+        controls = []
+        if paging is not None:
+            try:
+                size, cookie = protocol.decode_paged_results(paging.value)
+            except ValueError:
+                size, cookie = -1, b''
+            if size < 0 or (cookie and not cookie.isdigit()):
+                return [protocol.LDAPMessage(message.msgid, _result(
+                    response_type, LDAP_PROTOCOL_ERROR), [])]
+            offset = int(cookie or 0)
+            entries, done = responses[:-1], responses[-1]
+            cookie = b''
+            if 0 < size and offset + size < len(entries):
+                cookie = str(offset + size).encode('ascii')
+                done = _result(protocol.SearchResultDone, LDAP_SUCCESS)
+            # A page size of 0 abandons the paged search.
+            responses = entries[offset:offset + size] + [done]
+            controls = [protocol.Control(
+                protocol.PAGED_RESULTS_OID, False,
+                protocol.encode_paged_results(len(entries), cookie))]
+        last = len(responses) - 1
+        return [protocol.LDAPMessage(message.msgid, response,
+                                     controls if idx == last else [])
+                for idx, response in enumerate(responses)]
+
+    def _BindRequest(self, request):
+        code = LDAP_SUCCESS
+        if request.name:  # Else an anonymous bind
+            entry = self._get(request.name)
+            passwords = entry and entry[2].get('userpassword')
+            if not passwords or request.password not in passwords:
+                code = LDAP_INVALID_CREDENTIALS
+        return [_result(protocol.BindResponse, code)]
+
+    def _SearchRequest(self, request):
+        base = normalize_dn(request.base)
+        if base and base not in self.entries:
+            return [_result(protocol.SearchResultDone, LDAP_NO_SUCH_OBJECT)]
+        if request.scope == LDAP_SCOPE_BASE:
+            candidates = []
+            if base in self.entries:
+                candidates = [(base, self.entries[base])]
+        else:  # The root DSE only shows up in base searches
+            candidates = (item for item in self.entries.items() if item[0])
+
+        accept = filters.compile(request.filter)
+        wanted = set(name.lower() for name in request.attributes)
+        everything = not wanted or '*' in wanted
+        responses = []
+        for key, (dn, attributes, lowered) in candidates:
+            if not _in_scope(key, base, request.scope) or not accept(lowered):
+                continue
+            if request.size_limit and len(responses) == request.size_limit:
+                responses.append(_result(protocol.SearchResultDone,
+                                         LDAP_SIZELIMIT_EXCEEDED))
+                return responses
+            responses.append(protocol.SearchResultEntry(dn, [
+                (name, [] if request.types_only else list(values))
+                for name, values in attributes.items()
+                if everything or name.lower() in wanted]))
+        responses.append(_result(protocol.SearchResultDone, LDAP_SUCCESS))
+        return responses
+
+    def _AddRequest(self, request):
+        if self._get(request.dn) is not None:
+            code = LDAP_ALREADY_EXISTS
+        else:
+            self.add(request.dn, request.attributes)
+            code = LDAP_SUCCESS
+        return [_result(protocol.AddResponse, code)]
+
+    @staticmethod
+    def _apply(attributes, operation, name, values):
+        existing = _find(attributes, name) or name
+        current = attributes.get(existing, [])
+        if operation == LDAPMod.LDAP_MOD_ADD:
+            attributes[existing] = current + values
+        elif operation == LDAPMod.LDAP_MOD_REPLACE:
+            attributes[existing] = list(values)
+        elif values:
+            if any(value not in current for value in values):
+                return LDAP_NO_SUCH_ATTRIBUTE
+            attributes[existing] = [v for v in current if v not in values]
+        else:
+            attributes.pop(existing, None)
+        if not attributes.get(existing, True):
+            del attributes[existing]
+        return LDAP_SUCCESS
+
+    def _ModifyRequest(self, request):
+        entry = self._get(request.dn)
+        code = LDAP_NO_SUCH_OBJECT
+        if entry is not None:
+            attributes = OrderedDict(entry[1])
+            for operation, name, values in request.changes:
+                code = self._apply(attributes, operation, name, values)
+                if code != LDAP_SUCCESS:
+                    break
+            else:
+                self._store(entry[0], attributes)
+        return [_result(protocol.ModifyResponse, code)]
+
+    def _DelRequest(self, request):
+        key = normalize_dn(request.dn)
+        if key not in self.entries:
+            code = LDAP_NO_SUCH_OBJECT
+        elif any(_parent(other) == key for other in self.entries):
+            code = LDAP_NOT_ALLOWED_ON_NONLEAF
+        else:
+            del self.entries[key]
+            if self.usn is not None:
+                self._next_usn()
+            code = LDAP_SUCCESS
+        return [_result(protocol.DelResponse, code)]
+
+    def _CompareRequest(self, request):
+        entry = self._get(request.dn)
+        if entry is None:
+            code = LDAP_NO_SUCH_OBJECT
+        elif request.attribute.lower() not in entry[2]:
+            code = LDAP_NO_SUCH_ATTRIBUTE
+        else:
+            assertion = filters.Equality(request.attribute, request.value)
+            code = LDAP_COMPARE_FALSE
+            if filters.matches(assertion, entry[2]):
+                code = LDAP_COMPARE_TRUE
+        return [_result(protocol.CompareResponse, code)]
+
+
+class SystemClock(object):
+    """Wall clock time: waiting actually blocks."""
+
+    def time(self):
+        return time.time()
+
+    def wait(self, condition, timeout):
+        condition.wait(timeout)
+
+
+class VirtualClock(object):
+    """Simulated time, starting at `start`: waiting for a given duration
+    doesn't block but moves the clock forward.
+
+    Waiting without a timeout (that is, for a request to be sent by another
+    thread) still blocks. Concurrent waits for the same instant move the clock
+    only once, so that sessions driven from several threads share a timeline.
+    """
+
+    def __init__(self, start=0.0):
+        self._lock = threading.Lock()
+        self._now = start
+
+    def time(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.advance(self._now + seconds)
+
+    def advance(self, instant):
+        """Move the clock forward to `instant`, if it is in the future."""
+        with self._lock:
+            self._now = max(self._now, instant)
+
+    def wait(self, condition, timeout):
+        if timeout is None:
+            condition.wait()
+        else:
+            self.sleep(timeout)
+
+
+def _by_operation(value, name):
+    # Expand a number, or a dictionary of numbers by operation name, to a
+    # dictionary covering every operation.
+    if isinstance(value, dict):
+        unknown = set(value) - set(OPERATIONS)
+        if unknown:
+            raise ValueError('Unknown operations for %s: %s' %
+                             (name, ', '.join(sorted(unknown))))
+        return dict((op, value.get(op, 0.0)) for op in OPERATIONS)
+    return dict((op, value) for op in OPERATIONS)
+
+
+class MemoryBackend(Backend):
+    """Implementation of the Wldap32 functions serving an in-memory
+    Directory, with modelled service times:
+
+    >>> from wldap import wldap32_dll
+    >>> from wldap.memory import Directory, MemoryBackend, VirtualClock
+    >>> directory = Directory()
+    >>> directory.add('dc=example', [('objectClass', ['domain'])])
+    >>> backend = MemoryBackend(directory, latency={'search': 0.002},
+    ...                         jitter=0.001, seed=42, clock=VirtualClock())
+    >>> wldap32_dll.use_backend(backend)
+
+    The service time of a request is its latency, plus a random jitter drawn
+    from an exponential distribution (which gives the long tail observed on
+    actual servers), plus `entry_time` for each returned search entry: the
+    entries of a search are delivered one by one as they are "produced".
+
+    Requests are served by `concurrency` workers, shared by all sessions (an
+    unlimited number if None): once all of them are busy, requests wait for
+    the first one to be available, which models the server throughput.
+    """
+
+    def __init__(self, directory=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_code=LDAP_BUSY, entry_time=0.0,
+                 concurrency=None, seed=None, clock=None):
+        """Construct a new MemoryBackend instance.
+
+        Args:
+            directory: the Directory to serve, an empty one if None
+            latency: the base service time of a request, in fractional
+                seconds, either for all operations or as a dictionary by
+                operation name (see OPERATIONS)
+            jitter: the mean of the random extra service time, either for all
+                operations or by operation name
+            error_rate: the probability for a request to fail with
+                `error_code`, either for all operations or by operation name
+            error_code: the result code of the injected failures
+            entry_time: the additional service time per search entry
+            concurrency: the number of requests served at the same time, or
+                None for no limit
+            seed: the seed of the random generator, for reproducible runs
+            clock: a SystemClock (default) or a VirtualClock
+        """
+        if concurrency is not None and concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        super(MemoryBackend, self).__init__()
+        self.clock = clock or SystemClock()
+        self.directory = directory if directory is not None else Directory()
+        self._concurrency = concurrency
+        self._entry_time = entry_time
+        self._error_code = error_code
+        self._error_rate = _by_operation(error_rate, 'error_rate')
+        self._jitter = _by_operation(jitter, 'jitter')
+        self._latency = _by_operation(latency, 'latency')
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._sequence = itertools.count()
+        self._workers = []  # Times at which the busy workers are available
+
+    def _time(self):
+        return self.clock.time()
+
+    def _fails(self, name):
+        """Draw whether a request fails with the injected error code."""
+        with self._lock:
+            return self._random.random() < self._error_rate[name]
+
+    def _schedule(self, name, count):
+        """Return the times at which the `count` responses of a request are
+        delivered.
+        """
+        with self._lock:
+            jitter = self._jitter[name]
+            service = self._latency[name]
+            if jitter:
+                service += self._random.expovariate(1.0 / jitter)
+
+            start = self.clock.time()
+            if self._concurrency is not None:
+                while self._workers and self._workers[0] <= start:
+                    heapq.heappop(self._workers)
+                if len(self._workers) >= self._concurrency:
+                    start = heapq.heappop(self._workers)
+
+            times = [start + service + self._entry_time * (idx + 1)
+                     for idx in range(count - 1)]
+            times.append(start + service + self._entry_time * (count - 1))
+            if self._concurrency is not None:
+                heapq.heappush(self._workers, times[-1])
+        return times
+
+    def _open(self, host, port):
+        session = Session(host, port)
+        session.arrivals = threading.Condition()
+        session.pending = []  # Heap of (due time, sequence, LDAPMessage)
+        return session
+
+    def _write(self, session, msgid, op, controls=None):
+        kind = type(op)
+        if kind is protocol.AbandonRequest:
+            with session.arrivals:
+                session.pending = [item for item in session.pending
+                                   if item[2].msgid != op.msgid]
+                heapq.heapify(session.pending)
+            return
+        if kind not in _OPERATIONS:  # UnbindRequest
+            return
+
+        # The failure is drawn first, so that failed writes are not applied.
+        name, response_type = _OPERATIONS[kind]
+        if self._fails(name):
+            responses = [protocol.LDAPMessage(
+                msgid, _result(response_type, self._error_code), [])]
+        else:
+            responses = self.directory.process_message(
+                protocol.LDAPMessage(msgid, op, controls or []))
+        times = self._schedule(name, len(responses))
+        with session.arrivals:
+            for due, response in zip(times, responses):
+                heapq.heappush(session.pending,
+                               (due, next(self._sequence), response))
+            session.arrivals.notify_all()
+
+    def _read(self, session, timeout):
+        deadline = None if timeout is None else self.clock.time() + timeout
+        with session.arrivals:
+            while True:
+                now = self.clock.time()
+                received = []
+                while session.pending and session.pending[0][0] <= now:
+                    received.append(heapq.heappop(session.pending)[2])
+                if received:
+                    return received
+                if deadline is not None and now >= deadline:
+                    return []
+
+                delay = None
+                if session.pending:
+                    delay = session.pending[0][0] - now
+                if deadline is not None:
+                    delay = min(delay, deadline - now) \
+                        if delay is not None else deadline - now
+                self.clock.wait(session.arrivals, delay)
+
+    def _close(self, session):
+        with session.arrivals:
+            session.pending = []
@@ -12,25 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ctypes import byref, string_at
+from ctypes import byref, c_char, c_void_p, cast, string_at, wstring_at
+from functools import partial
 from itertools import takewhile
 
 from wldap import wldap32_dll as dll
+from wldap.decoders import decode_values
+from wldap.exceptions import LdapError
+from wldap.records import RecordSet
+from wldap.wldap32_constants import LDAP_NO_SUCH_ATTRIBUTE
 from wldap.wldap32_structures import BerElement
 
 
+# Binary views are made read-only with memoryview.toreadonly (Python 3.8+).
+_HAS_VIEWS = hasattr(memoryview, 'toreadonly')
+
+
 class MessageAttribute(object):
     """MessageAttribute: kind of (attribute, [values])."""
 
-    def __init__(self, ldap, message, name):
+    def __init__(self, ldap, message, name, entry=None):
         """Construct a new MessageAttribute instance.
 
         Args:
             ldap: low level LDAP* pointer
             message: the Message instance which attribute we want to extract
             name: the attribute string identifier
+            entry: the MessageEntry caching decoded values, if any
         """
         self.name = name
+        self._entry = entry
         self._ldap = ldap
         self._message = message
 
@@ -54,6 +65,13 @@ class MessageAttribute(object):
 
     @property
     def values(self):
+        # Values read through a MessageEntry are decoded once and served from
+        # its cache afterwards.
+        if self._entry is not None:
+            return iter(self._entry._lookup(self.name) or ())
+        return self._iter_values()
+
+    def _iter_values(self):
         # Cf. MSDN ldap_get_values documentation: 'Call ldap_value_free to
         # release the returned value when it is no longer required'.
         val = dll.ldap_get_values(self._ldap, self._message, self.name)
@@ -109,7 +127,12 @@ class MessageEntryIterator(object):
 
 
 class MessageEntry(object):
-    """MessageEntry."""
+    """MessageEntry.
+
+    Attribute values are decoded at most once: they are cached by the entry
+    (attribute names being case insensitive, so is the cache), and the entry
+    itself is kept by its owning Message.
+    """
 
     def __init__(self, ldap, message_entry):
         """Construct a new MessageEntry instance.
@@ -120,9 +143,54 @@ class MessageEntry(object):
         """
         self._l = ldap
         self._message_entry = message_entry
+        self._names = None  # All attribute names, once known
+        self._values = {}
+
+    def __contains__(self, attributeName):
+        return self._lookup(attributeName) is not None
 
     def __getitem__(self, attributeName):
-        return MessageAttribute(self._l, self._message_entry, attributeName)
+        return MessageAttribute(self._l, self._message_entry, attributeName,
+                                self)
+
+    def _lookup(self, name):
+        """Return the cached list of values for `name`, or None if the entry
+        doesn't hold such attribute.
+        """
+        key = name.lower()
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        values = None
+        if self._names is None:
+            values = _get_values(self._l, self._message_entry, name)
+        self._values[key] = values
+        return values
+
+    def get(self, attributeName, default=None):
+        """Return the list of values for `attributeName`, or `default` if the
+        entry doesn't hold such attribute.
+        """
+        values = self._lookup(attributeName)
+        return default if values is None else list(values)
+
+    def to_dict(self):
+        """Return a dictionary mapping each attribute name of the entry to its
+        list of values, as a parse_message item.
+        """
+        if self._names is None:
+            names = [attribute.name for attribute in self]
+            for name in names:
+                self._lookup(name)
+            self._names = names
+        return {name: list(self._values[name.lower()] or ())
+                for name in self._names}
+
+    @property
+    def dn(self):
+        return _get_dn(self._l, self._message_entry)
 
     def __iter__(self):
         return MessageEntryIterator(self._l, self._message_entry)
@@ -134,13 +202,17 @@ class MessageEntry(object):
 class MessageIterator(object):
     """Implements iteration over LDAPMessage* entries."""
 
-    def __init__(self, ldap, message):
+    def __init__(self, ldap, message, entries=None):
         """Construct a new MessageIterator instance.
 
         Args:
             ldap: low level LDAP* pointer
             message: a LDAPMessage* as obtained, for example, through search
+            entries: a list of the MessageEntry already built for the message,
+                to be reused and completed by the iteration
         """
+        self._entries = entries if entries is not None else []
+        self._index = 0
         self._ldap = ldap
         self._current = dll.ldap_first_entry(self._ldap, message)
 
@@ -154,8 +226,13 @@ class MessageIterator(object):
             raise StopIteration
 
         # Wrap the previously fetched value in a MessageEntry object before
-        # going with the iteration.
-        current = MessageEntry(self._ldap, self._current)
+        # going with the iteration, unless a previous iteration already did.
+        if self._index < len(self._entries):
+            current = self._entries[self._index]
+        else:
+            current = MessageEntry(self._ldap, self._current)
+            self._entries.append(current)
+        self._index = self._index + 1
         self._current = dll.ldap_next_entry(self._ldap, self._current)
         return current
 
@@ -173,39 +250,342 @@ class Message(object):
             ldap: low level LDAP* pointer
             message: a LDAPMessage* as obtained, for example, through search
         """
+        self._berval_arrays = []  # _ValuesArray the views point into
+        self._entries = []
         self._ldap = ldap
         self._message = message
+        self._views = []
 
     def __del__(self):
         # This is essentially the reason of this object existence: ensure
         # proper releasing of the underlying resources.
         if hasattr(self, '_message'):
-            dll.ldap_msgfree(self._message)
+            self.release()
 
     def __iter__(self):
-        return MessageIterator(self._ldap, self._message)
+        return MessageIterator(self._ldap, self._message, self._entries)
 
     def __len__(self):
         return dll.ldap_count_entries(self._ldap, self._message)
 
+    def release(self):
+        """Free the underlying LDAPMessage* without waiting for the Message to
+        be garbage collected. The Message must not be used afterwards.
+
+        The memoryviews returned by parse_binary_message(msg, views=True) are
+        released first, so that using them afterwards raises ValueError. The
+        values arrays they point into are only freed once no memoryview over
+        them remains: views derived from them (for example by slicing), and
+        those still exported (for example to a numpy array), stay valid.
+        """
+        if self._message is not None:
+            for view in self._views:
+                try:
+                    view.release()
+                except BufferError:
+                    # Still exported: the view keeps its values array alive.
+                    pass
+            self._views = []
+            self._berval_arrays = []
+            dll.ldap_msgfree(self._message)
+            self._entries = []
+            self._message = None
+
+
+class _ValuesArray(object):
+    """A berval** values array, freed once no longer referenced.
+
+    The Message references it until released, and so does every ctypes array
+    the memoryviews over its values are exported from: since views derived
+    from a memoryview share its exporter, the values array outlives them all.
+    """
+
+    def __init__(self, values):
+        self._values = values
+
+    def __del__(self):
+        dll.ldap_value_free_len(self._values)
+
+
+def _get_dn(ldap, entry):
+    # Cf. MSDN ldap_get_dn documentation: 'When the returned distinguished
+    # name is no longer needed, free it by calling ldap_memfree'.
+    dn = dll.ldap_get_dn(ldap, entry)
+    try:
+        return wstring_at(dn)
+    finally:
+        dll.ldap_memfree(dn)
+
 
-def parse_message(msg):
+def _get_values(ldap, entry, name):
+    """Return the list of string values for attribute `name` of `entry`, or
+    None if the entry doesn't hold such attribute.
+    """
+    try:
+        values = dll.ldap_get_values(ldap, entry, name)
+    except LdapError as e:
+        if e.args[1] != LDAP_NO_SUCH_ATTRIBUTE:
+            raise
+        return None
+    if not values:
+        return None
+
+    try:
+        return _string_values(values)
+    finally:
+        dll.ldap_value_free(values)
+
+
+def _string_values(values):
+    # Values come as a nul-terminated PCHAR* array.
+    return list(takewhile(bool, values))
+
+
+def _binary_values(values):
+    # Values come as a nul-terminated berval** array.
+    result = []
+    idx = 0
+    while values[idx]:
+        berval = values[idx].contents
+        result.append(string_at(berval.bv_val, berval.bv_len))
+        idx = idx + 1
+    return result
+
+
+def _binary_views(values, arrays, views):
+    # Values come as a nul-terminated berval** array, which ownership is taken
+    # by a _ValuesArray appended to `arrays`: the returned views are also
+    # appended to `views` for later release.
+    if not _HAS_VIEWS:  # pragma: no cover
+        raise NotImplementedError('Binary views require Python 3.8+')
+    owner = _ValuesArray(values)
+    arrays.append(owner)
+    result = []
+    idx = 0
+    while values[idx]:
+        berval = values[idx].contents
+        address = cast(berval.bv_val, c_void_p).value
+        if berval.bv_len and address:
+            buf = (c_char * berval.bv_len).from_address(address)
+            buf.owner = owner
+            view = memoryview(buf).cast('B').toreadonly()
+        else:
+            view = memoryview(b'')
+        result.append(view)
+        views.append(view)
+        idx = idx + 1
+    return result
+
+
+def _keep_values(values):
+    # The values array of binary views is freed by its _ValuesArray.
+    pass
+
+
+def _extract_entries(msg, binary, with_dn=False, views=False, records=None,
+                     decoders=None):
+    """Walk every attribute of every entry of a Message in a single loop.
+
+    This is the engine behind parse_message and parse_binary_message: rather
+    than going through the MessageIterator / MessageEntry / MessageAttribute
+    wrappers, it drives the ldap_(first|next)_(entry|attribute) calls directly
+    and converts each values array as soon as it is fetched. When `with_dn` is
+    set, (dn, attributes) pairs are returned rather than attributes only, and
+    when it is callable (such as wldap.dn.parse) it is applied to dn. When
+    `views` is set, binary values are returned as memoryviews, and the values
+    arrays are only freed by Message.release(). When `records` is set, entries
+    are appended to this RecordSet, which is returned. When `decoders` is set,
+    the values of the attributes it holds a decoder for are fetched as strings
+    or bytes as the decoder requires, and decoded in the same pass.
+    """
+    if binary and views:
+        get_values = dll.ldap_get_values_len
+        value_free = _keep_values
+        convert = partial(_binary_views, arrays=msg._berval_arrays,
+                          views=msg._views)
+    elif binary:
+        get_values = dll.ldap_get_values_len
+        value_free = dll.ldap_value_free_len
+        convert = _binary_values
+    else:
+        get_values = dll.ldap_get_values
+        value_free = dll.ldap_value_free
+        convert = _string_values
+    first_attribute = dll.ldap_first_attribute
+    next_attribute = dll.ldap_next_attribute
+    next_entry = dll.ldap_next_entry
+    lookup = decoders.lookup if decoders is not None else None
+    fetchers = {
+        False: (dll.ldap_get_values, dll.ldap_value_free, _string_values),
+        True: (dll.ldap_get_values_len, dll.ldap_value_free_len,
+               _binary_values),
+    }
+
+    make_dn = with_dn if callable(with_dn) else None
+    ldap = msg._ldap
+    result = []
+    entry = dll.ldap_first_entry(ldap, msg._message)
+    while entry:
+        attributes = {}
+        ber = BerElement.pointer()
+        try:
+            name = first_attribute(ldap, entry, byref(ber))
+            while name is not None:
+                decoder = lookup(name) if lookup is not None else None
+                if decoder is None:
+                    fetch, free, read = get_values, value_free, convert
+                else:
+                    fetch, free, read = fetchers[decoder.binary]
+                # The values array may be NULL when no values were found.
+                values = fetch(ldap, entry, name)
+                if values:
+                    try:
+                        attributes[name] = read(values)
+                    finally:
+                        free(values)
+                    if decoder is not None:
+                        attributes[name] = decode_values(decoder.function,
+                                                         attributes[name])
+                else:
+                    attributes[name] = []
+                name = next_attribute(ldap, entry, ber)
+        finally:
+            # Same as MessageEntryIterator.__del__: release the BerElement.
+            if ber:
+                dll.ber_free(ber, 0)
+        dn = None
+        if with_dn:
+            dn = _get_dn(ldap, entry)
+            if make_dn:
+                dn = make_dn(dn)
+        if records is not None:
+            records.append(attributes, dn)
+        elif with_dn:
+            result.append((dn, attributes))
+        else:
+            result.append(attributes)
+        entry = next_entry(ldap, entry)
+    return result if records is None else records
+
+
+def _extract_columns(msg, attributes, binary, dn_column, missing,
+                     dn_parser=None):
+    """Walk a Message entries and fill one column per requested attribute.
+
+    Each attribute is fetched by name from every entry, so that no per-entry
+    structure is ever built: the cells of a given entry are appended to the
+    columns as soon as they are read.
+    """
+    if dn_column in attributes:
+        raise ValueError('dn_column %r is also a requested attribute'
+                         % dn_column)
+    if binary:
+        get_values = dll.ldap_get_values_len
+        value_free = dll.ldap_value_free_len
+        convert = _binary_values
+    else:
+        get_values = dll.ldap_get_values
+        value_free = dll.ldap_value_free
+        convert = _string_values
+    next_entry = dll.ldap_next_entry
+
+    ldap = msg._ldap
+    dns = []
+    fields = [(name, []) for name in attributes]
+    entry = dll.ldap_first_entry(ldap, msg._message)
+    while entry:
+        dn = _get_dn(ldap, entry)
+        dns.append(dn_parser(dn) if dn_parser else dn)
+        for name, column in fields:
+            # As with _get_values, an attribute the entry doesn't hold may be
+            # reported either by a NULL result or by LDAP_NO_SUCH_ATTRIBUTE.
+            try:
+                values = get_values(ldap, entry, name)
+            except LdapError as e:
+                if e.args[1] != LDAP_NO_SUCH_ATTRIBUTE:
+                    raise
+                values = None
+            if values:
+                try:
+                    column.append(convert(values))
+                finally:
+                    value_free(values)
+            else:
+                column.append(missing)
+        entry = next_entry(ldap, entry)
+
+    columns = dict(fields)
+    columns[dn_column] = dns
+    return columns
+
+
+def parse_message(msg, decoders=None):
     """Builds a list of dictionaries for the provided Message instance by
     iterating over every attribute of every message entry. Attribute values are
-    returned as unicode strings.
+    returned as unicode strings, or decoded to Python types by `decoders`.
 
     Args:
         message: a Message instance as obtained, for example, by searching
+        decoders: a wldap.decoders.DecoderRegistry to decode values with
     """
-    return [{a.name: list(a.values) for a in entry} for entry in msg]
+    return _extract_entries(msg, False, decoders=decoders)
 
 
-def parse_binary_message(msg):
+def parse_binary_message(msg, views=False):
     """Builds a list of dictionaries for the provided Message instance by
     iterating over every attribute of every message entry. Attribute values are
     returned as bytes (str object in Python 2.x, bytes object in 3.x).
 
+    With `views` set, values are rather returned as read-only memoryviews
+    pointing into the buffers owned by the Message, without any copy: these are
+    only valid until the Message is released, after which using them raises
+    ValueError. Memoryviews derived from them (for example by slicing) remain
+    valid, and keep the buffers they point into alive. Views require Python
+    3.8+.
+
+    Args:
+        message: a Message instance as obtained, for example, by searching
+        views: True to return values as memoryviews rather than bytes
+    """
+    return _extract_entries(msg, True, views=views)
+
+
+def parse_message_records(msg, binary=False, with_dn=False, decoders=None):
+    """Builds a RecordSet for the provided Message instance: a compact
+    container for large result sets, where entries share a single schema of
+    attribute names and repeated values are stored once. Entries are read
+    through dictionary-like Record views, mapping names to tuples of values.
+
+    Args:
+        message: a Message instance as obtained, for example, by searching
+        binary: True to return values as bytes rather than unicode strings
+        with_dn: True to keep the entries distinguished names (as the
+            RecordSet dns list and the Record dn attribute), or a callable
+            such as wldap.dn.parse to apply to them
+        decoders: a wldap.decoders.DecoderRegistry to decode values with
+    """
+    records = _extract_entries(msg, binary, with_dn, records=RecordSet(),
+                               decoders=decoders)
+    records.compact()
+    return records
+
+
+def parse_message_columns(msg, attributes, binary=False, dn_column='dn',
+                          missing=None, dn_parser=None):
+    """Builds a dictionary of columns for the provided Message instance: each
+    requested attribute is mapped to a list holding, for every message entry,
+    the list of values for this attribute. Columns are aligned by entry index.
+
     Args:
         message: a Message instance as obtained, for example, by searching
+        attributes: the list of attribute names to extract
+        binary: True to return values as bytes rather than unicode strings
+        dn_column: the key under which entries distinguished names are stored
+        missing: the marker stored for entries which lack the attribute
+        dn_parser: a callable applied to each distinguished name, such as
+            wldap.dn.parse to share DN objects rather than hold strings
+
+    Raises ValueError if `dn_column` is one of `attributes`.
     """
-    return [{a.name: list(a.binary_values) for a in entry} for entry in msg]
+    return _extract_columns(msg, attributes, binary, dn_column, missing,
+                            dn_parser)
@@ -0,0 +1,230 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from contextlib import contextmanager
+from ctypes import byref, c_ulong
+import threading
+import time
+
+from wldap import wldap32_dll as dll
+from wldap.exceptions import Error, LdapError, TimeoutError
+from wldap.wldap32_constants import LDAP_OPT_HOST_REACHABLE, LDAP_OPT_ON
+from wldap.wldap32_constants import ReturnCodes
+
+
+# LdapError codes meaning that the session is unusable, and should be dropped
+# rather than returned to the pool.
+_BROKEN_SESSION_CODES = frozenset([
+    ReturnCodes.LDAP_CONNECT_ERROR,
+    ReturnCodes.LDAP_SERVER_DOWN,
+    ReturnCodes.LDAP_UNAVAILABLE,
+])
+
+
+def is_reachable(ldap):
+    """Default LdapPool session validation: check that the session is still
+    bound and, through LDAP_OPT_HOST_REACHABLE, that Wldap32 still considers
+    its server reachable. This doesn't involve any network round trip.
+    """
+    if ldap._unbound:
+        return False
+    value = c_ulong()
+    try:
+        dll.ldap_get_option(ldap._l, LDAP_OPT_HOST_REACHABLE, byref(value))
+    except LdapError:
+        return False
+    return value.value == LDAP_OPT_ON
+
+
+class LdapPool(object):
+    """Thread-safe pool of bound wldap.ldap sessions.
+
+    Example use:
+
+    >>> def connect():
+    ...     l = wldap.ldap('ldap://xxx')
+    ...     l.bind_s(None, None, wldap.LDAP_AUTH_NEGOTIATE)
+    ...     return l
+    >>> pool = LdapPool(connect, min_size=2, max_size=10)
+    >>> with pool.connection() as l:
+    ...     l.search_s(...)
+    """
+
+    def __init__(self, factory, min_size=0, max_size=10, idle_timeout=300.0,
+                 validate=is_reachable, clock=time.time):
+        """Construct a new LdapPool instance, and open `min_size` sessions.
+
+        Args:
+            factory: a callable returning a new, bound, wldap.ldap instance
+            min_size: number of sessions kept open, even when idle
+            max_size: maximum number of sessions open at once
+            idle_timeout: number of seconds after which an idle session is
+                closed (as long as more than `min_size` sessions are open), or
+                None to never close idle sessions
+            validate: a callable returning whether a session may be handed
+                out, or None to skip validation
+            clock: the function returning the current time in seconds
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Expected 0 <= min_size <= max_size, 1 <= max_size')
+
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._closed = False
+        self._factory = factory
+        self._idle = deque()  # (session, idle since) pairs, last used last
+        self._idle_timeout = idle_timeout
+        self._max_size = max_size
+        self._min_size = min_size
+        self._size = 0
+        self._validate = validate
+
+        self._wait_count = 0
+        self._wait_time = 0.0
+        self._wait_time_max = 0.0
+
+        for _ in range(min_size):
+            self._size = self._size + 1
+            self._idle.append((self._create(), self._clock()))
+
+    def _create(self):
+        try:
+            return self._factory()
+        except:
+            with self._condition:
+                self._size = self._size - 1
+                self._condition.notify()
+            raise
+
+    def _destroy(self, session):
+        with self._condition:
+            self._size = self._size - 1
+            self._condition.notify()
+        try:
+            session.unbind()
+        except LdapError:  # pragma: no cover
+            pass
+
+    def _expire_idle(self):
+        # Must be called with the condition held, returns the expired sessions
+        # so that they are unbound with the condition released. The oldest
+        # idle sessions are on the left.
+        expired = []
+        if self._idle_timeout is None:
+            return expired
+        deadline = self._clock() - self._idle_timeout
+        while (self._idle and self._idle[0][1] < deadline and
+               self._size - len(expired) > self._min_size):
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def acquire(self, timeout_seconds=None):
+        """Check a session out of the pool, opening a new one if none is idle
+        and the pool isn't full, or waiting for one to be released otherwise.
+
+        Raises TimeoutError if no session is available in `timeout_seconds`
+        seconds (None waits indefinitely).
+        """
+        start = self._clock()
+        waited = False
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise Error('The pool is closed')
+                expired = self._expire_idle()
+                session, create = None, False
+                if self._idle:
+                    session = self._idle.pop()[0]
+                elif self._size < self._max_size:
+                    self._size = self._size + 1
+                    create = True
+                else:
+                    remaining = None
+                    if timeout_seconds is not None:
+                        remaining = start + timeout_seconds - self._clock()
+                        if remaining <= 0:
+                            raise TimeoutError()
+                    waited = True
+                    self._condition.wait(remaining)
+
+            for item in expired:
+                self._destroy(item)
+            if create:
+                session = self._create()
+            elif session is not None and self._validate is not None:
+                if not self._validate(session):
+                    self._destroy(session)
+                    session = None
+            if session is not None:
+                break
+
+        if waited:
+            wait_time = self._clock() - start
+            with self._condition:
+                self._wait_count = self._wait_count + 1
+                self._wait_time = self._wait_time + wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+        return session
+
+    def close(self):
+        """Close all idle sessions. Sessions currently checked out are closed
+        when released.
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for session, _ in idle:
+            self._destroy(session)
+
+    @contextmanager
+    def connection(self, timeout_seconds=None):
+        """Context manager checking a session out of the pool, and back in on
+        exit. A session which raised an LdapError denoting a broken connection
+        is discarded rather than returned to the pool.
+        """
+        session = self.acquire(timeout_seconds)
+        discard = False
+        try:
+            yield session
+        except LdapError as e:
+            discard = e.args[1] in _BROKEN_SESSION_CODES
+            raise
+        finally:
+            self.release(session, discard)
+
+    def release(self, session, discard=False):
+        """Check a session back in the pool, or close it if `discard` is set.
+        """
+        with self._condition:
+            if not (discard or self._closed):
+                self._idle.append((session, self._clock()))
+                self._condition.notify()
+                return
+        self._destroy(session)
+
+    @property
+    def stats(self):
+        """A dictionary describing the pool state, and the time spent by
+        callers waiting for a session to be released.
+        """
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'wait_count': self._wait_count,
+                'wait_time': self._wait_time,
+                'wait_time_max': self._wait_time_max,
+            }
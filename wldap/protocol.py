@@ -0,0 +1,445 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""LDAPv3 protocol messages (RFC 4511), and their BER encoding.
+
+Protocol operations are named tuples named after their ASN.1 type. Both
+directions are supported, so that the same module serves clients and servers:
+DNs, attribute descriptions and messages are text, attribute values are
+bytes, and attribute lists are sequences of (description, [values]) pairs.
+"""
+
+from collections import namedtuple
+
+from wldap import ber
+from wldap import filter as filters
+
+
+_RESULT_FIELDS = ['code', 'matched_dn', 'message', 'referrals']
+
+BindRequest = namedtuple('BindRequest', ['version', 'name', 'password'])
+BindResponse = namedtuple('BindResponse', _RESULT_FIELDS)
+UnbindRequest = namedtuple('UnbindRequest', [])
+SearchRequest = namedtuple('SearchRequest', ['base', 'scope', 'deref',
+                                             'size_limit', 'time_limit',
+                                             'types_only', 'filter',
+                                             'attributes'])
+SearchResultEntry = namedtuple('SearchResultEntry', ['dn', 'attributes'])
+SearchResultDone = namedtuple('SearchResultDone', _RESULT_FIELDS)
+SearchResultReference = namedtuple('SearchResultReference', ['uris'])
+# `changes` is a sequence of (operation, description, [values]) triples,
+# where operation is one of the LDAPMod.LDAP_MOD_* values.
+ModifyRequest = namedtuple('ModifyRequest', ['dn', 'changes'])
+ModifyResponse = namedtuple('ModifyResponse', _RESULT_FIELDS)
+AddRequest = namedtuple('AddRequest', ['dn', 'attributes'])
+AddResponse = namedtuple('AddResponse', _RESULT_FIELDS)
+DelRequest = namedtuple('DelRequest', ['dn'])
+DelResponse = namedtuple('DelResponse', _RESULT_FIELDS)
+CompareRequest = namedtuple('CompareRequest', ['dn', 'attribute', 'value'])
+CompareResponse = namedtuple('CompareResponse', _RESULT_FIELDS)
+AbandonRequest = namedtuple('AbandonRequest', ['msgid'])
+ExtendedResponse = namedtuple('ExtendedResponse', _RESULT_FIELDS +
+                              ['name', 'value'])
+
+Control = namedtuple('Control', ['oid', 'critical', 'value'])
+LDAPMessage = namedtuple('LDAPMessage', ['msgid', 'op', 'controls'])
+
+# The paged results control (RFC 2696), which value is encoded by
+# encode_paged_results.
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+
+def _app(number, constructed=True):
+    return ber.APPLICATION | (ber.CONSTRUCTED if constructed else 0) | number
+
+
+_TAGS = {
+    BindRequest: _app(0),
+    BindResponse: _app(1),
+    UnbindRequest: _app(2, False),
+    SearchRequest: _app(3),
+    SearchResultEntry: _app(4),
+    SearchResultDone: _app(5),
+    ModifyRequest: _app(6),
+    ModifyResponse: _app(7),
+    AddRequest: _app(8),
+    AddResponse: _app(9),
+    DelRequest: _app(10, False),
+    DelResponse: _app(11),
+    CompareRequest: _app(14),
+    CompareResponse: _app(15),
+    AbandonRequest: _app(16, False),
+    SearchResultReference: _app(19),
+    ExtendedResponse: _app(24),
+}
+
+_RESULT_TYPES = (BindResponse, SearchResultDone, ModifyResponse, AddResponse,
+                 DelResponse, CompareResponse, ExtendedResponse)
+
+_CONTROLS_TAG = ber.CONTEXT | ber.CONSTRUCTED | 0
+_REFERRAL_TAG = ber.CONTEXT | ber.CONSTRUCTED | 3
+_SIMPLE_AUTH_TAG = ber.CONTEXT | 0
+
+_FILTER_AND = ber.CONTEXT | ber.CONSTRUCTED | 0
+_FILTER_OR = ber.CONTEXT | ber.CONSTRUCTED | 1
+_FILTER_NOT = ber.CONTEXT | ber.CONSTRUCTED | 2
+_FILTER_PRESENT = ber.CONTEXT | 7
+_FILTER_SUBSTRINGS = ber.CONTEXT | ber.CONSTRUCTED | 4
+_FILTER_EXTENSIBLE = ber.CONTEXT | ber.CONSTRUCTED | 9
+_FILTER_AVA_TAGS = {
+    filters.Equality: ber.CONTEXT | ber.CONSTRUCTED | 3,
+    filters.GreaterOrEqual: ber.CONTEXT | ber.CONSTRUCTED | 5,
+    filters.LessOrEqual: ber.CONTEXT | ber.CONSTRUCTED | 6,
+    filters.Approx: ber.CONTEXT | ber.CONSTRUCTED | 8,
+}
+_FILTER_AVA_TYPES = dict((tag, kind)
+                         for kind, tag in _FILTER_AVA_TAGS.items())
+
+
+def is_result(op):
+    """Return whether `op` is a final response, that is holds an LDAPResult.
+    """
+    return isinstance(op, _RESULT_TYPES)
+
+
+def message_type(op):
+    """Return the BER tag of a protocol operation, which for responses is the
+    matching LDAP_RES_* value.
+    """
+    return _TAGS[type(op)]
+
+
+###############################################################################
+# Encoding
+
+
+def encode_filter(item):
+    """Encode a filter, as parsed by wldap.filter.parse."""
+    kind = type(item)
+    if kind is filters.And or kind is filters.Or:
+        tag = _FILTER_AND if kind is filters.And else _FILTER_OR
+        return ber.encode_set([encode_filter(f) for f in item.filters], tag)
+    if kind is filters.Not:
+        return ber.encode(_FILTER_NOT, encode_filter(item.filter))
+    if kind is filters.Present:
+        return ber.encode_octet_string(item.attribute, _FILTER_PRESENT)
+    if kind is filters.Substrings:
+        parts = []
+        if item.initial is not None:
+            parts.append(ber.encode_octet_string(item.initial, ber.CONTEXT))
+        for value in item.any:
+            parts.append(ber.encode_octet_string(value, ber.CONTEXT | 1))
+        if item.final is not None:
+            parts.append(ber.encode_octet_string(item.final, ber.CONTEXT | 2))
+        return ber.encode_sequence([ber.encode_octet_string(item.attribute),
+                                    ber.encode_sequence(parts)],
+                                   _FILTER_SUBSTRINGS)
+    if kind is filters.Extensible:
+        parts = []
+        if item.rule is not None:
+            parts.append(ber.encode_octet_string(item.rule, ber.CONTEXT | 1))
+        if item.attribute is not None:
+            parts.append(ber.encode_octet_string(item.attribute,
+                                                 ber.CONTEXT | 2))
+        parts.append(ber.encode_octet_string(item.value, ber.CONTEXT | 3))
+        if item.dn_attributes:
+            parts.append(ber.encode_boolean(True, ber.CONTEXT | 4))
+        return ber.encode_sequence(parts, _FILTER_EXTENSIBLE)
+    return ber.encode_sequence([ber.encode_octet_string(item.attribute),
+                                ber.encode_octet_string(item.value)],
+                               _FILTER_AVA_TAGS[kind])
+
+
+def _encode_attributes(attributes):
+    return ber.encode_sequence([
+        ber.encode_sequence([ber.encode_octet_string(name),
+                             ber.encode_set([ber.encode_octet_string(v)
+                                             for v in values])])
+        for name, values in attributes])
+
+
+def _encode_result(op):
+    parts = [ber.encode_enumerated(op.code),
+             ber.encode_octet_string(op.matched_dn or ''),
+             ber.encode_octet_string(op.message or '')]
+    if op.referrals:
+        parts.append(ber.encode_sequence(
+            [ber.encode_octet_string(uri) for uri in op.referrals],
+            _REFERRAL_TAG))
+    return parts
+
+
+def _encode_op(op):
+    kind = type(op)
+    tag = _TAGS[kind]
+    if kind is BindRequest:
+        parts = [ber.encode_integer(op.version),
+                 ber.encode_octet_string(op.name or ''),
+                 ber.encode_octet_string(op.password or '', _SIMPLE_AUTH_TAG)]
+    elif kind is UnbindRequest:
+        return ber.encode(tag, b'')
+    elif kind is SearchRequest:
+        parts = [ber.encode_octet_string(op.base or ''),
+                 ber.encode_enumerated(op.scope),
+                 ber.encode_enumerated(op.deref),
+                 ber.encode_integer(op.size_limit),
+                 ber.encode_integer(op.time_limit),
+                 ber.encode_boolean(op.types_only),
+                 encode_filter(op.filter),
+                 ber.encode_sequence([ber.encode_octet_string(name)
+                                      for name in op.attributes])]
+    elif kind is SearchResultEntry:
+        parts = [ber.encode_octet_string(op.dn),
+                 _encode_attributes(op.attributes)]
+    elif kind is SearchResultReference:
+        parts = [ber.encode_octet_string(uri) for uri in op.uris]
+    elif kind is ModifyRequest:
+        parts = [ber.encode_octet_string(op.dn), ber.encode_sequence([
+            ber.encode_sequence([
+                ber.encode_enumerated(operation),
+                ber.encode_sequence([ber.encode_octet_string(name),
+                                     ber.encode_set([
+                                         ber.encode_octet_string(v)
+                                         for v in values])])])
+            for operation, name, values in op.changes])]
+    elif kind is AddRequest:
+        parts = [ber.encode_octet_string(op.dn),
+                 _encode_attributes(op.attributes)]
+    elif kind is DelRequest:
+        return ber.encode_octet_string(op.dn, tag)
+    elif kind is CompareRequest:
+        parts = [ber.encode_octet_string(op.dn),
+                 ber.encode_sequence([ber.encode_octet_string(op.attribute),
+                                      ber.encode_octet_string(op.value)])]
+    elif kind is AbandonRequest:
+        return ber.encode_integer(op.msgid, tag)
+    elif kind is ExtendedResponse:
+        parts = _encode_result(op)
+        if op.name is not None:
+            parts.append(ber.encode_octet_string(op.name, ber.CONTEXT | 10))
+        if op.value is not None:
+            parts.append(ber.encode_octet_string(op.value, ber.CONTEXT | 11))
+    else:
+        parts = _encode_result(op)
+    return ber.encode_sequence(parts, tag)
+
+
+def encode_paged_results(size, cookie):
+    """Encode the value of a paged results control: `size` is the page size
+    of a request, or the estimated result size of a response.
+    """
+    return ber.encode_sequence([ber.encode_integer(size),
+                                ber.encode_octet_string(cookie)])
+
+
+def encode_message(msgid, op, controls=None):
+    """Encode an LDAPMessage envelope around a protocol operation."""
+    parts = [ber.encode_integer(msgid), _encode_op(op)]
+    if controls:
+        parts.append(ber.encode_sequence([
+            ber.encode_sequence(
+                [ber.encode_octet_string(control.oid)] +
+                ([ber.encode_boolean(True)] if control.critical else []) +
+                ([ber.encode_octet_string(control.value)]
+                 if control.value is not None else []))
+            for control in controls], _CONTROLS_TAG))
+    return ber.encode_sequence(parts)
+
+
+###############################################################################
+# Decoding
+
+
+def _string(data, element):
+    return ber.decode_string(data, element[1], element[2])
+
+
+def _octets(data, element):
+    return ber.decode_octet_string(data, element[1], element[2])
+
+
+def _children(data, element):
+    return ber.decode_elements(data, element[1], element[2])
+
+
+def _integer(data, element):
+    return ber.decode_integer(data, element[1], element[2])
+
+
+def decode_filter(data, element):
+    """Decode the filter `element` of `data` to a wldap.filter tree."""
+    tag = element[0]
+    if tag == _FILTER_AND or tag == _FILTER_OR:
+        children = [decode_filter(data, child)
+                    for child in _children(data, element)]
+        return (filters.And if tag == _FILTER_AND else filters.Or)(children)
+    if tag == _FILTER_NOT:
+        return filters.Not(decode_filter(data, _children(data, element)[0]))
+    if tag == _FILTER_PRESENT:
+        return filters.Present(_string(data, element))
+    if tag == _FILTER_SUBSTRINGS:
+        attribute, parts = _children(data, element)
+        initial, any_, final = None, [], None
+        for part in _children(data, parts):
+            if part[0] == ber.CONTEXT:
+                initial = _octets(data, part)
+            elif part[0] == ber.CONTEXT | 1:
+                any_.append(_octets(data, part))
+            else:
+                final = _octets(data, part)
+        return filters.Substrings(_string(data, attribute), initial, any_,
+                                  final)
+    if tag == _FILTER_EXTENSIBLE:
+        rule, attribute, value, dn_attributes = None, None, None, False
+        for part in _children(data, element):
+            number = part[0] & 0x1f
+            if number == 1:
+                rule = _string(data, part)
+            elif number == 2:
+                attribute = _string(data, part)
+            elif number == 3:
+                value = _octets(data, part)
+            elif number == 4:
+                dn_attributes = ber.decode_boolean(data, part[1], part[2])
+        return filters.Extensible(rule, attribute, value, dn_attributes)
+    if tag in _FILTER_AVA_TYPES:
+        attribute, value = _children(data, element)
+        return _FILTER_AVA_TYPES[tag](_string(data, attribute),
+                                      _octets(data, value))
+    raise ValueError('Unknown filter tag 0x%02x' % tag)
+
+
+def _decode_attributes(data, element):
+    attributes = []
+    for attribute in _children(data, element):
+        name, values = _children(data, attribute)
+        attributes.append((_string(data, name),
+                           [_octets(data, value)
+                            for value in _children(data, values)]))
+    return attributes
+
+
+def _decode_result(kind, data, children):
+    referrals = None
+    extra = []
+    for child in children[3:]:
+        if child[0] == _REFERRAL_TAG:
+            referrals = [_string(data, uri) for uri in _children(data, child)]
+        else:
+            extra.append(child)
+    fields = [ber.decode_integer(data, children[0][1], children[0][2]),
+              _string(data, children[1]), _string(data, children[2]),
+              referrals]
+    if kind is ExtendedResponse:
+        name, value = None, None
+        for child in extra:
+            if child[0] == ber.CONTEXT | 10:
+                name = _string(data, child)
+            elif child[0] == ber.CONTEXT | 11:
+                value = _octets(data, child)
+        fields.extend([name, value])
+    return kind(*fields)
+
+
+_TYPES = dict((tag, kind) for kind, tag in _TAGS.items())
+
+
+def _decode_op(data, element):
+    kind = _TYPES.get(element[0])
+    if kind is None:
+        raise ValueError('Unsupported protocol operation 0x%02x' % element[0])
+    if kind is UnbindRequest:
+        return UnbindRequest()
+    if kind is DelRequest:
+        return DelRequest(_string(data, element))
+    if kind is AbandonRequest:
+        return AbandonRequest(_integer(data, element))
+
+    children = _children(data, element)
+    if kind in _RESULT_TYPES:
+        return _decode_result(kind, data, children)
+    if kind is BindRequest:
+        return BindRequest(_integer(data, children[0]),
+                           _string(data, children[1]),
+                           _octets(data, children[2]))
+    if kind is SearchRequest:
+        return SearchRequest(_string(data, children[0]),
+                             _integer(data, children[1]),
+                             _integer(data, children[2]),
+                             _integer(data, children[3]),
+                             _integer(data, children[4]),
+                             ber.decode_boolean(data, children[5][1],
+                                                children[5][2]),
+                             decode_filter(data, children[6]),
+                             [_string(data, name)
+                              for name in _children(data, children[7])])
+    if kind is SearchResultEntry or kind is AddRequest:
+        return kind(_string(data, children[0]),
+                    _decode_attributes(data, children[1]))
+    if kind is SearchResultReference:
+        return SearchResultReference([_string(data, uri) for uri in children])
+    if kind is ModifyRequest:
+        changes = []
+        for change in _children(data, children[1]):
+            operation, modification = _children(data, change)
+            name, values = _children(data, modification)
+            changes.append((_integer(data, operation), _string(data, name),
+                            [_octets(data, v)
+                             for v in _children(data, values)]))
+        return ModifyRequest(_string(data, children[0]), changes)
+    if kind is CompareRequest:
+        attribute, value = _children(data, children[1])
+        return CompareRequest(_string(data, children[0]),
+                              _string(data, attribute), _octets(data, value))
+
+
+def decode_paged_results(value):
+    """Decode the value of a paged results control to a (size, cookie) pair.
+    Raises ValueError on malformed input.
+    """
+    data = bytearray(value or b'')
+    element = ber.decode(data)
+    size, cookie = _children(data, element)
+    return _integer(data, size), _octets(data, cookie)
+
+
+def decode_message(data, offset=0):
+    """Decode the LDAPMessage starting at `offset` of the bytearray `data`.
+
+    Returns a (LDAPMessage, end offset) pair, or (None, offset) if `data`
+    doesn't hold the whole message yet. Raises ValueError on malformed or
+    unsupported input.
+    """
+    element = ber.decode_header(data, offset)
+    if element is None:
+        return None, offset
+    children = _children(data, element)
+    if len(children) < 2:
+        raise ValueError('Invalid LDAPMessage')
+    controls = []
+    for child in children[2:]:
+        if child[0] != _CONTROLS_TAG:
+            continue
+        for control in _children(data, child):
+            parts = _children(data, control)
+            critical, value = False, None
+            for part in parts[1:]:
+                if part[0] == ber.BOOLEAN:
+                    critical = ber.decode_boolean(data, part[1], part[2])
+                else:
+                    value = _octets(data, part)
+            controls.append(Control(_string(data, parts[0]), critical, value))
+    message = LDAPMessage(_integer(data, children[0]),
+                          _decode_op(data, children[1]), controls)
+    return message, element[2]
@@ -0,0 +1,147 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python < 3.3
+    from collections import Mapping
+
+
+class Record(Mapping):
+    """Read-only, dictionary-like view of an entry of a RecordSet, mapping
+    attribute names to tuples of values.
+
+    Lookups fall back to a case insensitive match of the attribute name.
+    """
+
+    __slots__ = ('_records', '_row', 'dn')
+
+    def __init__(self, records, row, dn=None):
+        self._records = records
+        self._row = row
+        self.dn = dn
+
+    def __getitem__(self, name):
+        idx = self._records._position(name)
+        if idx is None or idx >= len(self._row) or self._row[idx] is None:
+            raise KeyError(name)
+        return self._row[idx]
+
+    def __iter__(self):
+        schema = self._records.schema
+        return (schema[idx] for idx, values in enumerate(self._row)
+                if values is not None)
+
+    def __len__(self):
+        return sum(1 for values in self._row if values is not None)
+
+    def __repr__(self):
+        return 'Record(%r)' % self.to_dict()
+
+    def to_dict(self):
+        """Return the entry as a dictionary of lists, as parse_message
+        does.
+        """
+        return dict((name, list(values)) for name, values in self.items())
+
+
+# The number of distinct values, or tuples of values, of an attribute above
+# which these are no longer interned: such attributes (cn, mail, ...) hardly
+# hold repeated values, and their interning table would cost more memory than
+# it saves.
+_INTERN_LIMIT = 1024
+
+_NOT_INTERNED = (None, None)
+
+
+class RecordSet(object):
+    """Compact container for the entries of a large result set.
+
+    Entries are stored as tuples holding, at the position of each attribute
+    name in the schema shared by all the entries, the tuple of values of the
+    attribute or None. Identical values and tuples of values (such as
+    objectClass ones) are stored once, for the attributes which hold few
+    distinct ones. Accessing an entry returns a Record, a dictionary-like
+    view built on demand.
+    """
+
+    def __init__(self):
+        self.dns = []
+        self.schema = []
+        self._index = {}  # Attribute name -> schema position
+        # Schema position -> [values table, tuples table], None once compact
+        self._interned = []
+        self._lower = {}  # Lowercased attribute name -> schema position
+        self._rows = []
+
+    def __getitem__(self, idx):
+        dn = self.dns[idx] if self.dns else None
+        return Record(self, self._rows[idx], dn)
+
+    def __iter__(self):
+        dns = self.dns or [None] * len(self._rows)
+        return (Record(self, row, dn) for row, dn in zip(self._rows, dns))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _position(self, name):
+        idx = self._index.get(name)
+        if idx is None:
+            idx = self._lower.get(name.lower())
+        return idx
+
+    def append(self, attributes, dn=None):
+        """Add an entry, given as a dictionary of lists of values as returned
+        by parse_message.
+        """
+        row = [None] * len(self.schema)
+        interned = self._interned
+        for name, values in attributes.items():
+            idx = self._index.get(name)
+            if idx is None:
+                idx = self._index[name] = len(self.schema)
+                self._lower.setdefault(name.lower(), idx)
+                self.schema.append(name)
+                if interned is not None:
+                    interned.append([{}, {}])
+                row.append(None)
+            tables = interned[idx] if interned is not None else _NOT_INTERNED
+            table = tables[0]
+            if table is not None:
+                values = [table.setdefault(value, value) for value in values]
+                if len(table) > _INTERN_LIMIT:
+                    tables[0] = None
+            values = tuple(values)
+            table = tables[1]
+            if table is not None:
+                values = table.setdefault(values, values)
+                if len(table) > _INTERN_LIMIT:
+                    tables[1] = None
+            row[idx] = values
+        self._rows.append(tuple(row))
+        if dn is not None:
+            self.dns.append(dn)
+
+    def compact(self):
+        """Drop the interning tables, once all the entries are appended: the
+        entries appended afterwards don't share their values.
+        """
+        self._interned = None
+
+    def to_dicts(self):
+        """Return the entries as a list of dictionaries of lists, as
+        parse_message does.
+        """
+        return [record.to_dict() for record in self]
@@ -0,0 +1,395 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local replica of directory entries, stored in a SQLite database and
+queried with LDAP filters.
+
+    >>> from wldap.replica import Replica
+    >>> replica = Replica('people.db', indexes=['mail', 'sAMAccountName'])
+    >>> replica.load(l, 'ou=people,dc=example,dc=com', LDAP_SCOPE_SUBTREE)
+    >>> replica.query('(&(objectClass=user)(mail=*@example.com))')
+
+Entries are stored as one row per DN, and one row per attribute value. The
+values of indexed attributes are looked up through a SQLite (partial) index,
+the others by scanning the values of the attribute.
+
+Values are compared as the memory backend and wldap.filter.compile do: case
+insensitively, and as integers when both sides are.
+"""
+
+from itertools import islice
+import re
+import sqlite3
+
+from wldap import dn as dns
+from wldap import filter as filters
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL
+from wldap.wldap32_constants import LDAP_SCOPE_SUBTREE
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dn TEXT NOT NULL,
+    ndn TEXT NOT NULL UNIQUE,
+    parent TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE TABLE IF NOT EXISTS attribute_values (
+    entry INTEGER NOT NULL REFERENCES entries (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    value,
+    norm TEXT,
+    num INTEGER
+);
+CREATE INDEX IF NOT EXISTS attribute_values_entry
+    ON attribute_values (entry, attribute);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value
+);
+'''
+
+# SQLite GLOB wildcards, matched literally by enclosing them in brackets.
+_GLOB = re.compile(r'([*?\[])')
+
+
+def _normalize_dn(dn):
+    parsed = dns.parse(dn)
+    parent = parsed.parent
+    return parsed.normalized, parent.normalized if parent is not None else ''
+
+
+def _columns(value):
+    # Return the (norm, num) columns for `value`: the lower cased text and,
+    # for integers, the number (bytes values which aren't UTF-8 have none).
+    if isinstance(value, bytes):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            return None, None
+    elif not isinstance(value, type(u'')):
+        value = u'%s' % (value,)
+    norm = value.lower()
+    try:
+        return norm, int(norm)
+    except ValueError:
+        return norm, None
+
+
+def _literal(attribute):
+    # Attribute names are inlined in the SQL rather than bound, so that
+    # SQLite can pick the partial index of the attribute. They have been
+    # validated by the filter parser, and are quoted nonetheless.
+    return "'%s'" % attribute.lower().replace("'", "''")
+
+
+def _glob(text):
+    return _GLOB.sub(r'[\1]', text)
+
+
+class Replica(object):
+    """Directory entries stored in a SQLite database, queried with LDAP
+    filters translated to SQL.
+
+    Writes are committed as they are made, unless made within a `with
+    replica:` block, which commits them all at once when it exits (or rolls
+    them back, on error). Replica implements the store interface of
+    wldap.sync.SyncEngine.
+    """
+
+    def __init__(self, path=':memory:', indexes=()):
+        """Construct a new Replica instance, creating its tables if needed.
+
+        Args:
+            path: the SQLite database file, in memory by default
+            indexes: the names of the attributes to index, for the attributes
+                used in equality, ordering or initial substring assertions
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(_SCHEMA)
+        self._depth = 0  # Nesting of the `with` blocks
+        for attribute in indexes:
+            self.add_index(attribute)
+
+    def __contains__(self, dn):
+        return self.connection.execute(
+            'SELECT 1 FROM entries WHERE ndn = ?',
+            (_normalize_dn(dn)[0],)).fetchone() is not None
+
+    def __enter__(self):
+        self._depth = self._depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth = self._depth - 1
+        if not self._depth:
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def add_index(self, attribute):
+        """Index the values of `attribute`, as text and as integers."""
+        name = 'attribute_values_%s' % re.sub(r'\W', '_', attribute.lower())
+        with self:
+            for suffix, columns in (('', 'norm'), ('_num', 'num')):
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS %s%s ON attribute_values (%s, '
+                    'entry) WHERE attribute = %s' % (
+                        name, suffix, columns, _literal(attribute)))
+
+    def close(self):
+        self.connection.close()
+
+    def _put(self, dn, attributes):
+        ndn, parent = _normalize_dn(dn)
+        cursor = self.connection.cursor()
+        row = cursor.execute('SELECT id FROM entries WHERE ndn = ?',
+                             (ndn,)).fetchone()
+        if row is None:
+            cursor.execute('INSERT INTO entries (dn, ndn, parent) '
+                           'VALUES (?, ?, ?)', (dn, ndn, parent))
+            entry = cursor.lastrowid
+        else:
+            entry = row[0]
+            cursor.execute('UPDATE entries SET dn = ? WHERE id = ?',
+                           (dn, entry))
+            cursor.execute('DELETE FROM attribute_values WHERE entry = ?',
+                           (entry,))
+        cursor.executemany(
+            'INSERT INTO attribute_values VALUES (?, ?, ?, ?, ?, ?)',
+            [(entry, name, name.lower(), value) + _columns(value)
+             for name, values in attributes.items() for value in values])
+
+    def put(self, dn, attributes):
+        """Add or replace the entry `dn`.
+
+        Args:
+            dn: the distinguished name of the entry
+            attributes: a dictionary mapping attribute names to lists of
+                values, as a parse_message item
+        """
+        with self:
+            self._put(dn, attributes)
+
+    def delete(self, dn):
+        """Delete the entry `dn`, if present."""
+        with self:
+            self.connection.execute('DELETE FROM entries WHERE ndn = ?',
+                                    (_normalize_dn(dn)[0],))
+
+    def dns(self):
+        """Return the list of the distinguished names of the entries."""
+        return [row[0] for row in self.connection.execute(
+            'SELECT dn FROM entries ORDER BY id')]
+
+    def get_state(self, name, default=None):
+        """Return the state value stored under `name`, or `default`."""
+        row = self.connection.execute('SELECT value FROM state WHERE name = ?',
+                                      (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_state(self, name, value):
+        """Store a state value (such as a synchronization watermark), which
+        must be a number, a string or bytes.
+        """
+        with self:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)',
+                (name, value))
+
+    def load(self, ldap, base, scope, filt=None, attr=['*'], page_size=None,
+             batch=1000):
+        """Add or replace the results of a search, committed as they are
+        received rather than held in memory (or along with the enclosing
+        `with replica:` block, if any).
+
+        Args:
+            ldap: the wldap.ldap session to search with
+            base, scope, filt, attr: as for ldap.search
+            page_size: the number of entries per page, to search with the
+                paged results control (see ldap.search_paged), or None
+            batch: the number of entries per transaction
+
+        Returns the number of entries loaded, and raises LdapError on error.
+        """
+        if page_size is None:
+            entries = ldap.search_iter(base, scope, filt, attr, False,
+                                       with_dn=True)
+        else:
+            entries = (entry for page in ldap.search_paged(
+                base, scope, filt, attr, False, page_size, with_dn=True)
+                for entry in page.entries)
+
+        # Each batch is a transaction, unless within a `with replica:` block:
+        # only the batch in progress is rolled back on error.
+        count = 0
+        entries = iter(entries)
+        while True:
+            loaded = 0
+            with self:
+                for dn, attributes in islice(entries, batch):
+                    self._put(dn, attributes)
+                    loaded = loaded + 1
+            count = count + loaded
+            if loaded < batch:
+                return count
+
+    def _values_condition(self, attribute, condition, params):
+        # An uncorrelated subquery on the values of `attribute`, evaluated
+        # once through the index of the attribute if any, rather than a join
+        # which would duplicate the entries with multiple matching values.
+        conditions = []
+        if attribute is not None:
+            conditions.append('attribute = %s' % _literal(attribute))
+        if condition:
+            conditions.append(condition)
+        return 'e.id IN (SELECT entry FROM attribute_values WHERE %s)' % (
+            ' AND '.join(conditions)), params
+
+    def _equality(self, attribute, value):
+        norm, num = _columns(value)
+        if num is not None:
+            return self._values_condition(attribute, 'num = ?', [num])
+        return self._values_condition(attribute, 'norm = ?', [norm])
+
+    def _translate(self, item):
+        """Return the SQL condition on the `e` entries row for a parsed
+        filter, and its parameters.
+        """
+        kind = type(item)
+        if kind is filters.And or kind is filters.Or:
+            if not item.filters:  # RFC 4526 absolute true and false
+                return ('1' if kind is filters.And else '0'), []
+            conditions, params = [], []
+            for child in item.filters:
+                condition, child_params = self._translate(child)
+                conditions.append('(%s)' % condition)
+                params.extend(child_params)
+            operator = ' AND ' if kind is filters.And else ' OR '
+            return operator.join(conditions), params
+        if kind is filters.Not:
+            condition, params = self._translate(item.filter)
+            return 'NOT (%s)' % condition, params
+        if kind is filters.Present:
+            return self._values_condition(item.attribute, None, [])
+        if kind is filters.Substrings:
+            # Values are lower cased: GLOB, unlike LIKE, can use the index
+            # for the initial substring.
+            parts = [item.initial or b''] + list(item.any) + \
+                [item.final or b'']
+            pattern = '*'.join(_glob(_columns(part)[0] or '')
+                               for part in parts)
+            return self._values_condition(item.attribute, 'norm GLOB ?',
+                                          [pattern])
+        if kind is filters.GreaterOrEqual or kind is filters.LessOrEqual:
+            # Integers sort before text, as for wldap.filter.matches. Either
+            # side of the alternatives is a separate subquery, so that both
+            # seek through the indexes of the attribute.
+            norm, num = _columns(item.value)
+            greater = kind is filters.GreaterOrEqual
+            if num is not None and not greater:
+                return self._values_condition(item.attribute, 'num <= ?',
+                                              [num])
+            if num is None and greater:
+                # The unary + keeps SQLite from picking the num index.
+                return self._values_condition(
+                    item.attribute, 'norm >= ? AND +num IS NULL', [norm])
+            if greater:
+                first = self._values_condition(item.attribute, 'num >= ?',
+                                               [num])
+                second = self._values_condition(item.attribute,
+                                                'num IS NULL', [])
+            else:
+                first = self._values_condition(item.attribute,
+                                               'num IS NOT NULL', [])
+                second = self._values_condition(item.attribute, 'norm <= ?',
+                                                [norm])
+            return '%s OR %s' % (first[0], second[0]), first[1] + second[1]
+        return self._equality(item.attribute, item.value)  # Approx too
+
+    def _scope(self, base, scope):
+        ndn = _normalize_dn(base)[0]
+        if scope == LDAP_SCOPE_BASE:
+            return 'e.ndn = ?', [ndn]
+        if scope == LDAP_SCOPE_ONELEVEL:
+            return 'e.parent = ?', [ndn]
+        if not ndn:
+            return '1', []
+        return "(e.ndn = ? OR e.ndn LIKE ? ESCAPE '\\')", [
+            ndn, '%,' + re.sub(r'([%_\\])', r'\\\1', ndn)]
+
+    def _select(self, columns, filt, base, scope):
+        condition, params = '1', []
+        if isinstance(filt, (bytes, type(u''))):
+            filt = filters.parse(filt)
+        if filt is not None:
+            condition, params = self._translate(filt)
+        if base is not None:
+            scope_condition, scope_params = self._scope(base, scope)
+            condition = '%s AND (%s)' % (scope_condition, condition)
+            params = scope_params + params
+        return 'SELECT %s FROM entries e WHERE %s' % (columns, condition), \
+            params
+
+    def count(self, filt=None, base=None, scope=LDAP_SCOPE_SUBTREE):
+        """Return the number of entries matching `filt`, as for query."""
+        sql, params = self._select('COUNT(*)', filt, base, scope)
+        return self.connection.execute(sql, params).fetchone()[0]
+
+    def query(self, filt=None, base=None, scope=LDAP_SCOPE_SUBTREE,
+              attr=None, with_dn=False):
+        """Return the entries matching a search filter.
+
+        Args:
+            filt: the search filter, as a string or parsed (see
+                wldap.filter.parse), all entries if None
+            base: distinguished name of the entry at which to start the
+                search, the whole replica if None
+            scope: LDAP_SCOPE_BASE, LDAP_SCOPE_ONELEVEL or LDAP_SCOPE_SUBTREE
+            attr: a list of attribute names to be returned, all if None
+            with_dn: True to return (dn, attributes) pairs
+
+        Returns a list as returned by parse_message (or, with_dn set, by
+        search_iter), entries being in the order they were first stored.
+        """
+        sql, params = self._select('e.id, e.dn', filt, base, scope)
+        rows = self.connection.execute(sql + ' ORDER BY e.id',
+                                       params).fetchall()
+        entries = dict((row[0], (row[1], {})) for row in rows)
+
+        selected = ''
+        if attr is not None and '*' not in attr:
+            selected = ' AND attribute IN (%s)' % ', '.join(
+                _literal(name) for name in attr)
+        ids = [row[0] for row in rows]
+        # Stay below the SQLite limit on the number of bound parameters.
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            values_sql = 'SELECT entry, name, value FROM attribute_values ' \
+                'WHERE entry IN (%s)%s ORDER BY rowid' % (
+                    ', '.join('?' * len(chunk)), selected)
+            for entry, name, value in self.connection.execute(values_sql,
+                                                              chunk):
+                entries[entry][1].setdefault(name, []).append(value)
+
+        result = [entries[row[0]] for row in rows]
+        return result if with_dn else [attributes for _, attributes in result]
@@ -0,0 +1,382 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque, namedtuple
+from ctypes import POINTER, byref, c_ulong, string_at
+from string import Formatter
+
+from wldap import wldap32_dll as dll
+from wldap.exceptions import LdapError, TimeoutError
+from wldap.filter import escape
+from wldap.message import Message, _extract_entries
+from wldap.wldap32_constants import LDAP_CONTROL_NOT_FOUND
+from wldap.wldap32_constants import LDAP_MSG_ALL, LDAP_MSG_ONE, LDAP_SUCCESS
+from wldap.wldap32_constants import LDAP_RES_SEARCH_ENTRY
+from wldap.wldap32_constants import LDAP_RES_SEARCH_RESULT
+from wldap.wldap32_structures import LDAP_BERVAL, LDAPControl, LDAPMessage
+
+
+# A page of results, as returned by PagedSearch: `cookie` is the value to pass
+# to ldap.search_paged in order to resume the search after this page (it is
+# empty for the last page).
+SearchPage = namedtuple('SearchPage', ['entries', 'cookie'])
+
+
+class SearchIterator(object):
+    """Iterates over the entries of an asynchronous search as they arrive.
+
+    Results are pumped one message at a time (LDAP_MSG_ONE), and each message
+    is parsed and released as soon as it is received: neither the client nor
+    the library ever hold the complete result set.
+
+    If the search fails, for example with LDAP_SIZELIMIT_EXCEEDED, the entries
+    received before the failure are yielded first, and the error is raised
+    once they are consumed.
+    """
+
+    def __init__(self, ldap, msgid, binary=False, with_dn=False,
+                 max_buffered=100, timeout_seconds=None):
+        """Construct a new SearchIterator instance.
+
+        Args:
+            ldap: the wldap.ldap instance the search was issued on
+            msgid: the message ID of the search operation
+            binary: True to return values as bytes rather than unicode strings
+            with_dn: True to yield (dn, attributes) pairs, or a callable such
+                as wldap.dn.parse to apply to dn
+            max_buffered: maximum number of parsed entries waiting to be
+                consumed (must be at least 1)
+            timeout_seconds: a fractional number of seconds to wait for each
+                message, block indefinitely if None (default)
+        """
+        self._binary = binary
+        self._buffer = deque()
+        self._done = False
+        self._error = None  # Raised once the buffered entries are consumed
+        self._ldap = ldap
+        self._max_buffered = max(1, max_buffered)
+        self._msgid = msgid
+        self._timeout_seconds = timeout_seconds
+        self._with_dn = with_dn
+
+    def __del__(self):
+        try:
+            if hasattr(self, '_done'):
+                self.close()
+        except LdapError:  # pragma: no cover
+            pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):  # pragma: no cover
+        return self.next()
+
+    def _consume(self, message):
+        # The message is released as soon as its entries are extracted, even
+        # if this fails.
+        try:
+            msgtype = dll.ldap_msgtype(message._message)
+            if msgtype == LDAP_RES_SEARCH_ENTRY:
+                self._buffer.extend(_extract_entries(message, self._binary,
+                                                     self._with_dn))
+            elif msgtype == LDAP_RES_SEARCH_RESULT:
+                self._done = True
+                code = dll.ldap_result2error(self._ldap._l, message._message,
+                                             0)
+                if code != LDAP_SUCCESS:
+                    self._error = LdapError(code)
+            # Search references (LDAP_RES_SEARCH_REFERENCE) are ignored.
+        finally:
+            message.release()
+
+    def _fill(self):
+        # Block for the next message, then keep on reading the ones which are
+        # already received until either the buffer is full or the search is
+        # over.
+        message = self._ldap.result(self._msgid, LDAP_MSG_ONE,
+                                    self._timeout_seconds)
+        if message is None:
+            raise TimeoutError()
+        while message is not None:
+            self._consume(message)
+            if self._done or len(self._buffer) >= self._max_buffered:
+                break
+            message = self._ldap.result(self._msgid, LDAP_MSG_ONE, 0)
+
+    def close(self):
+        """Stop the iteration, abandoning the search if it isn't over."""
+        self._buffer.clear()
+        self._error = None
+        if not self._done:
+            self._done = True
+            self._ldap.abandon(self._msgid)
+
+    def next(self):
+        while not self._buffer:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            if self._done:
+                raise StopIteration
+            self._fill()
+        return self._buffer.popleft()
+
+
+class PagedSearch(object):
+    """Iterates over the pages of a search using the paged results control
+    (RFC 2696).
+
+    The request for the next page is sent as soon as a page is received, so
+    that the server works on page N+1 while the caller processes page N.
+    """
+
+    def __init__(self, ldap, base, scope, filt, attr, attronly, page_size,
+                 cookie=None, binary=False, with_dn=False,
+                 timeout_seconds=None):
+        """Construct a new PagedSearch instance, and request the first page.
+
+        Args:
+            ldap: the wldap.ldap instance to search on
+            base, scope, filt, attr, attronly: as for ldap.search
+            page_size: the number of entries to request per page
+            cookie: the cookie of the last page processed to resume a search,
+                None to start from the beginning
+            binary: True to return values as bytes rather than unicode strings
+            with_dn: True to return (dn, attributes) pairs, or a callable such
+                as wldap.dn.parse to apply to dn
+            timeout_seconds: a fractional number of seconds to wait for each
+                page, block indefinitely if None (default)
+        """
+        self._attr = ldap._make_attrs(attr)
+        self._attronly = attronly
+        self._base = base
+        self._binary = binary
+        self._filt = filt
+        self._ldap = ldap
+        self._msgid = None
+        self._page_size = page_size
+        self._scope = scope
+        self._timeout_seconds = timeout_seconds
+        self._with_dn = with_dn
+        self._msgid = self._request(cookie or b'')
+
+    def __del__(self):
+        try:
+            if hasattr(self, '_msgid'):
+                self.close()
+        except LdapError:  # pragma: no cover
+            pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):  # pragma: no cover
+        return self.next()
+
+    def _parse_cookie(self, message):
+        # Cf. MSDN ldap_parse_page_control documentation: the cookie has to be
+        # freed with ber_bvfree, and the server controls with
+        # ldap_controls_free.
+        return_code = c_ulong()
+        controls = POINTER(LDAPControl.pointer)()
+        dll.ldap_parse_result(self._ldap._l, message._message,
+                              byref(return_code), None, None, None,
+                              byref(controls), 0)
+        try:
+            if return_code.value != LDAP_SUCCESS:
+                raise LdapError(return_code.value)
+
+            # A server ignoring the (critical) control would have failed the
+            # search, but a missing response control still means no more
+            # pages.
+            count, cookie = c_ulong(), LDAP_BERVAL.pointer()
+            code = dll.ldap_parse_page_control(self._ldap._l, controls,
+                                               byref(count), byref(cookie))
+            if code == LDAP_CONTROL_NOT_FOUND:
+                return b''
+            if code != LDAP_SUCCESS:
+                raise LdapError(code)
+            try:
+                return string_at(cookie.contents.bv_val,
+                                 cookie.contents.bv_len)
+            finally:
+                dll.ber_bvfree(cookie)
+        finally:
+            if controls:
+                dll.ldap_controls_free(controls)
+
+    def _request(self, cookie):
+        # The cookie is copied by ldap_create_page_control, so the control is
+        # all we need to keep alive until the request is sent.
+        berval = LDAP_BERVAL.from_value(cookie)
+        control = LDAPControl.pointer()
+        dll.ldap_create_page_control(self._ldap._l, self._page_size,
+                                     byref(berval), 1, byref(control))
+        try:
+            controls = (LDAPControl.pointer * 2)(control)
+            msgid = c_ulong()
+            dll.ldap_search_ext(self._ldap._l, self._base, self._scope,
+                                self._filt, self._attr, self._attronly,
+                                controls, None, 0, 0, byref(msgid))
+        finally:
+            dll.ldap_control_free(control)
+        return msgid.value
+
+    def close(self):
+        """Stop the iteration, abandoning the pending page request if any."""
+        if self._msgid is not None:
+            msgid, self._msgid = self._msgid, None
+            self._ldap.abandon(msgid)
+
+    def next(self):
+        if self._msgid is None:
+            raise StopIteration
+
+        message = self._ldap.result(self._msgid, LDAP_MSG_ALL,
+                                    self._timeout_seconds)
+        if message is None:
+            raise TimeoutError()
+
+        try:
+            self._msgid = None
+            cookie = self._parse_cookie(message)
+
+            # Request the next page before parsing the current one, so that
+            # the network wait overlaps with our processing.
+            if cookie:
+                self._msgid = self._request(cookie)
+            entries = _extract_entries(message, self._binary, self._with_dn)
+        finally:
+            message.release()
+        return SearchPage(entries, cookie)
+
+
+def _escape(value):
+    # Non string parameters (such as numbers) are formatted first.
+    if not isinstance(value, (bytes, type(u''))):
+        value = u'%s' % (value,)
+    return escape(value)
+
+
+class PreparedSearch(object):
+    """A search which base, scope, attributes and filter template are set
+    once, to run repeatedly with different filter parameters.
+
+    The template is a filter string holding str.format replacement fields
+    (such as "(sAMAccountName={0})" or "(&(uid={uid})(mail=*))", literal
+    braces being doubled): parameters are escaped (see wldap.filter.escape)
+    before being substituted, so that they are always taken as assertion
+    values. Fields hold a name or an index only, without conversion, format
+    spec or lookup. The template syntax is verified once, and the attributes
+    array is marshalled once and shared by all the executions.
+    """
+
+    def __init__(self, ldap, base, scope, filt, attr, attronly, binary=False,
+                 with_dn=False, max_buffered=100, timeout_seconds=None):
+        """Construct a new PreparedSearch instance, and verify its filter.
+
+        Args:
+            ldap: the wldap.ldap instance to search on
+            base, scope, attr, attronly: as for ldap.search
+            filt: the search filter template
+            binary, with_dn, max_buffered, timeout_seconds: as for
+                ldap.search_iter, applying to search_iter executions
+        """
+        self._attr = ldap._make_attrs(attr)
+        self._attronly = attronly
+        self._base = base
+        self._binary = binary
+        self._ldap = ldap
+        self._max_buffered = max_buffered
+        self._scope = scope
+        self._template = filt
+        self._timeout_seconds = timeout_seconds
+        self._with_dn = with_dn
+
+        # Parameterless filters are formatted once and for all.
+        positional, named = self._fields(filt)
+        self._filter = None
+        if not positional and not named:
+            self._filter = filt.format()
+        sample = filt.format(*['x'] * positional,
+                             **dict((name, 'x') for name in named))
+        checked = ldap.check_filter(sample)
+        if checked is not True:
+            raise checked
+
+    @staticmethod
+    def _fields(template):
+        # Return the number of positional replacement fields of the template,
+        # and the set of names of its named ones. Conversions, format specs
+        # and attribute or index lookups would apply to the escaped values,
+        # and are rejected.
+        positional, automatic, named = 0, 0, set()
+        for _, field, spec, conversion in Formatter().parse(template):
+            if field is None:
+                continue
+            if spec or conversion or '.' in field or '[' in field:
+                raise ValueError('Invalid replacement field in %r' % template)
+            if field == '':
+                automatic = automatic + 1
+                positional = max(positional, automatic)
+            elif field.isdigit():
+                positional = max(positional, int(field) + 1)
+            else:
+                named.add(field)
+        return positional, named
+
+    def filter(self, *args, **kwargs):
+        """Return the filter for the given parameters, escaped and substituted
+        into the template.
+        """
+        if self._filter is not None and not args and not kwargs:
+            return self._filter
+        if kwargs:
+            kwargs = dict((name, _escape(value))
+                          for name, value in kwargs.items())
+        return self._template.format(*[_escape(value) for value in args],
+                                     **kwargs)
+
+    def search_s(self, *args, **kwargs):
+        """Run the search synchronously, as ldap.search_s.
+
+        Returns a Message object, and raises LdapError on error.
+        """
+        res = LDAPMessage.pointer()
+        dll.ldap_search_s(self._ldap._l, self._base, self._scope,
+                          self.filter(*args, **kwargs), self._attr,
+                          self._attronly, byref(res))
+        return Message(self._ldap._l, res)
+
+    def search(self, *args, **kwargs):
+        """Run the search asynchronously, as ldap.search.
+
+        Returns a Future object, and raises LdapError on error.
+        """
+        return self._ldap._future(dll.ldap_search(
+            self._ldap._l, self._base, self._scope,
+            self.filter(*args, **kwargs), self._attr, self._attronly))
+
+    def search_iter(self, *args, **kwargs):
+        """Run the search asynchronously and iterate over its entries as they
+        are received, as ldap.search_iter.
+
+        Returns a SearchIterator, and raises LdapError on error.
+        """
+        msgid = dll.ldap_search(self._ldap._l, self._base, self._scope,
+                                self.filter(*args, **kwargs), self._attr,
+                                self._attronly)
+        return SearchIterator(self._ldap, msgid, self._binary, self._with_dn,
+                              self._max_buffered, self._timeout_seconds)
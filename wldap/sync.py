@@ -0,0 +1,267 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental synchronization of a local store with the directory, through
+uSNChanged high-water marks (as Active Directory maintains them).
+
+    >>> from wldap.replica import Replica
+    >>> from wldap.sync import SyncEngine
+    >>> engine = SyncEngine(l, Replica('people.db'), 'dc=example,dc=com')
+    >>> engine.subscribe(print)
+    >>> engine.sync()  # A full load the first time, deltas afterwards
+
+The first synchronization loads every entry, and records the server
+highestCommittedUSN read beforehand as the watermark. The following ones only
+search the entries which uSNChanged is above the watermark. Update sequence
+numbers are local to a domain controller: a full load is made again when the
+server (its rootDSE dsServiceName) changes.
+
+Deleted entries don't show up in such searches: they are found by
+reconciliation passes (sync(reconcile=True)), which only search for the DNs
+of the entries.
+"""
+
+from collections import namedtuple
+from itertools import islice
+import logging
+
+from wldap import dn as dns
+from wldap.wldap32_constants import LDAP_SCOPE_BASE, LDAP_SCOPE_SUBTREE
+
+
+_logger = logging.getLogger(__name__)
+
+ADD = 'add'
+MODIFY = 'modify'
+DELETE = 'delete'
+
+# A change applied to the store, as published to the subscribers: `kind` is
+# one of ADD, MODIFY or DELETE, and `attributes` is None for deletions.
+Change = namedtuple('Change', ['kind', 'dn', 'attributes'])
+
+
+def _key(dn):
+    return dns.parse(dn).normalized
+
+
+def _first(attributes, name):
+    # Return the first value of attribute `name` (lower cased), or None.
+    for attribute, values in attributes.items():
+        if attribute.lower() == name and values:
+            return values[0]
+    return None
+
+
+def _usn(attributes, name):
+    value = _first(attributes, name)
+    return int(value) if value is not None else None
+
+
+class DictStore(object):
+    """A store keeping the entries in memory, by normalized DN.
+
+    A store holds entries, and the state of the synchronization (such as its
+    watermark) so that it is persisted along with them. It implements put,
+    delete, dns, get_state, set_state and `in`, and is a context manager
+    delimiting the transactions of the engine. wldap.replica.Replica is a
+    persistent store.
+    """
+
+    def __init__(self):
+        self.entries = {}  # Normalized DN -> (dn, attributes)
+        self.state = {}
+
+    def __contains__(self, dn):
+        return _key(dn) in self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, dn, attributes):
+        self.entries[_key(dn)] = (dn, attributes)
+
+    def delete(self, dn):
+        self.entries.pop(_key(dn), None)
+
+    def dns(self):
+        return [dn for dn, _ in self.entries.values()]
+
+    def get_state(self, name, default=None):
+        return self.state.get(name, default)
+
+    def set_state(self, name, value):
+        self.state[name] = value
+
+
+class SyncEngine(object):
+    """Keeps a store in sync with the entries of a search, pulling only the
+    entries changed since the previous synchronization.
+    """
+
+    def __init__(self, ldap, store, base, scope=LDAP_SCOPE_SUBTREE,
+                 filt=None, attr=['*'], page_size=None, batch=1000):
+        """Construct a new SyncEngine instance.
+
+        Args:
+            ldap: the wldap.ldap session to search with
+            store: the local store, such as a DictStore or a Replica
+            base, scope, attr: as for ldap.search
+            filt: the search filter, all entries if None
+            page_size: the number of entries per page, to search with the
+                paged results control (see ldap.search_paged), or None
+            batch: the number of entries per store transaction
+        """
+        filt = (filt or '(objectClass=*)').strip()
+        if not filt.startswith('('):
+            filt = '(' + filt + ')'
+        self._attr = attr
+        self._base = base
+        self._batch = batch
+        self._filter = filt
+        self._ldap = ldap
+        self._page_size = page_size
+        self._scope = scope
+        self._subscribers = []
+        self.store = store
+
+    @property
+    def watermark(self):
+        """The highest update sequence number synchronized, or None."""
+        return self.store.get_state('watermark')
+
+    def subscribe(self, callback):
+        """Call `callback` with each Change applied to the store, once the
+        transaction holding it is committed. Exceptions raised by callbacks
+        are logged and ignored.
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _publish(self, changes):
+        for change in changes:
+            for callback in list(self._subscribers):
+                try:
+                    callback(change)
+                except Exception:
+                    _logger.exception('exception calling subscriber for %r',
+                                      change)
+
+    def _search(self, filt, attr):
+        if self._page_size is None:
+            return self._ldap.search_iter(self._base, self._scope, filt, attr,
+                                          False, with_dn=True)
+        return (entry for page in self._ldap.search_paged(
+            self._base, self._scope, filt, attr, False, self._page_size,
+            with_dn=True) for entry in page.entries)
+
+    def _root(self):
+        # Return the server name and highest committed USN, as published by
+        # the rootDSE, either being None if not available.
+        entries = list(self._ldap.search_iter(
+            '', LDAP_SCOPE_BASE, '(objectClass=*)',
+            ['dsServiceName', 'highestCommittedUSN'], False))
+        if not entries:
+            return None, None
+        return (_first(entries[0], 'dsservicename'),
+                _usn(entries[0], 'highestcommittedusn'))
+
+    def _apply(self, entries, seen=None):
+        # Store the searched entries one batch per transaction, and return
+        # the number of changes along with the highest uSNChanged seen.
+        count, highest = 0, None
+        entries = iter(entries)
+        while True:
+            batch = list(islice(entries, self._batch))
+            if not batch:
+                return count, highest
+            changes = []
+            with self.store:
+                for dn, attributes in batch:
+                    kind = MODIFY if dn in self.store else ADD
+                    self.store.put(dn, attributes)
+                    changes.append(Change(kind, dn, attributes))
+                    usn = _usn(attributes, 'usnchanged')
+                    if usn is not None and (highest is None or usn > highest):
+                        highest = usn
+            if seen is not None:
+                seen.update(_key(dn) for dn, _ in batch)
+            self._publish(changes)
+            count = count + len(changes)
+
+    def _reconcile(self, seen):
+        # Delete the stored entries which DN isn't in `seen`.
+        changes = [Change(DELETE, dn, None) for dn in self.store.dns()
+                   if _key(dn) not in seen]
+        for start in range(0, len(changes), self._batch):
+            chunk = changes[start:start + self._batch]
+            with self.store:
+                for change in chunk:
+                    self.store.delete(change.dn)
+            self._publish(chunk)
+        return len(changes)
+
+    def sync(self, reconcile=False):
+        """Synchronize the store: load every entry the first time, then only
+        the entries changed since the previous synchronization.
+
+        Args:
+            reconcile: True to also delete from the store the entries which
+                are no longer found in the directory (always done by full
+                loads)
+
+        Returns the number of changes applied, and raises LdapError on error.
+        """
+        server, highest = self._root()
+        watermark = self.watermark
+        # USNs are local to a server: a watermark from another one is
+        # meaningless, but an unknown server name is no evidence of a change.
+        stored = self.store.get_state('server')
+        full = watermark is None or (server is not None and
+                                     stored is not None and server != stored)
+
+        seen = set()
+        if full:
+            count, usn = self._apply(self._search(self._filter, self._attr),
+                                     seen)
+        else:
+            count, usn = self._apply(self._search(
+                '(&%s(uSNChanged>=%d))' % (self._filter, watermark + 1),
+                self._attr))
+            if reconcile:
+                seen = set(_key(dn) for dn, _ in self._search(self._filter,
+                                                              ['1.1']))
+        if full or reconcile:
+            count = count + self._reconcile(seen)
+
+        # The highest committed USN is read before searching: changes made
+        # during the search are pulled again next time, which is harmless as
+        # stores replace entries.
+        if highest is None:
+            known = [value for value in (usn, watermark) if value is not None]
+            highest = max(known) if known else None
+        with self.store:
+            if highest is not None:
+                self.store.set_state('watermark', highest)
+            if server is not None:
+                self.store.set_state('server', server)
+        return count
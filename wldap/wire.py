@@ -0,0 +1,133 @@
+# Copyright 2013 Arnaud Porterie
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import select
+import socket
+import threading
+
+from wldap import protocol
+from wldap.backend import Backend, BackendError, Session
+from wldap.wldap32_constants import LDAP_DECODING_ERROR, LDAP_SERVER_DOWN
+
+
+_RECV_SIZE = 65536
+
+
+def _parse_host(host, port):
+    # As Wldap32, accept a space separated list of hosts (of which only the
+    # first one is used here), each optionally followed by a port number.
+    if not host:
+        return 'localhost', port
+    host = host.split()[0]
+    if '://' in host:
+        host = host.split('://', 1)[1].rstrip('/')
+    if host.startswith('['):  # IPv6 literal
+        address, _, rest = host[1:].partition(']')
+        return address, int(rest[1:]) if rest.startswith(':') else port
+    if host.count(':') == 1:
+        host, port = host.split(':')
+        port = int(port)
+    return host, port
+
+
+class WireBackend(Backend):
+    """Pure Python implementation of the Wldap32 functions, speaking LDAPv3
+    over a plain TCP connection. This allows using wldap where Wldap32.dll is
+    not available:
+
+    >>> from wldap import wldap32_dll
+    >>> from wldap.wire import WireBackend
+    >>> wldap32_dll.use_backend(WireBackend())
+
+    Only simple binds are supported, and SSL is not.
+    As with Wldap32, the connection is established by ldap_connect or by the
+    first request of the session.
+    """
+
+    def _open(self, host, port):
+        session = Session(*_parse_host(host, port))
+        session.buffer = bytearray()
+        session.socket = None
+        session.socket_lock = threading.RLock()
+        return session
+
+    def _connect(self, session, timeout):
+        with session.socket_lock:
+            if session.socket is not None:
+                return
+            try:
+                sock = socket.create_connection((session.host, session.port),
+                                                timeout)
+            except socket.error:
+                raise BackendError(LDAP_SERVER_DOWN)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session.socket = sock
+
+    def _write(self, session, msgid, op, controls=None):
+        data = protocol.encode_message(msgid, op, controls)
+        with session.socket_lock:
+            self._connect(session, None)
+            try:
+                session.socket.sendall(data)
+            except socket.error:
+                raise BackendError(LDAP_SERVER_DOWN)
+
+    def _read(self, session, timeout):
+        self._connect(session, None)
+        try:
+            ready = select.select([session.socket], [], [], timeout)[0]
+            data = ready and session.socket.recv(_RECV_SIZE)
+        except (select.error, socket.error, ValueError):
+            raise BackendError(LDAP_SERVER_DOWN)
+        if not ready:
+            return []
+        if not data:
+            raise BackendError(LDAP_SERVER_DOWN)
+
+        # Decode every complete message, leaving an incomplete trailing one
+        # in the buffer until more data is received.
+        buf = session.buffer
+        buf.extend(data)
+        messages = []
+        offset = 0
+        try:
+            while True:
+                message, offset = protocol.decode_message(buf, offset)
+                if message is None:
+                    break
+                messages.append(message)
+        except ValueError:
+            raise BackendError(LDAP_DECODING_ERROR)
+        del buf[:offset]
+        return messages
+
+    def _close(self, session):
+        with session.socket_lock:
+            if session.socket is None:
+                return
+            try:
+                if session.error is None:
+                    self._write(session, self._next_msgid(session),
+                                protocol.UnbindRequest())
+            except BackendError:
+                pass
+            finally:
+                session.socket.close()
+                session.socket = None
+                session.error = LDAP_SERVER_DOWN
+
+    def _descriptor(self, session):
+        self._connect(session, None)
+        return session.socket.fileno()
@@ -22,6 +22,26 @@ LDAP_SCOPE_SUBTREE              = 0x02
 
 ###############################################################################
 
+LDAP_MSG_ONE                    = 0x00
+LDAP_MSG_ALL                    = 0x01
+LDAP_MSG_RECEIVED               = 0x02
+
+###############################################################################
+
+LDAP_RES_ANY                    = -1
+LDAP_RES_BIND                   = 0x61
+LDAP_RES_SEARCH_ENTRY           = 0x64
+LDAP_RES_SEARCH_RESULT          = 0x65
+LDAP_RES_MODIFY                 = 0x67
+LDAP_RES_ADD                    = 0x69
+LDAP_RES_DELETE                 = 0x6b
+LDAP_RES_MODRDN                 = 0x6d
+LDAP_RES_COMPARE                = 0x6f
+LDAP_RES_SEARCH_REFERENCE       = 0x73
+LDAP_RES_EXTENDED               = 0x78
+
+###############################################################################
+
 LDAP_AUTH_SIMPLE                = 0x80
 LDAP_AUTH_SASL                  = 0x83
 LDAP_AUTH_OTHERKIND             = 0x86
@@ -86,6 +106,9 @@ LDAP_OPT_TCP_KEEPALIVE          = 0x40
 LDAP_OPT_THREAD_FN_PTRS         = 0x05
 LDAP_OPT_TIMELIMIT              = 0x04
 
+LDAP_OPT_OFF                    = 0x00
+LDAP_OPT_ON                     = 0x01
+
 ###############################################################################
 
 LDAP_ADMIN_LIMIT_EXCEEDED       = 0x0b
@@ -12,12 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ctypes import POINTER, cdll, c_int, c_void_p, c_ulong, c_wchar_p
+from ctypes import POINTER, cdll, c_int, c_ubyte, c_void_p, c_ulong
+from ctypes import c_wchar, c_wchar_p
 
 from wldap.exceptions import LdapError
 from wldap.wldap32_constants import ReturnCodes
 from wldap.wldap32_structures import BerElement, LDAP_BERVAL, LDAP_TIMEVAL
-from wldap.wldap32_structures import LDAP, LDAPMessage, LDAPMod
+from wldap.wldap32_structures import LDAP, LDAPControl, LDAPMessage, LDAPMod
 
 
 # Extract from Winldap.h:
@@ -39,7 +40,12 @@ from wldap.wldap32_structures import LDAP, LDAPMessage, LDAPMod
 # In Python 2, it is simply to much pain to support both str an unicode in the
 # same module, so we just take a radical decision and go for full unicode.
 
-dll = cdll.Wldap32
+try:
+    dll = cdll.Wldap32
+except OSError:
+    # Not on Windows: a pure Python implementation, such as wldap.wire, must
+    # be installed through use_backend before any call.
+    dll = None
 
 
 def errcheck_compare(result, func, arguments):
@@ -60,8 +66,12 @@ def errcheck_pointer(result, func, arguments):
     """Error checking strategy for functions returning a pointer.
 
     Raise an LdapError if the returned pointer is NULL and LdapGetLastError()
-    is not LDAP_SUCCESS (the `ldap_next_*` family returns NULL pointer when the
-    iterator is exhausted, and it shouldn't raise an LdapError).
+    is not LDAP_SUCCESS.
+
+    Remark: the `ldap_next_*` family returns a NULL pointer when the iterator
+    is exhausted, which happens once per entry and per message: these do not
+    use errcheck_pointer, so that the end of an iteration doesn't cost an
+    extra LdapGetLastError call.
     """
     if not result:  # c_void_p has __nonzero__
         code = LdapGetLastError()
@@ -115,6 +125,17 @@ exposed_functions = [
         None
     ],
 
+    # VOID ber_bvfree(
+    #   _In_  BERVAL *bv
+    # );
+    [
+        'ber_bvfree',
+        'ber_bvfree',
+        None,
+        [LDAP_BERVAL.pointer],
+        None
+    ],
+
     # ULONG ldap_add_s(
     #   _In_  LDAP *ld,
     #   _In_  PCHAR dn,
@@ -244,6 +265,28 @@ exposed_functions = [
         errcheck_retcode
     ],
 
+    # ULONG ldap_control_free(
+    #   _In_  LDAPControl *Control
+    # );
+    [
+        'ldap_control_free',
+        'ldap_control_freeW',
+        c_ulong,
+        [LDAPControl.pointer],
+        errcheck_retcode
+    ],
+
+    # ULONG ldap_controls_free(
+    #   _In_  LDAPControl **Controls
+    # );
+    [
+        'ldap_controls_free',
+        'ldap_controls_freeW',
+        c_ulong,
+        [POINTER(LDAPControl.pointer)],
+        errcheck_retcode
+    ],
+
     # ULONG ldap_count_entries(
     #   _In_  LDAP *ld,
     #   _In_  LDAPMessage *res
@@ -269,6 +312,22 @@ exposed_functions = [
         errcheck_pointer
     ],
 
+    # ULONG ldap_create_page_control(
+    #   _In_   PLDAP ExternalHandle,
+    #   _In_   ULONG PageSize,
+    #   _In_   struct berval *Cookie,
+    #   _In_   UCHAR IsCritical,
+    #   _Out_  PLDAPControl *Control
+    # );
+    [
+        'ldap_create_page_control',
+        'ldap_create_page_controlW',
+        c_ulong,
+        [LDAP.pointer, c_ulong, LDAP_BERVAL.pointer, c_ubyte,
+         POINTER(LDAPControl.pointer)],
+        errcheck_retcode
+    ],
+
     # ULONG ldap_delete_s(
     #   _In_  LDAP *ld,
     #   _In_  PCHAR dn
@@ -316,6 +375,18 @@ exposed_functions = [
         errcheck_pointer
     ],
 
+    # PCHAR ldap_get_dn(
+    #   __in  LDAP *ld,
+    #   __in  LDAPMessage *entry
+    # );
+    [
+        'ldap_get_dn',
+        'ldap_get_dnW',
+        POINTER(c_wchar),  # Not c_wchar_p: must be released by ldap_memfree
+        [LDAP.pointer, LDAPMessage.pointer],
+        errcheck_pointer
+    ],
+
     # ULONG ldap_get_option(
     #   __in   LDAP *ld,
     #   __in   int option,
@@ -415,6 +486,28 @@ exposed_functions = [
         None  # Always returns LDAP_SUCCESS
     ],
 
+    # ULONG ldap_msgid(
+    #   _In_  LDAPMessage *res
+    # );
+    [
+        'ldap_msgid',
+        'ldap_msgid',
+        c_ulong,
+        [LDAPMessage.pointer],
+        None  # Returns the message ID, or -1 on failure
+    ],
+
+    # ULONG ldap_msgtype(
+    #   _In_  LDAPMessage *res
+    # );
+    [
+        'ldap_msgtype',
+        'ldap_msgtype',
+        c_ulong,
+        [LDAPMessage.pointer],
+        None  # Returns the message type, or LDAP_RES_ANY on failure
+    ],
+
     # PCHAR ldap_next_attribute(
     #   __in     LDAP *ld,
     #   __in     LDAPMessage *entry,
@@ -425,7 +518,7 @@ exposed_functions = [
         'ldap_next_attributeW',
         c_wchar_p,
         [LDAP.pointer, LDAPMessage.pointer, BerElement.pointer],
-        errcheck_pointer
+        None  # NULL marks the end of the iteration
     ],
 
     # LDAPMessage* ldap_next_entry(
@@ -437,7 +530,41 @@ exposed_functions = [
         'ldap_next_entry',
         LDAPMessage.pointer,
         [LDAP.pointer, LDAPMessage.pointer],
-        errcheck_pointer
+        None  # NULL marks the end of the iteration
+    ],
+
+    # ULONG ldap_parse_page_control(
+    #   _In_   PLDAP ExternalHandle,
+    #   _In_   PLDAPControl *ServerControls,
+    #   _Out_  ULONG *TotalCount,
+    #   _Out_  struct berval **Cookie
+    # );
+    [
+        'ldap_parse_page_control',
+        'ldap_parse_page_controlW',
+        c_ulong,
+        [LDAP.pointer, POINTER(LDAPControl.pointer), POINTER(c_ulong),
+         POINTER(LDAP_BERVAL.pointer)],
+        None  # Returns LDAP_CONTROL_NOT_FOUND when there is no page control
+    ],
+
+    # ULONG ldap_parse_result(
+    #   _In_   LDAP *Connection,
+    #   _In_   LDAPMessage *ResultMessage,
+    #   _Out_  ULONG *ReturnCode,
+    #   _Out_  PTSTR *MatchedDNs,
+    #   _Out_  PTSTR *ErrorMessage,
+    #   _Out_  PTSTR **Referrals,
+    #   _Out_  PLDAPControl **ServerControls,
+    #   _In_   BOOLEAN Freeit
+    # );
+    [
+        'ldap_parse_result',
+        'ldap_parse_resultW',
+        c_ulong,
+        [LDAP.pointer, LDAPMessage.pointer, POINTER(c_ulong), c_void_p,
+         c_void_p, c_void_p, POINTER(POINTER(LDAPControl.pointer)), c_ubyte],
+        errcheck_retcode
     ],
 
     # ULONG ldap_result(
@@ -456,6 +583,42 @@ exposed_functions = [
         errcheck_sentinel
     ],
 
+    # ULONG ldap_result2error(
+    #   _In_  LDAP *ld,
+    #   _In_  LDAPMessage *res,
+    #   _In_  ULONG freeit
+    # );
+    [
+        'ldap_result2error',
+        'ldap_result2error',
+        c_ulong,
+        [LDAP.pointer, LDAPMessage.pointer, c_ulong],
+        None  # Returns the error code of the result message
+    ],
+
+    # ULONG ldap_search_ext(
+    #   _In_   LDAP *ld,
+    #   _In_   PCHAR base,
+    #   _In_   ULONG scope,
+    #   _In_   PCHAR filter,
+    #   _In_   PCHAR attrs[],
+    #   _In_   ULONG attrsonly,
+    #   _In_   PLDAPControl *ServerControls,
+    #   _In_   PLDAPControl *ClientControls,
+    #   _In_   ULONG TimeLimit,
+    #   _In_   ULONG SizeLimit,
+    #   _Out_  ULONG *MessageNumber
+    # );
+    [
+        'ldap_search_ext',
+        'ldap_search_extW',
+        c_ulong,
+        [LDAP.pointer, c_wchar_p, c_ulong, c_wchar_p, POINTER(c_wchar_p),
+         c_ulong, POINTER(LDAPControl.pointer), POINTER(LDAPControl.pointer),
+         c_ulong, c_ulong, POINTER(c_ulong)],
+        errcheck_retcode
+    ],
+
     # ULONG ldap_search_s(
     #   __in   LDAP *ld,
     #   __in   PCHAR base,
@@ -585,6 +748,33 @@ exposed_functions = [
 ]
 
 
+def _missing(exported_name):
+    def _unavailable(*args):
+        raise NotImplementedError('%s is not provided by the backend' %
+                                  exported_name)
+    return _unavailable
+
+
+def use_backend(backend):
+    """Bind the module level functions to the functions of `backend`.
+
+    This is the supported hook to swap the Wldap32 library for another
+    implementation, such as a mock object in tests: `backend` must expose the
+    underlying functions by their Wldap32 name (e.g. ldap_searchW). Functions
+    it lacks raise NotImplementedError when called.
+
+    Returns the previously used backend.
+    """
+    global dll
+    previous, dll = dll, backend
+    for fn_data in _function_templates:
+        fn = getattr(backend, fn_data.api_name, None)
+        if fn is None:
+            fn = _missing(fn_data.exported_name)
+        globals()[fn_data.exported_name] = fn
+    return previous
+
+
 def initialize():
     from collections import namedtuple
     FunctionTemplate = namedtuple(
@@ -592,8 +782,12 @@ def initialize():
         ['exported_name', 'api_name', 'restype', 'argtypes', 'errcheck']
     )
 
+    templates = []
     for exposed_function in exposed_functions:
         fn_data = FunctionTemplate(*exposed_function)
+        templates.append(fn_data)
+        if dll is None:
+            continue
 
         # Retrieve Wldap32.dll exposed function and register its signature for
         # the ctypes module.
@@ -603,14 +797,12 @@ def initialize():
         if fn_data.errcheck is not None:
             fn_ldap.errcheck = fn_data.errcheck
 
-        # Define a new module level function which forwards to the underlying
-        # call. We go through getattr rather than directly referencing fn_data
-        # in the function body to allow mocking the dll object in the tests.
-        def _api_caller(fn_data=fn_data):
-            def _wrapped(*args, **kwargs):
-                return getattr(dll, fn_data.api_name)(*args, **kwargs)
-            return _wrapped
-        globals()[fn_data.exported_name] = _api_caller()
+    # The module level functions are the ctypes functions themselves: calling
+    # through a forwarding wrapper would cost an extra Python call and a
+    # getattr for each API call. Swapping the library goes through
+    # use_backend instead.
+    globals()['_function_templates'] = templates
+    use_backend(dll)
 
 
 initialize()
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from ctypes import POINTER, Structure, Union, cast
-from ctypes import c_char, c_long, c_ulong, c_wchar_p
+from ctypes import c_char, c_long, c_ubyte, c_ulong, c_wchar_p
 
 
 class BerElement(Structure):
@@ -44,15 +44,54 @@ class LDAP_BERVAL(Structure):
 
     @staticmethod
     def from_value(value):
-        # This function must be called with either an str object (in 2.x) or a
-        # bytes object (in 3.x), but not with a string: if it happens to be a
-        # unicode string, then the length won't match the byte length.
-        return LDAP_BERVAL(len(value), cast(value, POINTER(c_char)))
+        """Construct an LDAP_BERVAL pointing to the memory of `value`, which
+        must be kept alive (and not resized) as long as the structure is used:
+        the structure holds a reference to it for that purpose.
+
+        Args:
+            value: a bytes object (str in 2.x) or any contiguous object
+                supporting the buffer protocol (bytearray, memoryview, mmap,
+                array.array, ...). It must not be a unicode string, as its
+                length wouldn't match the byte length.
+
+        Values are never copied, except for read-only buffers other than bytes
+        objects, which ctypes cannot point into. Raises ValueError for
+        non-contiguous buffers.
+        """
+        if isinstance(value, bytes):
+            berval = LDAP_BERVAL(len(value), cast(value, POINTER(c_char)))
+            berval._value = value  # Casting a bytes object doesn't keep it
+            return berval
+
+        view = memoryview(value)
+        if not getattr(view, 'contiguous', True):
+            raise ValueError('Buffer values must be contiguous')
+        size = getattr(view, 'nbytes', len(view) * view.itemsize)
+        if view.readonly:
+            obj = getattr(view, 'obj', None)  # Not available in 2.x
+            if isinstance(obj, bytes) and len(obj) == size:
+                return LDAP_BERVAL.from_value(obj)
+            data = (c_char * size).from_buffer_copy(view)
+        else:
+            # The array keeps a reference to the exporting object.
+            data = (c_char * size).from_buffer(view)
+        return LDAP_BERVAL(size, cast(data, POINTER(c_char)))
 
 # Nested 'typedef' for pointer type
 LDAP_BERVAL.pointer = POINTER(LDAP_BERVAL)
 
 
+class LDAPControl(Structure):
+    _fields_ = [
+        ('ldctl_oid', c_wchar_p),
+        ('ldctl_value', LDAP_BERVAL),
+        ('ldctl_iscritical', c_ubyte),  # BOOLEAN
+    ]
+
+# Nested 'typedef' for pointer type
+LDAPControl.pointer = POINTER(LDAPControl)
+
+
 class LDAP_TIMEVAL(Structure):
     _fields_ = [
         ('tv_sec', c_long),
@@ -61,9 +100,16 @@ class LDAP_TIMEVAL(Structure):
 
     @staticmethod
     def from_fractional_seconds(fractional_seconds):
+        timeval = LDAP_TIMEVAL()
+        timeval.set_fractional_seconds(fractional_seconds)
+        return timeval
+
+    def set_fractional_seconds(self, fractional_seconds):
+        # Allows reusing a preallocated structure across calls.
         from math import modf
         frac, secs = modf(fractional_seconds)
-        return LDAP_TIMEVAL(int(secs), int(frac * 10e5))
+        self.tv_sec = int(secs)
+        self.tv_usec = int(frac * 10e5)
 
 # Nested 'typedef' for pointer type
 LDAP_TIMEVAL.pointer = POINTER(LDAP_TIMEVAL)
@@ -120,20 +166,19 @@ class LDAPMod(Structure):
             self._fill_bin_values(bin_values)
 
     def _fill_bin_values(self, bin_values):
-        # Store the LDAP_BERVAL values to prevent Python from collecting them.
+        # Store the LDAP_BERVAL values to prevent Python from collecting them
+        # (and, as they point into the provided buffers, those buffers too).
         self._values = [LDAP_BERVAL.from_value(v) for v in bin_values]
 
-        # Create a nul-terminated array of structure addresses.
-        p_array = [LDAP_BERVAL.pointer(v) for v in self._values]
-        p_array.append(LDAP_BERVAL.pointer())
-
-        # Convert to a LDAP_BERVAL** and store for good.
-        p_array = (LDAP_BERVAL.pointer * len(p_array))(*p_array)
+        # Create a nul-terminated LDAP_BERVAL* array (the extra trailing
+        # element is left zeroed), and store it for good.
+        p_array = (LDAP_BERVAL.pointer * (len(self._values) + 1))(
+            *[LDAP_BERVAL.pointer(v) for v in self._values])
         self.mod_vals.modv_bvals = p_array
 
     def _fill_str_values(self, str_values):
-        values = str_values + [None]
-        values = (c_wchar_p * len(values))(*values)
+        # The extra trailing element is left zeroed as the nul terminator.
+        values = (c_wchar_p * (len(str_values) + 1))(*str_values)
         self.mod_vals.modv_strvals = values
 
 